@@ -23,6 +23,23 @@ import matplotlib.pyplot as plt
 from scipy import ndimage
 import cv2
 import itertools
+import ast
+import re
+import matplotlib.patches as patches
+
+from utils.ocr_cache import OCRCache
+from data.processing.token_store import TokenStore, ZONE_COLUMNS
+from data.processing.geometry import Boxes, iou_matrix
+from data.processing.spatial_index import GridIndex
+from data.processing.masks import rasterize_boxes, save_mask
+from data.processing.images import letterbox, fit_long_side, read_rgb
+from data.processing.vocabulary import Vocabulary, csv_receipts
+from data.processing.grids import token_cells, place_tokens
+from concurrent.futures import ThreadPoolExecutor
+
+
+#the persistent cache of the google vision annotations, shared by every stage
+OCR_CACHE_PATH = '/home/meteor21/CUTIE_mekene/data/ocr_cache.db'
 
 
 
@@ -30,127 +47,226 @@ import itertools
 def get_vertices_list(vertices):
     '''
     This function aims to return the vertices of bbox in form of a list
+    input:
+        vertices: the (4, 2) vertices of the bbox, as stored in an Annotation
+    return:
+        [x0, y0, x1, y1, x2, y2, x3, y3]
     '''
     vertex_list = []
     for l in vertices:
-        #print(l.x,l.y)
-        vertex_list.append(l.x)
-        vertex_list.append(l.y)
+        #print(l[0],l[1])
+        vertex_list.append(int(l[0]))
+        vertex_list.append(int(l[1]))
     return vertex_list
 
 
-def get_json_files(list_of_paths):
+def get_annotation_boxes(vertices):
     '''
-    This function returns the json files associated to each receipt image.
-    Each json file contains all the annotation infos about the receipt,
-    including: descrition, languages, vertices of bbox of each word on the receipt.
+    This function returns the bbox of every word of an annotation, computed at once on the vertices array
+    input:
+        vertices: the (n, 4, 2) vertices of an Annotation, in the order upper left, upper right, lower right, lower left
+    return:
+        the (n, 4) int32 array of [x1, y1, x2, y2]
+    '''
+    vertices = np.asarray(vertices, dtype=np.int32).reshape(-1, 4, 2)
+
+    boxes = np.empty((len(vertices), 4), dtype=np.int32)
+    boxes[:, 0] = np.minimum(vertices[:, 0, 0], vertices[:, 3, 0]) #the smallest x on the left side
+    boxes[:, 1] = np.minimum(vertices[:, 0, 1], vertices[:, 1, 1]) #the smallest y on the upper side
+    boxes[:, 2] = np.maximum(vertices[:, 1, 0], vertices[:, 2, 0]) #the biggest x on the right side
+    boxes[:, 3] = np.maximum(vertices[:, 2, 1], vertices[:, 3, 1]) #the biggest y on the bottom side
+
+    return boxes
+
+
+
+def extract_annotations(list_of_paths, cache=None,
+                        json_dir='/home/meteor21/CUTIE_mekene/data/json_files',
+                        csv_dir='/home/meteor21/CUTIE_mekene/data/csv_files',
+                        boxes_file=None, store=None):
+    '''
+    This function walks the annotation of each receipt image once and emits every artifact from that single pass:
+    the json file (obj{i} format), the csv file (imageName, labels, X1, Y1, X2, Y2, image_width, image_height, bbox)
+    and the bbox array of the words.
     
     input:
         list_of_paths: list, all the receipt images paths have been listed 
+        cache: the OCRCache holding the annotations, the one at OCR_CACHE_PATH if None
+        json_dir: the directory of the json files, None to skip them
+        csv_dir: the directory of the csv files, None to skip them
+        boxes_file: the npz file storing the bbox array of each receipt under its name, None to skip it
+        store: the TokenStore the words of each new receipt are appended to, None to skip it
     return:
-        None: for each file in list_of_paths, the json file is saved on disk
+        boxes: dict, the name of each receipt ('1107_receipt') and the (n, 4) bbox array of its words
     '''
 
-    for j, file in tqdm(enumerate(list_of_paths)): #iterate over each file path in the list
+    cache = OCRCache(OCR_CACHE_PATH) if cache is None else cache
+    boxes = {}
 
-        thejson = get_document_bounds(file) #the annotation text containing all infos of the image 
-        filename = list_of_paths[j].split('/')[-1].split('.')[0].replace('-','_') # get the name '1107_receipt'
+    #iterate over each file path in the list, only the images missing from the cache are sent to google vision
+    for file, thejson in tqdm(cache.get(list_of_paths), total=len(list_of_paths)):
+        if thejson is None: #google vision failed on this image, it is left out until the next run
+            continue
 
-        dico = {} #empty dico
-        for i in range(len(thejson)): #iterate over the length of 'thejson' 
+        filename = file.split('/')[-1].split('.')[0].replace('-','_') # get the name '1107_receipt'
+        vertices = np.asarray(thejson.vertices, dtype=np.int32).reshape(-1, 4, 2)
+        width, height = thejson.image_size  #the dimensions, cached with the annotation
 
-            #create a relative dico containing two objects, in the form as example:
-            #{'description':'REI', 'labels':[x: 760 y: 2374, x: 891 y: 2371, x: 892 y: 2424, x: 761 y: 2427]}
-            peti_dico = {'description': thejson[i].description, 'labels': get_vertices_list(thejson[i].bounding_poly.vertices)}
-            petite_list = [peti_dico] #store it into a list
-            dico[f'obj{i}'] = petite_list #append to 'dico' by adding an object key and value at each iteration        
-            
-            #save the json file on disk
-            with open(f'/home/meteor21/CUTIE_mekene/data/json_files/{filename}.json', 'w') as fp: 
+        if json_dir is not None:
+            #{'obj0': [{'description':'REI', 'labels':[760, 2374, 891, 2371, 892, 2424, 761, 2427]}], ...}
+            labels = vertices.reshape(-1, 8).tolist()
+            dico = {f'obj{i}': [{'description': description, 'labels': labels[i]}]
+                    for i, description in enumerate(thejson.descriptions)}
+            with open(f'{json_dir}/{filename}.json', 'w') as fp: 
                 json.dump(dico, fp)
 
+        #the first element of 'thejson' is the whole text, the words start at the second one
+        bbox = get_annotation_boxes(vertices[1:])
+        boxes[filename] = bbox
+
+        if csv_dir is not None:
+            df = pd.DataFrame({'imageName': [filename] * len(bbox),
+                               'labels': thejson.descriptions[1:],
+                               'X1': bbox[:, 0],
+                               'Y1': bbox[:, 1],
+                               'X2': bbox[:, 2],
+                               'Y2': bbox[:, 3],
+                               'image_width': width,
+                               'image_height': height,
+                               'bbox': bbox.tolist()})
+            df.to_csv(f'{csv_dir}/{filename}.csv', index = False)
+
+        if store is not None and filename not in store:
+            store.append(filename,
+                         text=thejson.descriptions[1:],
+                         x1=bbox[:, 0], y1=bbox[:, 1], x2=bbox[:, 2], y2=bbox[:, 3],
+                         image_width=np.full(len(bbox), width), image_height=np.full(len(bbox), height))
+
+    if boxes_file is not None:
+        np.savez(boxes_file, **boxes)
+
+    return boxes
+
+
+
+def get_json_files(list_of_paths, cache=None):
+    '''
+    This function returns the json files associated to each receipt image.
+    Each json file contains all the annotation infos about the receipt,
+    including: descrition, languages, vertices of bbox of each word on the receipt.
+    Use extract_annotations directly to get the csv files from the same pass.
+    
+    input:
+        list_of_paths: list, all the receipt images paths have been listed 
+        cache: the OCRCache holding the annotations, the one at OCR_CACHE_PATH if None
+    return:
+        None: for each file in list_of_paths, the json file is saved on disk
+    '''
+
+    extract_annotations(list_of_paths, cache, csv_dir=None)
+
     return
         
 
 
-def get_csv_files(list_of_paths):
+def get_csv_files(list_of_paths, cache=None):
     '''
     This function returns the csv files associated to each receipt image.
     Each csv file contains all the annotation infos about the receipt,
     including: imagename, label, vertices of bbox of each word on the receipt, imagesize.
+    Use extract_annotations directly to get the json files from the same pass.
     
     input:
         list_of_paths: list, all the receipt images paths have been listed 
+        cache: the OCRCache holding the annotations, the one at OCR_CACHE_PATH if None
     return:
         None: for each file in list_of_paths, the csv file is saved on disk
     '''
 
-    for j, file in tqdm(enumerate(list_of_paths)): #iterate over each file path in the list
-
-        thejson = get_document_bounds(file) #the annotation text containing all infos of the image(from google vision) 
-        
-        
-        
-        filename = list_of_paths[j].split('/')[-1].split('.')[0].replace('-','_') # get the name '1107_receipt'
-        
-        filename_list = [] #create an empty list
-        label_list = [] #create an empty list
-        image_height_list = [] #create an empty list
-        image_width_list = [] #create an empty list
-        X1_list = []  #create an empty list
-        Y1_list = []  #create an empty list
-        X2_list = []  #create an empty list
-        Y2_list = []  #create an empty list
-        listedebbox = [] #create an empty list
-        
-        
-        image = PIL.Image.open(file)  #read coresponding images
-        width, height = image.size  #store the dimensions
-        
-        
-        n = len(thejson) #length of the 'thejson' return by google vision
-        
-        for i in range(1,n): #iteration starting from second element of 'thejson' as the first one is the whole text
-            
-            filename_list.append(filename) #append the filename in the preferred format
-            
-            label_list.append(thejson[i].description) #append the description
+    extract_annotations(list_of_paths, cache, json_dir=None)
 
-            image_height_list.append(image.size[1]) #append image height
-            image_width_list.append(image.size[0]) #append image width
-            
-            #compare both x on the left side and append the smallest
-            X1_list.append(min(thejson[i].bounding_poly.vertices[0].x, thejson[i].bounding_poly.vertices[3].x))
-            #compare both y on the upper side and append the smallest
-            Y1_list.append(min(thejson[i].bounding_poly.vertices[0].y, thejson[i].bounding_poly.vertices[1].y))
-            #compare both x on the right side and append the biggest
-            X2_list.append(max(thejson[i].bounding_poly.vertices[1].x, thejson[i].bounding_poly.vertices[2].x))
-            #compare both y on the bottom side and append the biggest
-            Y2_list.append(max(thejson[i].bounding_poly.vertices[2].y, thejson[i].bounding_poly.vertices[3].y))
-            
-            listedebbox.append([min(thejson[i].bounding_poly.vertices[0].x, thejson[i].bounding_poly.vertices[3].x),
-                               min(thejson[i].bounding_poly.vertices[0].y, thejson[i].bounding_poly.vertices[1].y),
-                               max(thejson[i].bounding_poly.vertices[1].x, thejson[i].bounding_poly.vertices[2].x),
-                               max(thejson[i].bounding_poly.vertices[2].y, thejson[i].bounding_poly.vertices[3].y)])
-            
-            
-        #create a pandas dataframe    
-        df = pd.DataFrame(list(zip(filename_list, label_list, X1_list, Y1_list, X2_list, Y2_list, image_width_list, image_height_list,listedebbox)), 
-                       columns =['imageName', 'labels', 'X1', 'Y1', 'X2', 'Y2', 'image_width', 'image_height', 'bbox']) 
-        #save each data to a csv file on disk
-        df.to_csv(f'/home/meteor21/CUTIE_mekene/data/csv_files/{filename}.csv', index = False)
-        
     return 
         
 
 
 
+def parse_vgg_regions(thecsv_file):
+    '''
+    This function decodes every region of a vgg annotator export at once.
+    All the 'region_shape_attributes' cells are decoded by a single json call, and the bboxes are built as numpy columns.
+    Rectangles give [x, y, x+width, y+height], polygons the bbox of their points, images without region are dropped.
+
+    Input:
+        thecsv_file: the whole csv file containing the annotation done by vgg
+
+    Output:
+        names: the receipt name of each region ('1107_receipt')
+        boxes: the (n, 4) int32 array of the [x1, y1, x2, y2] of each region
+    '''
+
+    vgg = pd.read_csv(thecsv_file, usecols=['filename', 'region_shape_attributes'])  #read the interested columns
+    names = vgg['filename'].str.replace('.jpg', '', regex=False).str.replace('-', '_', regex=False).values.astype(str)
+
+    regions = json.loads('[' + ','.join(vgg['region_shape_attributes'].tolist()) + ']') #decode every cell at once
+
+    boxes = np.zeros((len(regions), 4), dtype=np.int32)
+    keep = np.ones(len(regions), dtype=bool)
+
+    is_rect = np.array([r.get('name') == 'rect' for r in regions], dtype=bool)
+    xywh = np.array([(r['x'], r['y'], r['width'], r['height']) for r, rect in zip(regions, is_rect) if rect],
+                    dtype=np.float64).reshape(-1, 4).astype(np.int32)
+    boxes[is_rect, 0:2] = xywh[:, 0:2]
+    boxes[is_rect, 2:4] = xywh[:, 0:2] + xywh[:, 2:4]
+
+    for i in np.flatnonzero(~is_rect): #the few polygons and the images without region
+        if 'all_points_x' in regions[i]:
+            points_x, points_y = regions[i]['all_points_x'], regions[i]['all_points_y']
+            boxes[i] = [min(points_x), min(points_y), max(points_x), max(points_y)]
+        else:
+            keep[i] = False
+
+    return names[keep], boxes[keep]
+
+
+
+def vgg_zones(thecsv_file, zones_path='/home/meteor21/CUTIE_mekene/data/zones'):
+    '''
+    We have used vgg annotator to manualy draw bboxes on the receipt,
+    This was done in order to use IoU to keep the zones of interest. 
+    This function aims to group the zones of interest by receipt, all of them being kept when a receipt has several,
+    and to save them into one indexed file.
+
+    Input:
+        thecsv_file: the whole csv file containing the annotation done by vgg
+        zones_path: the directory of the zones store, None to not save it
+
+    Output:
+        the TokenStore of the zones (x1, y1, x2, y2), one receipt per image
+    '''
+
+    names, boxes = parse_vgg_regions(thecsv_file)
+
+    order = np.argsort(names, kind='stable') #group the regions of each receipt together
+    names, boxes = names[order], boxes[order]
+    receipt_ids, lengths = np.unique(names, return_counts=True)
+
+    zones = TokenStore(columns=ZONE_COLUMNS)
+    zones.extend(receipt_ids.tolist(), lengths, x1=boxes[:, 0], y1=boxes[:, 1], x2=boxes[:, 2], y2=boxes[:, 3])
+
+    if zones_path is not None:
+        zones.save(zones_path)
+
+    return zones
+
+
+
 def vgg_csv_receipts_onebyone(thecsv_file):
     '''
     We have used vgg annotator to manualy draw bboxes on the receipt,
     This was done in order to use IoU to keep the zones of interest. 
-    This function aims to return csv files corresponding to each receipt
+    This function aims to return csv files corresponding to each receipt, with one row per zone of interest
     They are returned under this form: 'imageName', 'X1', 'Y1', 'X2', 'Y2', 'bbox'
+    vgg_zones saves the same zones into a single indexed file.
 
     Input:
         thecsv_file: the whole csv file containing the annotation done by vgg
@@ -159,43 +275,20 @@ def vgg_csv_receipts_onebyone(thecsv_file):
         save on disk, the corresponding csv to each receipt loke: 'imageName', 'X1', 'Y1', 'X2', 'Y2', 'bbox'
     '''
 
-    vgg_200receipts = pd.read_csv(thecsv_file)  #read the csv file
-    interested_frame = vgg_200receipts[['filename', 'region_shape_attributes']] #select the interested columns
-
-    listedesnoms = [] #empty list
-    listedesx1 = [] #empty list
-    listedesy1 = [] #empty list
-    listedesx2 = [] #empty list
-    listedesy2 = [] #empty list
-    listedebbox = [] #empty list
-
-    for l in range(len(interested_frame)): #iterate over the length of the dataframe
-
-        #append the filename
-        listedesnoms.append(interested_frame.iloc[l,0].replace('.jpg','').replace('-','_'))
-        #append x1
-        listedesx1.append(ast.literal_eval(interested_frame.iloc[l,1])['x'])
-        #append y1
-        listedesy1.append(ast.literal_eval(interested_frame.iloc[l,1])['y'])
-        #append x2
-        listedesx2.append(ast.literal_eval(interested_frame.iloc[l,1])['x']+ast.literal_eval(interested_frame.iloc[l,1])['width'])
-        #append y2
-        listedesy2.append(ast.literal_eval(interested_frame.iloc[l,1])['y']+ast.literal_eval(interested_frame.iloc[l,1])['height'])
-        #append the bbox in form of [x1,y1,x2,y2]
-        listedebbox.append([ast.literal_eval(interested_frame.iloc[l,1])['x'],
-                            ast.literal_eval(interested_frame.iloc[l,1])['y'],
-                            ast.literal_eval(interested_frame.iloc[l,1])['x']+ast.literal_eval(interested_frame.iloc[l,1])['width'],
-                            ast.literal_eval(interested_frame.iloc[l,1])['y']+ast.literal_eval(interested_frame.iloc[l,1])['height']])
-        
+    names, boxes = parse_vgg_regions(thecsv_file)
 
     #save in to a big dataframe
-    deaf = pd.DataFrame(list(zip(listedesnoms, listedesx1, listedesy1, listedesx2, listedesy2,listedebbox)), 
-                           columns =['imageName', 'X1', 'Y1', 'X2', 'Y2', 'bbox']) 
+    deaf = pd.DataFrame({'imageName': names,
+                         'X1': boxes[:, 0],
+                         'Y1': boxes[:, 1],
+                         'X2': boxes[:, 2],
+                         'Y2': boxes[:, 3],
+                         'bbox': boxes.tolist()})
 
-    for t in tqdm(range(len(deaf))):  #iterate over the length of the dataframe
+    for name, receipt in tqdm(deaf.groupby('imageName', sort=False)):  #iterate over the receipts
 
-        #save each data to a csv file on disk
-        deaf.loc[[t]].to_csv(f'/home/meteor21/CUTIE_mekene/data/200receipts_csv_onebyone/{deaf.iloc[t,0]}.csv', index = False)
+        #save the zones of each receipt to a csv file on disk
+        receipt.to_csv(f'/home/meteor21/CUTIE_mekene/data/200receipts_csv_onebyone/{name}.csv', index = False)
    
     return
 
@@ -218,32 +311,37 @@ def get_iou(a, b, epsilon=1e-5):
     Returns:
         (float) The Intersect of Union score.
     """
-    # COORDINATES OF THE INTERSECTION BOX
-    x1 = max(a[0], b[0])
-    y1 = max(a[1], b[1])
-    x2 = min(a[2], b[2])
-    y2 = min(a[3], b[3])
+    return float(iou_matrix(Boxes.from_array(a), Boxes.from_array(b), epsilon)[0, 0])
+
+
+
+def get_mask(z, store=None, zones=None, out_size=None, overlap='union', csv_file=None, zone_file=None):
+    '''
+    This function returns the mask of a receipt: 1s on the tokens matching a zone of interest, 0s elsewhere.
+    Input:
+        z: the number of the image (example: 1107)
+        store: the TokenStore holding the google vision annotation, the csv files are read if None
+        zones: the TokenStore of the zones of interest returned by vgg_zones, the csv files are read if None
+        out_size: (width, height) to rasterize straight at the training resolution, the image size if None
+        overlap: 'union' or 'erase' (overlapping tokens left to 0 as before), see rasterize_boxes
+        csv_file, zone_file: the csv files read without store and zones, see get_token_boxes and get_zones
+    return:
+        the uint8 mask
+    '''
 
-    # AREA OF OVERLAP - Area where the boxes intersect
-    width = (x2 - x1)
-    height = (y2 - y1)
-    # handle case where there is NO overlap
-    if (width<0) or (height <0):
-        return 0.0
-    area_overlap = width * height
+    zone_boxes = get_zones(z, zones, zone_file) #every zone of interest of the receipt
+    token_boxes, (width, height) = get_token_boxes(z, store, csv_file) #every bbox of the google vision annotation
 
-    # COMBINED AREA
-    area_a = (a[2] - a[0]) * (a[3] - a[1])
-    area_b = (b[2] - b[0]) * (b[3] - b[1])
-    area_combined = area_a + area_b - area_overlap
+    #the tokens whose IoU with any zone of interest is larger than epsilon(1e-5),
+    #only the tokens in the grid cells of a zone are compared to it
+    matched = GridIndex(token_boxes).match(zone_boxes, min_iou=1e-5)
 
-    # RATIO OF AREA OF OVERLAP OVER COMBINED AREA
-    iou = area_overlap / (area_combined+epsilon) #to avoid dividing by 0
-    return iou
+    #paint every matched token at once
+    return rasterize_boxes(token_boxes[matched], width, height, out_size=out_size, overlap=overlap)
 
 
 
-def get_masks(start,end):
+def get_masks(start,end, store=None, zones=None, out_size=None, overlap='union', num_workers=4, mask_format='npz'):
     '''
     This function aims to save on disk, the corresponding masks with the zone of interest of each receipt image.
     The 200 images are saved on disk according to an ascending numerical order from 1000 to 1199.
@@ -251,48 +349,115 @@ def get_masks(start,end):
     Input:
         start: the number of the first image (example:start = 1000)
         end: the number after the one of the last image (example:end = 1200 )
+        store: the TokenStore holding the google vision annotation, the csv files are read if None
+        zones: the TokenStore of the zones of interest returned by vgg_zones, the csv files are read if None
+        out_size: (width, height) to rasterize straight at the training resolution, the image size if None
+        overlap: 'union' or 'erase' (overlapping tokens left to 0 as before), see rasterize_boxes
+        num_workers: the number of receipts processed at the same time (numpy and PIL release the GIL)
+        mask_format: 'npz' (run-length encoded) or 'png' (single channel uint8), see masks.save_mask
     return:
         save each corresponding masks on disk
     '''
 
-    for z in tqdm(range(start,end)): #iterate over this range
-        
-        #read the corresponding single row csv file generated by vgg manual annotation 
-        small_csv = pd.read_csv(f'/home/meteor21/CUTIE_mekene/data/200receipts_csv_onebyone/{z}_receipt.csv')
+    def save_one(z):
+        matrix = get_mask(z, store, zones, out_size, overlap)
+
+        #save the class map losslessly
+        save_mask(f'/home/meteor21/CUTIE_mekene/data/200receipts_masks/{z}-receipt.{mask_format}', matrix)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for _ in tqdm(executor.map(save_one, range(start,end)), total=end-start): #iterate over this range
+            pass
+
+    return
+
+
+
+def get_zones(z, zones=None, zone_file=None):
+    '''
+    This function returns the zones of interest of a receipt
+    Input:
+        z: the number of the image (example: 1107)
+        zones: the TokenStore returned by vgg_zones, the csv file written by vgg_csv_receipts_onebyone is read if None
+        zone_file: that csv file, the one of 200receipts_csv_onebyone if None
+    return:
+        the Boxes of the zones
+    '''
+
+    if zones is None:
+        #read the corresponding csv file generated by vgg manual annotation 
+        if zone_file is None:
+            zone_file = f'/home/meteor21/CUTIE_mekene/data/200receipts_csv_onebyone/{z}_receipt.csv'
+        small_csv = pd.read_csv(zone_file)
+        return Boxes(small_csv['X1'].values, small_csv['Y1'].values, small_csv['X2'].values, small_csv['Y2'].values)
+
+    if f'{z}_receipt' not in zones:
+        return Boxes.from_array([])
+
+    zone = zones.receipt(f'{z}_receipt')
+    return Boxes(zone['x1'], zone['y1'], zone['x2'], zone['y2'])
+
+
+
+def get_token_boxes(z, store=None, csv_file=None):
+    '''
+    This function returns the bbox of every token of a receipt
+    Input:
+        z: the number of the image (example: 1107)
+        store: the TokenStore holding the google vision annotation, the csv file written by get_csv_files is read if None
+        csv_file: that csv file, the one of csv_files if None
+    return:
+        the Boxes of the tokens and the (width, height) of the image
+    '''
+
+    if store is None:
         #read the corresponding large csv file generated by the google vision annotation
-        big_csv = pd.read_csv(f'/home/meteor21/CUTIE_mekene/data/csv_files/{z}_receipt.csv')
-        #make zero matrix with size corresponding to the image size
-        matrix = (np.zeros(((big_csv.iloc[0, 7]), (big_csv.iloc[0, 6]))))
+        if csv_file is None:
+            csv_file = f'/home/meteor21/CUTIE_mekene/data/csv_files/{z}_receipt.csv'
+        big_csv = pd.read_csv(csv_file)
+        boxes = Boxes(big_csv['X1'].values, big_csv['Y1'].values, big_csv['X2'].values, big_csv['Y2'].values)
+        return boxes, (int(big_csv['image_width'].iloc[0]), int(big_csv['image_height'].iloc[0]))
 
+    tokens = store.receipt(f'{z}_receipt')
+    boxes = Boxes(tokens['x1'], tokens['y1'], tokens['x2'], tokens['y2'])
+    return boxes, (int(tokens['image_width'][0]), int(tokens['image_height'][0]))
 
-        for i in range(len(big_csv)): #iterate over the length of the larger csv file 
-            
-            #make zero matrix with size corresponding to the image size
-            block = (np.zeros(((big_csv.iloc[i, 7]), (big_csv.iloc[i, 6]))))
-            #compute the IoU of the bbox in the small csv with each bbox in the big csv
-            theIoU = (get_iou(ast.literal_eval(small_csv.iloc[0,-1]), ast.literal_eval(big_csv.iloc[i,-1])))
-            
-            if theIoU > 1e-5: #In case the IoU is larger than epsilon(1e-5)
-                #fill with 1s the corresponding rectangle in the 'block' array 
-                block[(big_csv.iloc[i, 3]):(big_csv.iloc[i, 5]), (big_csv.iloc[i, 2]):(big_csv.iloc[i, 4])] = 1
 
-            matrix = np.add(matrix, block) #matrix + block
-       
-        #avoid overlap of small rectangles on 'matrix' and also keep the values of 'matrix' to (0.0 and 1.0)
-        matrix[matrix>1] = 0
 
 
-        #save the image in jpg
-        img = Image.fromarray(matrix)
-        img = img.convert('RGB')
-        img.save(f'/home/meteor21/CUTIE_mekene/data/200receipts_masks/{z}-receipt.jpg')
+def tokens_near_keyword(receipt_id, keyword, store, k=5, radius=None):
+    '''
+    This function returns the tokens around each occurrence of a keyword on a receipt (example: the amount near 'total')
+    Input:
+        receipt_id: the id of the receipt ('1107_receipt')
+        keyword: the normalized text to look for ('total')
+        store: the TokenStore holding the receipt, with its 'norm_text' column computed
+        k: the number of nearest tokens of each occurrence
+        radius: if not None, all the tokens at most radius pixels away are returned instead of the k nearest
+    return:
+        dict, the row of each occurrence in the receipt and the rows of its neighbouring tokens, sorted by distance
+    '''
 
-    return
+    tokens = store.receipt(receipt_id)
+    boxes = Boxes(tokens['x1'], tokens['y1'], tokens['x2'], tokens['y2'])
+    index = GridIndex(boxes)
+
+    neighbours = {}
+    for i in np.flatnonzero(tokens['norm_text'] == keyword):
+        xc, yc = boxes[i:i + 1].centers()[0]
+        if radius is None:
+            ids, _ = index.nearest(xc, yc, k=k, exclude=[i])
+        else:
+            ids = index.within(xc, yc, radius)
+            ids = ids[ids != i]
+        neighbours[int(i)] = ids
 
+    return neighbours
 
 
 
-def vizz_of_overlay_rectangles(start, end):
+
+def vizz_of_overlay_rectangles(start, end, store=None, zones=None):
     '''
     This function aims to visualize each receipt with the corresponding zone of interest, 
     clearly overlayed by a transparent red rectangle. 
@@ -301,6 +466,8 @@ def vizz_of_overlay_rectangles(start, end):
     Input:
         start: the number of the first image (example:start = 1000)
         end: the number after the one of the last image (example:end = 1200 )
+        store: the TokenStore holding the google vision annotation, the csv files are read if None
+        zones: the TokenStore of the zones of interest returned by vgg_zones, the csv files are read if None
     return:
         visualisation of the images 
     '''
@@ -308,10 +475,8 @@ def vizz_of_overlay_rectangles(start, end):
 
     for z in range(start,end): #iterate over this range
 
-        #read the corresponding single row csv file generated by vgg manual annotation 
-        small_csv = pd.read_csv(f'/home/meteor21/CUTIE_mekene/data/200receipts_csv_onebyone/{z}_receipt.csv')
-        #read the corresponding large csv file generated by the google vision annotation
-        big_csv = pd.read_csv(f'/home/meteor21/CUTIE_mekene/data/csv_files/{z}_receipt.csv')
+        zone_boxes = get_zones(z, zones) #every zone of interest of the receipt
+        token_boxes, _ = get_token_boxes(z, store) #every bbox of the google vision annotation
         #read the corresponding image
         image = Image.open(f'/home/meteor21/CUTIE_mekene/large-receipt-image-dataset-SRD/{z}-receipt.jpg')
 
@@ -322,21 +487,17 @@ def vizz_of_overlay_rectangles(start, end):
         # Display the image
         ax.imshow(image)
 
-        for i in range(len(big_csv)): #iterate over the length of the large csv file 
-            
-            #compute the IoU of the bbox in the small csv with each bbox in the big csv
-            theIoU = (get_iou(ast.literal_eval(small_csv.iloc[0,-1]), ast.literal_eval(big_csv.iloc[i,-1])))
-            
-            if theIoU > 1e-5: #In case the IoU is larger than epsilon(1e-5)
+        #the tokens whose IoU with any zone of interest is larger than epsilon(1e-5)
+        matched = token_boxes[GridIndex(token_boxes).match(zone_boxes, min_iou=1e-5)]
 
-                # Create a Rectangle patch
-                rect = patches.Rectangle(((big_csv.iloc[i, 2]),(big_csv.iloc[i, 3])),
-                                         ((big_csv.iloc[i, 4])-(big_csv.iloc[i, 2])),
-                                         ((big_csv.iloc[i, 5])-(big_csv.iloc[i, 3])),
-                                         linewidth=1, edgecolor='r', facecolor='r', alpha=0.2)
+        for x1, y1, x2, y2 in matched.to_array():
 
-                # Add the patch to the Axes
-                ax.add_patch(rect)
+            # Create a Rectangle patch
+            rect = patches.Rectangle((x1, y1), (x2 - x1), (y2 - y1),
+                                     linewidth=1, edgecolor='r', facecolor='r', alpha=0.2)
+
+            # Add the patch to the Axes
+            ax.add_patch(rect)
 
         plt.show()  #visualise
         
@@ -345,68 +506,26 @@ def vizz_of_overlay_rectangles(start, end):
 
 
 
-def resize_image(image_path, desired_dimension):
+def resize_image(image_path, desired_dimension, show=False, multiple=None):
     '''
     This function aims to resize the images into square format without affecting the previous annotations
     Input:
         image_path:the image path on disk
         desired_dimension:if the target shape we want is (n,n), desired_dimension = n
-    Return: the reshaped image in np.array format
+        show: plot the reshaped image
+        multiple: None for the square, otherwise the long side is n and the image is only padded to the next multiple
+            (rectangular inputs, see fit_long_side)
+    Return: the reshaped image in np.array format (uint8), see letterbox and resize_many for the transform and batches
 
     '''
-    
-
-    al = plt.imread(image_path) #read the image
-
-
-    if len(al.shape) == 2: #check if it is a 1 channels image
-        
-
-        al = cv2.merge((al,al,al)) #merge all channels together
-
-
-    elif al.shape[2] == 4: b #check if it is a 4 channels image
-
-        al = cv2.cvtColor(al, cv2.COLOR_BGRA2BGR) #convert it into 3 channels image
-
-    else:  #otherwise
-
-        al = al
-
-
-    w = al.shape[1]  #store the width
-    h = al.shape[0]  #store the height
-    c = al.shape[2]  #store the number of channels(3 in this case)
-
-    #print(w)
-    #print(h)
-    #print(c)
-
-    # In case image is horizontally orientated
-    if w > h:
-        combine = np.zeros((w,w,c))
-        combino = combine
-        for i in range(c):
-            combino[0:h ,: ,i] = al[:,:,i]
-        resized = cv2.resize(combino, (desired_dimension, desired_dimension), interpolation=cv2.INTER_NEAREST)
-
-    # In case image is vertically orientated
-    elif w < h:
-        combine = np.zeros((h,h,c))
-        combino = combine
-        for i in range(c):
-            combino[: ,0:w,i] = al[:,:,i]
-        resized = cv2.resize(combino, (desired_dimension, desired_dimension), interpolation=cv2.INTER_NEAREST)
-
-    # In case image is squared
+    if multiple is None:
+        al, _ = letterbox(read_rgb(image_path, desired_dimension), desired_dimension) #padded at the bottom or at the right, as the annotations expect
     else:
-        resized = cv2.resize(al, (desired_dimension, desired_dimension), interpolation=cv2.INTER_NEAREST)
-
-    al = resized 
+        al, _ = fit_long_side(read_rgb(image_path, desired_dimension), desired_dimension, multiple)
 
-    plt.imshow(al.astype(np.uint8))  # to Clip input data to the valid range for imshow with RGB data.
-    plt.show()
-    #print('the final shape is:',al.shape)
+    if show:
+        plt.imshow(al)
+        plt.show()
 
     return al
 
@@ -463,17 +582,19 @@ def visualize_bbox_centers(csv_file, desired_shape):
 
 
 
-def get_relative_centers(csv_file, desired_shape):
+def get_relative_centers(csv_file, desired_shape, store=None, output_file=None):
     '''
     This function aims to give back relative position of the center of each bbox on the corresponding image
     input:
-        csv_file: the path the csv file
+        csv_file: the path the csv file, or the receipt id ('1107_receipt') when reading from the store
         desired_shape: if the target shape we want for the image is (n,n), desired_dimension = n
+        store: the TokenStore holding the receipt, None to read and write csv files
+        output_file: the csv file written, the one of csv_files_with_centers if None
     return:
-        save the update dataframe to csv files 
+        save the update dataframe to csv files, or update the receipt in the store
     '''
     
-    receipt = pd.read_csv(csv_file)
+    receipt = pd.read_csv(csv_file) if store is None else store.to_frame(csv_file).iloc[:, :9]
     maximum = max(receipt.iloc[1,6],receipt.iloc[1,7]) #maximum between height or width of the corresponding image
 
     width_and_height = [] #empty list
@@ -502,14 +623,106 @@ def get_relative_centers(csv_file, desired_shape):
     receipt['New_Image_width_and_height'] = width_and_height #add this column to the dataframe
     receipt['No_char'] = minisc_no_special_char
    
+    if store is not None:
+        store.update(csv_file, xc=Xc_list, yc=Yc_list, norm_text=minisc_no_special_char)
+        return
 
     #save each data to a csv file on disk
-    receipt.to_csv(f'/home/meteor21/CUTIE_mekene/data/csv_files_with_centers/{receipt.iloc[1,0]}_centers.csv', index = False)
+    if output_file is None:
+        output_file = f'/home/meteor21/CUTIE_mekene/data/csv_files_with_centers/{receipt.iloc[1,0]}_centers.csv'
+    receipt.to_csv(output_file, index = False)
    
     return
 
 
-def initial_grids(csv_file, grid_size, desired_image_size):
+#the characters removed by the normalization: everything but the letters and digits (str.isalnum)
+NON_ALNUM = re.compile(r'[\W_]+')
+
+#the OCR misreadings fixed by replace_after_Levenshtein
+LEVENSHTEIN_CORRECTIONS = {'tctal': 'total', 'otal': 'total', 'txtl': 'total', 'totl': 'total', 'fotal': 'total'}
+
+
+
+def normalize_texts(texts):
+    '''
+    This function lowercases the descriptions and removes their special characters, all at once
+    input:
+        texts: the pandas Series (or list) of the descriptions
+    return:
+        the pandas Series of the normalized descriptions, the same as ''.join(e for e in text.lower() if e.isalnum())
+    '''
+    return pd.Series(texts, dtype=object).fillna('').astype(str).str.lower().str.replace(NON_ALNUM, '', regex=True)
+
+
+
+def glove_word_ids(glove_file):
+    '''
+    This function gives an id to every word of glove, in the order of the file, the dummy string 'mekene' being 0.
+    Only the first field of each line is read, the vectors are not parsed.
+    input:
+        glove_file: the glove txt file
+    return:
+        dict, word -> id
+    '''
+    return Vocabulary.from_glove(glove_file).word_ids
+
+
+
+def process_receipt_tokens(csv_file, desired_shape, word_ids, corrections=LEVENSHTEIN_CORRECTIONS, store=None,
+                           output_file=None):
+    '''
+    This function fuses get_relative_centers, replace_after_Levenshtein and replace_after_Glove in one vectorized pass:
+    the centers are computed with numpy, the descriptions normalized over the whole column,
+    corrected, and mapped to their glove word and id.
+    input:
+        csv_file: the path the csv file (written by get_csv_files), or the receipt id ('1107_receipt') when using the store
+        desired_shape: if the target shape we want for the image is (n,n), desired_dimension = n
+        word_ids: the Vocabulary, or a dict word -> id, 'mekene' being 0 (see glove_word_ids)
+        corrections: dict, normalized description -> corrected description
+        store: the TokenStore holding the receipt, None to read and write csv files
+        output_file: the csv file written, the one of csv_files_replace_after_Glove if None
+    return:
+        save the dataframe to a csv file once, or update the receipt in the store
+    '''
+    receipt = pd.read_csv(csv_file, keep_default_na=False) if store is None else store.to_frame(csv_file).iloc[:, :9]
+    maximum = max(receipt.iloc[0,6],receipt.iloc[0,7]) #maximum between height or width of the corresponding image
+    ratio = desired_shape/maximum #target over actual
+
+    x1, y1, x2, y2 = [receipt.iloc[:, k].values.astype(np.float64) for k in range(2, 6)]
+    Xc = (ratio*(x1+x2)/2).astype(np.int32) #the x coordinates of the centers
+    Yc = (ratio*(y1+y2)/2).astype(np.int32) #the y coordinates of the centers
+
+    nochar = normalize_texts(receipt.iloc[:,1].values) #lowercase, without special characters
+    if corrections:
+        nochar = nochar.replace(corrections)
+
+    #0 ('mekene') if not in glove. dict lookups: Series.map would first turn the whole vocabulary into a Series
+    if isinstance(word_ids, Vocabulary):
+        token_ids = word_ids.ids(nochar.values)
+    else:
+        token_ids = np.fromiter((word_ids.get(word, 0) for word in nochar.values), dtype=np.int32, count=len(nochar))
+    tokens = np.where(token_ids > 0, nochar.values, 'mekene').astype(object)
+
+    if store is not None:
+        store.update(csv_file, xc=Xc, yc=Yc, norm_text=nochar.values, token_id=token_ids, token=tokens)
+        return
+
+    receipt['Xc'] = Xc #add this column to the dataframe
+    receipt['Yc'] = Yc #add this column to the dataframe
+    receipt['New_Image_width_and_height'] = maximum #add this column to the dataframe
+    receipt['No_char'] = nochar.values
+    receipt['Token_id'] = token_ids
+    receipt['Tokens'] = tokens
+
+    if output_file is None:
+        output_file = f'/home/meteor21/CUTIE_mekene/data/csv_files_replace_after_Glove/{receipt.iloc[0,0]}_centers.csv'
+    receipt.to_csv(output_file, index = False)
+
+    return
+
+
+
+def initial_grids(csv_file, grid_size, desired_image_size, search='spiral', max_radius=None):
     '''
     This function aims to return the grid (numpy array) corresponding to each receipt image.
     It saves the bbox centers to 1s and the locations where there's no text to 0s
@@ -520,49 +733,22 @@ def initial_grids(csv_file, grid_size, desired_image_size):
         csv_file: the path of the csv file containing infos about the bbox centers 
         grid_size: if the target shape we want for the grid is (n,n), grid_size = n
         desired_image_size: if the target shape we want for the image is (P,P), desired_image_size = P
+        search, max_radius: the resolution of the overlaps (see grids.place_tokens), 'neighbours' for the former one
         
     Return:
         show the grind(numpy array) with every bbox center not overlapping
     '''
     
     csv_center = pd.read_csv(csv_file) #read csv file
-    ratio = desired_image_size/grid_size #compute the ratio 
-    orh = np.zeros((int(grid_size),int(grid_size))) #0s numpy array
+    rows, cols = token_cells(csv_center.iloc[:,9].values, csv_center.iloc[:,10].values, grid_size, desired_image_size)
+    rows, cols = place_tokens(rows, cols, np.ones(len(csv_center), dtype=bool), int(grid_size), search, max_radius)
 
+    orh = np.zeros((int(grid_size),int(grid_size))) #0s numpy array
+    placed = rows >= 0
+    orh[rows[placed], cols[placed]] = 1
 
-    for j in range(len(csv_center)): #iterate over the length of the csv file 
-        
-        #Check if the actual loaction of the center relative to the receipt is empty
-        if orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1] ==0:
-            #if yes, fill it to 1
-            orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]+=1
-
-        #if no, check the right side 
-        elif orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]==1:
-            if orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)+1:int(csv_center.iloc[j,9]/ratio)+2]==0:
-                orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)+1:int(csv_center.iloc[j,9]/ratio)+2]+=1
-            
-            #if no, check the down side 
-            elif orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)+1:int(csv_center.iloc[j,9]/ratio)+2]==1:
-                if orh[int(csv_center.iloc[j,10]/ratio)+1:int(csv_center.iloc[j,10]/ratio)+2,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]==0:     
-                    orh[int(csv_center.iloc[j,10]/ratio)+1:int(csv_center.iloc[j,10]/ratio)+2,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]+=1
-                
-                #if no, check the left side 
-                elif orh[int(csv_center.iloc[j,10]/ratio)+1:int(csv_center.iloc[j,10]/ratio)+2,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]==1:
-                    if orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)-1:int(csv_center.iloc[j,9]/ratio)]==0:
-                        orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)-1:int(csv_center.iloc[j,9]/ratio)]+=1
-                    #if no, check the upper side 
-                    elif orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)-1:int(csv_center.iloc[j,9]/ratio)]==1:
-                        if orh[int(csv_center.iloc[j,10]/ratio)-1:int(csv_center.iloc[j,10]/ratio),int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]==0:
-                            orh[int(csv_center.iloc[j,10]/ratio)-1:int(csv_center.iloc[j,10]/ratio),int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]+=1
-
-
-     
-    
-
-    if max(np.unique(orh)) != 1. :
-        print(np.unique(orh))
-        print(csv_file)
+    if not placed.all():
+        print('{n} tokens dropped from'.format(n=int((~placed).sum())), csv_file)
         
     plt.imshow(orh)
     plt.show()
@@ -682,38 +868,40 @@ def myGloveDict(glove_file):
 
 
 
-def replace_after_Glove(csv_file, list_of_glove_file_keys):
+def replace_after_Glove(csv_file, list_of_glove_file_keys, store=None, output_file=None):
     '''
     This is also a post processing function that allows to replace all tokens not present in glove to the dummy string 'mekene'
     input:
-        csv_file: the path of the update csv file
-        list_of_glove_file_keys: list of all the tokens present in glove
+        csv_file: the path of the update csv file, or the receipt id ('1107_receipt') when reading from the store
+        list_of_glove_file_keys: the tokens present in glove, a Vocabulary (or a set) to look them up in O(1)
+        store: the TokenStore holding the receipt, None to read and write csv files
+        output_file: the csv file written, the one of csv_files_replace_after_Glove if None
     return:
-        save to a new csv file 
+        save to a new csv file, or update the receipt in the store
     '''
-            
-    receipt = pd.read_csv(csv_file)
-    tokens = []
-    
+    if isinstance(list_of_glove_file_keys, list): #a list would be scanned for every token
+        list_of_glove_file_keys = Vocabulary(list_of_glove_file_keys)
 
-    for i in range(len(receipt)):
-        if receipt.iloc[i,12] not in list_of_glove_file_keys:
-            token = 'mekene'
-        else:
-            token = receipt.iloc[i,12]
-            
-        tokens.append(token)
+    receipt = pd.read_csv(csv_file) if store is None else store.to_frame(csv_file)
+    tokens = [token if token in list_of_glove_file_keys else 'mekene' for token in receipt.iloc[:,12]]
      
     receipt['Tokens'] = tokens 
 
-    receipt.to_csv(f'/home/meteor21/CUTIE_mekene/data/csv_files_replace_after_Glove/{receipt.iloc[1,0]}_centers.csv', index = False)
+    if store is not None:
+        store.update(csv_file, token=tokens)
+        return
+
+    if output_file is None:
+        output_file = f'/home/meteor21/CUTIE_mekene/data/csv_files_replace_after_Glove/{receipt.iloc[1,0]}_centers.csv'
+    receipt.to_csv(output_file, index = False)
    
     return
 
 
 
 
-def final_grids(csv_file, grid_size, desired_image_size, myglovedico):
+def final_grids(csv_file, grid_size, desired_image_size, myglovedico, store=None, search='spiral', max_radius=None,
+                output_file=None):
     '''
     This function aims to return the final grid (numpy array) corresponding to each receipt image.
     for each token present on the receipt image, its corresponding embedding vector is fill into the grid 
@@ -725,53 +913,31 @@ def final_grids(csv_file, grid_size, desired_image_size, myglovedico):
         grid_size: if the target shape we want for the grid is (n,n), grid_size = n
         desired_image_size: if the target shape we want for the image is (P,P), desired_image_size = P
         myglovedico: our custom dictionnary made up with the dummy string 'mekene' and glove.
+        store: the TokenStore holding the receipt (csv_file is then the receipt id), None to read the csv file
+        search, max_radius: the resolution of the overlaps (see grids.place_tokens), 'neighbours' for the former one
+        output_file: the npy file written, the one of final_grids if None
         
     Return:
-        save the grind(numpy array) with no overlap to npy file on disk
+        save the grind(numpy array) with no overlap to npy file on disk, and return the number of dropped tokens
     '''
     
-    csv_center = pd.read_csv(csv_file) #read csv file
-    ratio = desired_image_size/grid_size #compute the ratio 
-    orh = np.zeros((int(grid_size),int(grid_size),200)) #0s numpy array
-
-
-    for j in range(len(csv_center)): #iterate over the length of the csv file 
-        
-        #Check if the actual loaction of the center relative to the receipt is empty
-        if np.mean(orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1,:]) ==0:
-            #if yes, fill it to 1
-            orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]+=myglovedico[csv_center.iloc[j,-1]]
+    csv_center = pd.read_csv(csv_file) if store is None else store.to_frame(csv_file) #read csv file
+    vectors = np.array([myglovedico[token] for token in csv_center.iloc[:,-1]], dtype=np.float64).reshape(len(csv_center), -1)
 
-        #if no, check the right side 
-        elif np.mean(orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1,:])!=0:
-            if np.mean(orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)+1:int(csv_center.iloc[j,9]/ratio)+2,:])==0:
-                orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)+1:int(csv_center.iloc[j,9]/ratio)+2]+=myglovedico[csv_center.iloc[j,-1]]
-
-            
-            #if no, check the down side 
-            elif np.mean(orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)+1:int(csv_center.iloc[j,9]/ratio)+2,:])!=0:
-                if np.mean(orh[int(csv_center.iloc[j,10]/ratio)+1:int(csv_center.iloc[j,10]/ratio)+2,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1,:])==0:     
-                    orh[int(csv_center.iloc[j,10]/ratio)+1:int(csv_center.iloc[j,10]/ratio)+2,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]+=myglovedico[csv_center.iloc[j,-1]]
-
-                
-                #if no, check the left side 
-                elif np.mean(orh[int(csv_center.iloc[j,10]/ratio)+1:int(csv_center.iloc[j,10]/ratio)+2,int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1,:])!=0:
-                    if np.mean(orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)-1:int(csv_center.iloc[j,9]/ratio),:])==0:
-                        orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)-1:int(csv_center.iloc[j,9]/ratio)]+=myglovedico[csv_center.iloc[j,-1]]
-                    #if no, check the upper side 
-                    elif np.mean(orh[int(csv_center.iloc[j,10]/ratio):int(csv_center.iloc[j,10]/ratio)+1,int(csv_center.iloc[j,9]/ratio)-1:int(csv_center.iloc[j,9]/ratio),:])!=0:
-                        if np.mean(orh[int(csv_center.iloc[j,10]/ratio)-1:int(csv_center.iloc[j,10]/ratio),int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1,:])==0:
-                            orh[int(csv_center.iloc[j,10]/ratio)-1:int(csv_center.iloc[j,10]/ratio),int(csv_center.iloc[j,9]/ratio):int(csv_center.iloc[j,9]/ratio)+1]+=myglovedico[csv_center.iloc[j,-1]]
-
-
-
-     
-    
+    #the tokens whose vector is 0 ('mekene') are not written, they do not take a cell
+    rows, cols = token_cells(csv_center.iloc[:,9].values, csv_center.iloc[:,10].values, grid_size, desired_image_size)
+    occupies = np.any(vectors != 0, axis=1)
+    rows, cols = place_tokens(rows, cols, occupies, int(grid_size), search, max_radius)
 
+    orh = np.zeros((int(grid_size),int(grid_size),200)) #0s numpy array
+    written = (rows >= 0) & occupies #one token per cell
+    orh[rows[written], cols[written]] = vectors[written]
 
-    np.save(f'/home/meteor21/CUTIE_mekene/data/final_grids/{csv_center.iloc[1,0]}.npy', orh)    
+    if output_file is None:
+        output_file = f'/home/meteor21/CUTIE_mekene/data/final_grids/{csv_center.iloc[1,0]}.npy'
+    np.save(output_file, orh)
 
-    return
+    return int((rows < 0).sum())
 
 
 
@@ -783,32 +949,24 @@ def Vizz_ratio_myvoc_in_glovevoc(csv_files_list, glove_file):
     our vocabulary into glove (in terms of ratio)
     input:
         csv_files_list: the list of the csv file paths
-        glove_file: the path of the glove_file
+        glove_file: the path of the glove_file (or of the directory of the converted glove)
     return:
-        plot the camembert 
+        plot the camembert, and return the coverage report (see Vocabulary.coverage)
     '''
 
-    listofwords = []
-    for thing in tqdm(csv_files_list):
-        csv_center = pd.read_csv(thing)
-        listofwords.append(list(csv_center['No_char']))
+    vocabulary = Vocabulary.from_glove(glove_file)
+    print('the length of glove vocab is :',len(vocabulary))
 
-    flatlistofwords = list(itertools.chain(*listofwords))
+    #a single pass over the No_char column of the csv files
+    report = vocabulary.coverage(tqdm(csv_receipts(csv_files_list), total=len(csv_files_list)))
 
-    lisofkeys = list(myGloveDict(glove_file).keys())
-    print('the length of glove vocab is :',len(lisofkeys))
-
-    my_vocab_not_in_glove = []
-    for word in tqdm(flatlistofwords):
-        if word not in lisofkeys:
-            my_vocab_not_in_glove.append(word)
-
-    print('the total number of words in our vocabulary is:', len(flatlistofwords))
-    print('the number of words in our vocabulary that are not in glove is:', len(my_vocab_not_in_glove))
-    print('the difference is:',len(flatlistofwords)-len(my_vocab_not_in_glove))
+    print('the total number of words in our vocabulary is:', report['num_tokens'])
+    print('the number of words in our vocabulary that are not in glove is:', report['num_tokens_oov'])
+    print('the difference is:', report['num_tokens_in_vocab'])
+    print('the most frequent words that are not in glove are:', report['top_oov'])
 
     plt.figure(figsize = (8, 8))
-    x = [10684, 2581]
+    x = [report['num_tokens_in_vocab'], report['num_tokens_oov']]
     plt.pie(x, labels = ['myVocabInGlove', 'myVocabNotInGlove'],
                colors = ['red', 'blue'],
                explode = [0, 0.2],
@@ -817,4 +975,6 @@ def Vizz_ratio_myvoc_in_glovevoc(csv_files_list, glove_file):
                shadow = True)
     plt.legend()
 
+    return report
+
 
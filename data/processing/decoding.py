@@ -0,0 +1,202 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+import pandas as pd
+
+from data.processing.geometry import Boxes
+
+
+
+MODES = ['box', 'center', 'grid']
+
+
+
+def softmax(logits, axis=-1):
+    '''
+    The probabilities of the logits of the model, along the classes
+    '''
+    logits = np.asarray(logits, dtype=np.float32)
+    exp = np.exp(logits - logits.max(axis=axis, keepdims=True))
+    return exp / exp.sum(axis=axis, keepdims=True)
+
+
+
+def _input_shape(input_size):
+    #(height, width) of the inputs of the model, an int being a square input
+    return (input_size, input_size) if np.isscalar(input_size) else tuple(input_size)
+
+
+
+def token_positions(store, receipt_ids, mode='center', max_tokens=None):
+    '''
+    This function builds the (row, col) of the tokens of a batch of receipts, in the coordinates of the inputs of the model,
+    for the token head of the networks (see Network.token_model)
+    input:
+        store: the TokenStore of the receipts
+        receipt_ids: the receipts of the batch
+        mode: 'center' for the image models (the centers Yc, Xc on the resized image),
+              'grid' for the grid models (the cells grid_row, grid_col)
+        max_tokens: the number of positions of each receipt, the largest receipt of the batch if None
+    return:
+        the (batch, max_tokens, 2) int32 array, -1 for the padding and the dropped tokens
+    '''
+    assert mode in ['center', 'grid']
+    rows_column, cols_column = ('yc', 'xc') if mode == 'center' else ('grid_row', 'grid_col')
+
+    bounds = [store.bounds(receipt_id) for receipt_id in receipt_ids]
+    lengths = [end - start for start, end in bounds]
+    if max_tokens is None:
+        max_tokens = max(lengths) if lengths else 0
+
+    positions = np.full((len(bounds), max_tokens, 2), -1, dtype=np.int32)
+    for i, (start, end) in enumerate(bounds):
+        n = min(end - start, max_tokens)
+        positions[i, :n, 0] = store.column(rows_column)[start:start + n]
+        positions[i, :n, 1] = store.column(cols_column)[start:start + n]
+
+    return positions
+
+
+
+def token_scores(probs, tokens, input_size=480, mode='box', desired_dimension=None):
+    '''
+    This function reads the predictions of the model for each token of a receipt, without upsampling them:
+    the probability map is at any resolution (the logits before the x8 upsample, or the grid of the grid models).
+    input:
+        probs: the (h, w, num_classes) probabilities of the receipt (see softmax)
+        tokens: the tokens of the receipt (store.receipt(receipt_id))
+        input_size: the size of the inputs of the model, an int for square inputs or (height, width),
+            the receipt being resized by its long side to max(input_size) and padded to the bottom and to the right
+        mode: 'box' the mean probabilities over the bbox of each token, with a summed area table (O(h*w + n)),
+              'center' the probabilities at the center of each token,
+              'grid' the probabilities at the cell of each token (grid models, probs at the resolution of the grid)
+        desired_dimension: the long side the receipt was resized to (see fit_long_side), max(input_size) if None:
+            an input padded beyond the resized receipt (the batch padded to its largest receipt) needs it explicitly
+    return:
+        the (n, num_classes) scores of the tokens, 0 for the tokens dropped from the grid
+    '''
+    assert mode in MODES
+    probs = np.asarray(probs, dtype=np.float32)
+    h, w, num_classes = probs.shape
+    n = len(tokens['x1'])
+    scores = np.zeros((n, num_classes), dtype=np.float32)
+    if n == 0:
+        return scores
+
+    if mode == 'grid':
+        rows, cols = tokens['grid_row'], tokens['grid_col']
+        placed = rows >= 0
+        scores[placed] = probs[rows[placed], cols[placed]]
+        return scores
+
+    input_h, input_w = _input_shape(input_size)
+    if mode == 'center':
+        rows = np.clip((tokens['yc'] * (h / input_h)).astype(np.intp), 0, h - 1)
+        cols = np.clip((tokens['xc'] * (w / input_w)).astype(np.intp), 0, w - 1)
+        return probs[rows, cols]
+
+    #the boxes from the original image to the map: resized by the long side, then reduced to the resolution of the map
+    if desired_dimension is None:
+        desired_dimension = max(input_h, input_w)
+    ratio = desired_dimension / max(int(tokens['image_width'][0]), int(tokens['image_height'][0]))
+    boxes = Boxes(tokens['x1'], tokens['y1'], tokens['x2'], tokens['y2']).scale(ratio * w / input_w, ratio * h / input_h)
+    r1 = np.clip(np.floor(boxes.y1).astype(np.intp), 0, h - 1)
+    c1 = np.clip(np.floor(boxes.x1).astype(np.intp), 0, w - 1)
+    r2 = np.clip(np.maximum(np.ceil(boxes.y2).astype(np.intp), r1 + 1), 1, h) #at least one cell per token
+    c2 = np.clip(np.maximum(np.ceil(boxes.x2).astype(np.intp), c1 + 1), 1, w)
+
+    table = np.zeros((h + 1, w + 1, num_classes), dtype=np.float64)
+    np.cumsum(np.cumsum(probs, axis=0, dtype=np.float64), axis=1, out=table[1:, 1:])
+    sums = table[r2, c2] - table[r1, c2] - table[r2, c1] + table[r1, c1]
+    return (sums / ((r2 - r1) * (c2 - c1))[:, None]).astype(np.float32)
+
+
+
+def reading_order(tokens):
+    '''
+    The order of the tokens line after line, from left to right:
+    the lines are the centers quantized by the median height of the tokens
+    '''
+    height = np.median(tokens['y2'] - tokens['y1']) if len(tokens['y1']) else 1
+    lines = ((tokens['y1'] + tokens['y2']) / 2 // max(height, 1)).astype(np.int64)
+    return np.lexsort((tokens['x1'], lines))
+
+
+
+def extract_fields(scores, tokens, class_names, background=0, threshold=0.5):
+    '''
+    This function extracts the text of each field of a receipt from the scores of its tokens
+    input:
+        scores: the (n, num_classes) scores of the tokens (see token_scores)
+        tokens: the tokens of the receipt, the description is read from the text column
+        class_names: the name of each class
+        background: the class of the tokens of no field
+        threshold: the least score of a token to be part of its field
+    return:
+        dict, the name of each field -> its text, the tokens of the field in reading order ('' if no token)
+    '''
+    labels = scores.argmax(axis=1) if len(scores) else np.zeros(0, dtype=np.intp)
+    confident = scores[np.arange(len(scores)), labels] >= threshold
+    order = reading_order(tokens)
+    texts = np.asarray(tokens['text'], dtype=object)[order]
+
+    fields = {}
+    for c, name in enumerate(class_names):
+        if c == background:
+            continue
+        selected = ((labels == c) & confident)[order]
+        fields[name] = ' '.join(texts[selected].tolist())
+
+    return fields
+
+
+
+def decode_receipt(probs, store, receipt_id, class_names, input_size=480, mode='box', background=0, threshold=0.5,
+                   desired_dimension=None):
+    '''
+    This function decodes the prediction of the model for a receipt into its tokens and fields
+    input:
+        probs: the (h, w, num_classes) probabilities of the receipt (see softmax)
+        store: the TokenStore of the receipts
+        receipt_id: the id of the receipt
+        class_names, background, threshold: see extract_fields
+        input_size, mode, desired_dimension: see token_scores
+    return:
+        the dataframe of the tokens (text, bbox, score of each class and label), the dict of the fields
+    '''
+    tokens = store.receipt(receipt_id)
+    scores = token_scores(probs, tokens, input_size, mode, desired_dimension)
+
+    frame = pd.DataFrame({name: tokens[name] for name in ['text', 'x1', 'y1', 'x2', 'y2']})
+    for c, name in enumerate(class_names):
+        frame[name] = scores[:, c]
+    frame['label'] = np.asarray(class_names, dtype=object)[scores.argmax(axis=1)] if len(scores) else []
+
+    return frame, extract_fields(scores, tokens, class_names, background, threshold)
+
+
+
+def decode_batch(outputs, store, receipt_ids, class_names, input_size=480, mode='box', background=0, threshold=0.5,
+                 logits=True, desired_dimension=None):
+    '''
+    This function decodes a batch of predictions of the model
+    input:
+        outputs: the (batch, h, w, num_classes) outputs of the model
+        logits: the outputs are logits (softmax is applied), or already probabilities
+        the others: see decode_receipt
+    return:
+        dict, receipt id -> its fields
+    '''
+    fields = {}
+    for receipt_id, output in zip(receipt_ids, outputs):
+        probs = softmax(output) if logits else output
+        _, fields[receipt_id] = decode_receipt(probs, store, receipt_id, class_names, input_size, mode, background,
+                                               threshold, desired_dimension)
+
+    return fields
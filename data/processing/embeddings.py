@@ -0,0 +1,217 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+from tqdm import tqdm
+from collections import Counter
+import argparse
+import json
+import os
+
+from data.processing.token_store import TokenStore
+from data.processing.vocabulary import Vocabulary, OOV_WORD, OOV_ID
+
+
+
+VECTORS_FILE = 'vectors.npy'
+WORDS_FILE = 'words.txt'
+COVERAGE_FILE = 'coverage.json'
+
+
+
+def convert_glove(glove_file, output_dir, dtype=np.float32):
+    '''
+    This function converts the glove txt file, once, into a directory holding
+    the (n+1, dim) matrix of the vectors as a .npy file (row 0 being the zero vector of 'mekene')
+    and the words in the order of their id, one per line.
+    The vectors are parsed line by line into the .npy file mapped in memory, so the whole txt file is never in memory.
+    input:
+        glove_file: the glove txt file
+        output_dir: the directory of the converted store
+        dtype: float32, or float16 to halve the size
+    return:
+        the output_dir
+    '''
+    with open(glove_file, 'r') as f:
+        first = f.readline().rstrip('\n').split(' ')
+        num_words = 1 + sum(1 for _ in f)
+    dim = len(first) - 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    vectors = np.lib.format.open_memmap(os.path.join(output_dir, VECTORS_FILE), mode='w+', dtype=dtype,
+                                        shape=(num_words + 1, dim))
+    vectors[OOV_ID] = 0
+
+    with open(glove_file, 'r') as f, open(os.path.join(output_dir, WORDS_FILE), 'w') as words:
+        words.write(OOV_WORD + '\n')
+        for i, line in enumerate(tqdm(f, total=num_words), start=1):
+            #split from the right: a few glove words hold spaces
+            values = line.rstrip('\n').rsplit(' ', dim)
+            vectors[i] = np.asarray(values[1:], dtype=np.float32)
+            words.write(values[0] + '\n')
+
+    vectors.flush()
+    del vectors
+    print('Converted {n} word vectors of dimension {dim}.'.format(n=num_words, dim=dim))
+
+    return output_dir
+
+
+
+class GloveStore(object):
+    '''
+    The glove vectors converted by convert_glove.
+    The matrix is memory mapped (read only), so all the processes loading the same store share the same pages,
+    and nothing is parsed: loading takes the time of reading the words.
+    It can be used in place of the dictionnary of myGloveDict: store[word], word in store, store.keys().
+    '''
+
+    def __init__(self, store_dir, mmap=True):
+        '''
+        input:
+            store_dir: the directory written by convert_glove
+            mmap: map the matrix in memory, otherwise it is read into memory
+        '''
+        self.store_dir = store_dir
+        self.vectors = np.load(os.path.join(store_dir, VECTORS_FILE), mmap_mode='r' if mmap else None)
+
+        self.words = read_words(store_dir)
+        if not self.words or self.words[OOV_ID] != OOV_WORD or len(self.words) != len(self.vectors):
+            raise ValueError('{path} is not a store written by convert_glove.'.format(path=store_dir))
+
+        self.vocabulary = Vocabulary(self.words)
+        self.word_ids = self.vocabulary.word_ids
+
+
+    def __len__(self):
+        return len(self.words)
+
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+
+    def __getitem__(self, word):
+        return self.vectors[self.word_ids[word]]
+
+
+    def keys(self):
+        return self.word_ids.keys()
+
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+
+    def ids(self, words):
+        '''
+        The int32 ids of many words, 0 ('mekene') for the words that are not in glove
+        '''
+        return self.vocabulary.ids(words)
+
+
+    def lookup(self, ids, dtype=np.float32):
+        '''
+        The (..., dim) vectors of an array of ids
+        '''
+        return np.take(self.vectors, ids, axis=0).astype(dtype, copy=False)
+
+
+
+def read_words(store_dir):
+    '''
+    The words of a store written by convert_glove or build_dataset_embeddings, in the order of their id
+    '''
+    with open(os.path.join(store_dir, WORDS_FILE), 'r') as f:
+        return f.read().split('\n')[:-1]
+
+
+
+def build_dataset_embeddings(store, glove, output_dir, min_count=1, column='norm_text', update_store=True, top_oov=50):
+    '''
+    This function builds the embedding table of the words of the receipts only (a few thousand rows instead of 400k),
+    in the format of convert_glove so that GloveStore loads it in milliseconds.
+    The ids are stable across rebuilds: the words of the previous table in output_dir keep their id,
+    and the new words are appended, the most frequent first. Id 0 is still 'mekene', the zero vector.
+    input:
+        store: the TokenStore of the receipts
+        glove: the GloveStore of the full glove vectors (or its directory)
+        output_dir: the directory of the table
+        min_count: the number of occurrences for a new word to enter the table
+        column: the column of the store holding the words (norm_text, after the corrections)
+        update_store: rewrite the token and token_id columns of the store with the words and ids of the table
+        top_oov: the number of most frequent out of vocabulary words listed in the coverage statistics
+    return:
+        the GloveStore of the table, the coverage statistics are written to coverage.json
+    '''
+    if not isinstance(glove, GloveStore):
+        glove = GloveStore(glove)
+
+    words = store.column(column)
+    counts = Counter(words.tolist())
+
+    vocabulary = read_words(output_dir) if os.path.exists(os.path.join(output_dir, WORDS_FILE)) else [OOV_WORD]
+    known = set(vocabulary)
+    new_words = sorted((word for word, count in counts.items()
+                        if count >= min_count and word in glove and word not in known and word != OOV_WORD),
+                       key=lambda word: (-counts[word], word))
+    vocabulary += new_words
+
+    #the vectors of the table, the words that left glove get the zero vector
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, VECTORS_FILE), glove.lookup(glove.ids(vocabulary), dtype=glove.vectors.dtype))
+    with open(os.path.join(output_dir, WORDS_FILE), 'w') as f:
+        f.write(''.join(word + '\n' for word in vocabulary))
+    table = GloveStore(output_dir, mmap=False)
+
+    token_ids = table.ids(words)
+    in_vocab = token_ids != OOV_ID
+    oov_counts = Counter(words[~in_vocab].tolist())
+
+    coverage = {'num_receipts': len(store),
+                'num_tokens': int(len(words)),
+                'num_tokens_in_vocab': int(in_vocab.sum()),
+                'token_coverage': float(in_vocab.mean()) if len(words) else 0.,
+                'num_distinct_words': len(counts),
+                'num_distinct_oov': len(oov_counts),
+                'vocabulary_size': len(vocabulary),
+                'num_new_words': len(new_words),
+                'min_count': min_count,
+                'top_oov': oov_counts.most_common(top_oov)}
+    with open(os.path.join(output_dir, COVERAGE_FILE), 'w') as f:
+        json.dump(coverage, f, indent=1)
+
+    if update_store:
+        store.column('token_id')[:] = token_ids
+        store.column('token')[:] = np.where(in_vocab, words, OOV_WORD)
+
+    print('{n} words in the table ({new} new), {coverage:.1%} of the tokens covered.'.format(
+        n=len(vocabulary), new=len(new_words), coverage=coverage['token_coverage']))
+
+    return table
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Convert the glove txt file, or build the embedding table of the receipts.')
+    parser.add_argument('command', choices=['convert', 'build'])
+    parser.add_argument('--glove', required=True, help='the glove txt file (convert) or the converted store (build)')
+    parser.add_argument('--output', required=True, help='the directory of the converted store or of the table')
+    parser.add_argument('--store', default=None, help='the token store of the receipts (build)')
+    parser.add_argument('--min-count', type=int, default=1)
+    parser.add_argument('--float16', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        convert_glove(args.glove, args.output, dtype=np.float16 if args.float16 else np.float32)
+    else:
+        token_store = TokenStore(args.store)
+        build_dataset_embeddings(token_store, args.glove, args.output, min_count=args.min_count)
+        token_store.save()
@@ -0,0 +1,142 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+
+
+
+class Boxes(object):
+    '''
+    A collection of axis aligned bboxes stored as a structure of arrays: x1, y1, x2, y2,
+    x1,y1 being the upper left corner and x2,y2 the lower right corner of each box.
+    Every operation works on the whole collection at once.
+    '''
+
+    def __init__(self, x1, y1, x2, y2, dtype=None):
+        '''
+        input:
+            x1, y1, x2, y2: the coordinates of the boxes, as arrays of the same length
+            dtype: int32 or float32, guessed from the coordinates if None
+        '''
+        x1, y1, x2, y2 = [np.asarray(c).reshape(-1) for c in (x1, y1, x2, y2)]
+        if dtype is None:
+            integer = all(np.issubdtype(c.dtype, np.integer) for c in (x1, y1, x2, y2))
+            dtype = np.int32 if integer else np.float32
+
+        self.x1 = x1.astype(dtype, copy=False)
+        self.y1 = y1.astype(dtype, copy=False)
+        self.x2 = x2.astype(dtype, copy=False)
+        self.y2 = y2.astype(dtype, copy=False)
+
+
+    @classmethod
+    def from_array(cls, boxes, dtype=None):
+        '''
+        The boxes of an (n, 4) array (or list) of [x1, y1, x2, y2]
+        '''
+        boxes = np.asarray(boxes)
+        if boxes.size == 0:
+            boxes = np.zeros((0, 4), dtype=np.int32 if dtype is None else dtype)
+        boxes = boxes.reshape(-1, 4)
+        return cls(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3], dtype=dtype)
+
+
+    def to_array(self):
+        '''
+        The (n, 4) array of [x1, y1, x2, y2]
+        '''
+        return np.stack([self.x1, self.y1, self.x2, self.y2], axis=1)
+
+
+    def __len__(self):
+        return len(self.x1)
+
+
+    def __getitem__(self, index):
+        return Boxes(self.x1[index], self.y1[index], self.x2[index], self.y2[index], dtype=self.x1.dtype)
+
+
+    def width(self):
+        return self.x2 - self.x1
+
+
+    def height(self):
+        return self.y2 - self.y1
+
+
+    def area(self):
+        return self.width() * self.height()
+
+
+    def centers(self):
+        '''
+        The (n, 2) float32 array of the (xc, yc) of each box
+        '''
+        return np.stack([(self.x1 + self.x2) / 2., (self.y1 + self.y2) / 2.], axis=1).astype(np.float32)
+
+
+    def scale(self, sx, sy=None):
+        '''
+        The boxes with their x coordinates multiplied by sx and their y coordinates by sy (sx if None), as float32
+        '''
+        sy = sx if sy is None else sy
+        return Boxes(self.x1 * sx, self.y1 * sy, self.x2 * sx, self.y2 * sy, dtype=np.float32)
+
+
+    def clip(self, width, height):
+        '''
+        The boxes clipped to an image of size (width, height)
+        '''
+        return Boxes(np.clip(self.x1, 0, width), np.clip(self.y1, 0, height),
+                     np.clip(self.x2, 0, width), np.clip(self.y2, 0, height), dtype=self.x1.dtype)
+
+
+    def union(self, other=None):
+        '''
+        The smallest box enclosing each pair of boxes of self and other,
+        or the one enclosing all the boxes of self if other is None
+        '''
+        if other is None:
+            return Boxes(self.x1.min(keepdims=True), self.y1.min(keepdims=True),
+                         self.x2.max(keepdims=True), self.y2.max(keepdims=True), dtype=self.x1.dtype)
+
+        return Boxes(np.minimum(self.x1, other.x1), np.minimum(self.y1, other.y1),
+                     np.maximum(self.x2, other.x2), np.maximum(self.y2, other.y2))
+
+
+
+def intersection_matrix(a, b):
+    '''
+    The (N, M) area of the intersection of every box of a with every box of b, 0 where they do not overlap
+    '''
+    width = np.minimum(a.x2[:, None], b.x2[None, :]) - np.maximum(a.x1[:, None], b.x1[None, :])
+    height = np.minimum(a.y2[:, None], b.y2[None, :]) - np.maximum(a.y1[:, None], b.y1[None, :])
+
+    # handle case where there is NO overlap
+    return np.where((width < 0) | (height < 0), 0, width * height)
+
+
+
+def iou_matrix(a, b, epsilon=1e-5):
+    '''
+    The Intersect of Union score of every box of a with every box of b, in one numpy call
+
+    input:
+        a:          Boxes, N boxes
+        b:          Boxes, M boxes
+        epsilon:    (float) Small value to prevent division by zero
+    return:
+        the (N, M) float64 array of the IoU scores
+    '''
+    area_overlap = intersection_matrix(a, b).astype(np.float64)
+
+    # COMBINED AREA
+    area_combined = a.area().astype(np.float64)[:, None] + b.area().astype(np.float64)[None, :] - area_overlap
+
+    # RATIO OF AREA OF OVERLAP OVER COMBINED AREA
+    return area_overlap / (area_combined + epsilon) #to avoid dividing by 0
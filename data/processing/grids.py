@@ -0,0 +1,332 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+import itertools
+from functools import lru_cache
+
+from data.processing.vocabulary import OOV_ID
+from data.processing.masks import load_mask, letterbox_mask
+
+try: #optional, compiles the search of the free cells
+    import numba
+except ImportError:
+    numba = None
+
+
+
+#the cells tried in turn when the cell of a token is taken: itself, then right, down, left and up (as final_grids)
+NEIGHBOURS = [(0, 0), (0, 1), (1, 0), (0, -1), (-1, 0)]
+
+SEARCHES = ['spiral', 'nearest', 'neighbours']
+
+
+
+def token_cells(xc, yc, grid_size, desired_image_size):
+    '''
+    This function returns the cell of the grid under the center of each token
+    input:
+        xc, yc: the centers of the tokens on the resized image (the xc and yc columns)
+        grid_size: if the target shape we want for the grid is (n,n), grid_size = n
+        desired_image_size: if the target shape we want for the image is (P,P), desired_image_size = P
+    return:
+        the rows and columns, as int32 arrays
+    '''
+    ratio = desired_image_size/grid_size #compute the ratio
+    rows = (np.asarray(yc, dtype=np.float64) / ratio).astype(np.int32)
+    cols = (np.asarray(xc, dtype=np.float64) / ratio).astype(np.int32)
+    return rows, cols
+
+
+
+@lru_cache(maxsize=16)
+def search_offsets(search, max_radius):
+    '''
+    This function returns the (dr, dc) offsets of the cells tried in turn around the cell of a token, itself first
+    input:
+        search: 'spiral' (ring after ring, each ring clockwise from the right),
+                'nearest' (by euclidean distance, the ties in spiral order)
+                or 'neighbours' (right, down, left, up)
+        max_radius: the largest ring searched
+    return:
+        the (k, 2) int32 array of the offsets, shared between the calls (read only)
+    '''
+    if search == 'neighbours':
+        offsets = np.array(NEIGHBOURS, dtype=np.int32)
+        offsets.flags.writeable = False
+        return offsets
+    if search not in SEARCHES:
+        raise ValueError('Unknown search {search}, use one of {searches}.'.format(search=search, searches=SEARCHES))
+
+    dr, dc = np.mgrid[-max_radius:max_radius + 1, -max_radius:max_radius + 1]
+    dr, dc = dr.ravel(), dc.ravel()
+    ring = np.maximum(np.abs(dr), np.abs(dc))
+    #clockwise on the image (the rows go down), starting on the right
+    angle = np.mod(np.arctan2(dr, dc), 2 * np.pi)
+
+    if search == 'spiral':
+        order = np.lexsort((angle, ring))
+    else:
+        order = np.lexsort((angle, ring, dr ** 2 + dc ** 2))
+    offsets = np.stack([dr[order], dc[order]], axis=1).astype(np.int32)
+    offsets.flags.writeable = False
+    return offsets
+
+
+
+def _search_free_cells(occupied, rows, cols, offsets, placed_rows, placed_cols):
+    #place each token on the first free cell of its offsets, in the order of the tokens (compiled by numba if available)
+    grid_rows, grid_cols = occupied.shape
+    for j in range(len(rows)):
+        for k in range(len(offsets)):
+            rr = rows[j] + offsets[k, 0]
+            cc = cols[j] + offsets[k, 1]
+            if 0 <= rr < grid_rows and 0 <= cc < grid_cols and not occupied[rr, cc]:
+                occupied[rr, cc] = True
+                placed_rows[j] = rr
+                placed_cols[j] = cc
+                break
+
+
+if numba is not None:
+    _search_free_cells = numba.njit(cache=True)(_search_free_cells)
+
+
+
+def _place_sequential(rows, cols, occupies, grid_size):
+    #final_grids: each token in turn takes the first free of its cell and the 4 neighbours, the cells out of the grid
+    #being taken (the token is dropped if none is free)
+    occupied = np.zeros((grid_size, grid_size), dtype=bool)
+    placed_rows = np.full(len(rows), -1, dtype=np.int32)
+    placed_cols = np.full(len(cols), -1, dtype=np.int32)
+
+    for j, (r, c, occupy) in enumerate(zip(rows.tolist(), cols.tolist(), occupies.tolist())):
+        for dr, dc in NEIGHBOURS:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < grid_size and 0 <= cc < grid_size and not occupied[rr, cc]:
+                placed_rows[j], placed_cols[j] = rr, cc
+                occupied[rr, cc] = occupy
+                break
+
+    return placed_rows, placed_cols
+
+
+
+def place_tokens(rows, cols, occupies, grid_size, search='spiral', max_radius=None):
+    '''
+    This function resolves the collisions of the tokens on the grid, deterministically.
+    First every token takes its own cell if no previous token has it (in one vectorized pass),
+    then each displaced token, in order, takes the first free cell of the search around its own cell,
+    on a boolean occupancy bitmap. A token is only dropped if no cell is free within max_radius.
+    search='neighbours' gives the former behaviour of final_grids instead (each token in turn, 4 neighbours only).
+    input:
+        rows, cols: the cells of the tokens (see token_cells), clipped to the grid
+        occupies: bool array, if the token takes its cell ('mekene' tokens, whose vector is 0, do not)
+            or an array of token ids (0 and the ids not computed yet, -1, do not take their cell, as in densify)
+        grid_size: the side of the grid
+        search: 'spiral', 'nearest' or 'neighbours' (see search_offsets)
+        max_radius: the largest ring searched, the whole grid if None
+    return:
+        the rows and columns where the tokens are placed, -1 for the dropped tokens
+    '''
+    rows, cols = np.asarray(rows, dtype=np.int32), np.asarray(cols, dtype=np.int32)
+    occupies = np.asarray(occupies)
+    if occupies.dtype != bool:
+        occupies = occupies > OOV_ID
+
+    if search == 'neighbours':
+        return _place_sequential(rows, cols, occupies, grid_size)
+
+    offsets = search_offsets(search, grid_size if max_radius is None else max_radius)
+    rows, cols = np.clip(rows, 0, grid_size - 1), np.clip(cols, 0, grid_size - 1)
+    placed_rows, placed_cols = rows.copy(), cols.copy() #the tokens that do not occupy stay on their own cell
+
+    #the first occupying token of each cell keeps it
+    occupying = np.flatnonzero(occupies)
+    _, first = np.unique(rows[occupying] * grid_size + cols[occupying], return_index=True)
+    occupied = np.zeros((grid_size, grid_size), dtype=bool)
+    occupied[rows[occupying[first]], cols[occupying[first]]] = True
+
+    #the other ones search for a free cell
+    displaced = np.setdiff1d(occupying, occupying[first])
+    if len(displaced):
+        displaced_rows = np.full(len(displaced), -1, dtype=np.int32)
+        displaced_cols = np.full(len(displaced), -1, dtype=np.int32)
+        _search_free_cells(occupied, rows[displaced], cols[displaced], offsets, displaced_rows, displaced_cols)
+        placed_rows[displaced], placed_cols[displaced] = displaced_rows, displaced_cols
+
+    return placed_rows, placed_cols
+
+
+
+def sparse_grids(store, grid_size, desired_image_size, receipt_ids=None, search='spiral', max_radius=None):
+    '''
+    This function computes the sparse grid of the receipts: the (grid_row, grid_col) of each token in the store,
+    the token_id column giving the content of the cell.
+    A receipt is then a few hundred (row, col, token_id) triples instead of a dense (n, n, 200) float64 array.
+    input:
+        store: the TokenStore, with the xc, yc and token_id columns computed (see process_receipt_tokens)
+        grid_size: if the target shape we want for the grid is (n,n), grid_size = n
+        desired_image_size: if the target shape we want for the image is (P,P), desired_image_size = P
+        receipt_ids: the receipts to compute, all of them if None
+        search, max_radius: the resolution of the collisions (see place_tokens)
+    return:
+        dict, the number of tokens, of tokens moved away from their cell and of dropped tokens
+    '''
+    receipt_ids = store.receipt_ids if receipt_ids is None else receipt_ids
+    xc, yc, token_ids = store.column('xc'), store.column('yc'), store.column('token_id')
+    grid_rows, grid_cols = store.column('grid_row'), store.column('grid_col')
+
+    stats = {'tokens': 0, 'moved': 0, 'dropped': 0}
+    for receipt_id in receipt_ids:
+        start, end = store.bounds(receipt_id)
+        rows, cols = token_cells(xc[start:end], yc[start:end], grid_size, desired_image_size)
+        placed_rows, placed_cols = place_tokens(rows, cols, token_ids[start:end], grid_size, search, max_radius)
+        grid_rows[start:end], grid_cols[start:end] = placed_rows, placed_cols
+
+        stats['tokens'] += end - start
+        stats['dropped'] += int((placed_rows < 0).sum())
+        rows, cols = np.clip(rows, 0, grid_size - 1), np.clip(cols, 0, grid_size - 1)
+        stats['moved'] += int(((placed_rows >= 0) & ((placed_rows != rows) | (placed_cols != cols))).sum())
+
+    print('{dropped} tokens dropped and {moved} moved to a free cell, out of {tokens}.'.format(**stats))
+    return stats
+
+
+
+def densify(store, receipt_ids, embeddings, grid_size, out=None, dtype=np.float32):
+    '''
+    This function fills the dense grids of a batch of receipts from their sparse grids,
+    with one gather of the embedding rows and one scatter into the buffer.
+    input:
+        store: the TokenStore holding the sparse grids
+        receipt_ids: the receipts of the batch
+        embeddings: the GloveStore (or (n, dim) array) whose ids are in the token_id column
+        grid_size: the side of the grids
+        out: the (batch, n, n, dim) buffer to fill, reused from batch to batch, allocated if None
+        dtype: the dtype of the allocated buffer, float32 or float16
+    return:
+        the buffer
+    '''
+    vectors = getattr(embeddings, 'vectors', embeddings)
+    if out is None:
+        out = np.empty((len(receipt_ids), grid_size, grid_size, vectors.shape[1]), dtype=dtype)
+    out[...] = 0
+
+    bounds = [store.bounds(receipt_id) for receipt_id in receipt_ids]
+    index = np.concatenate([np.arange(start, end) for start, end in bounds]) if bounds else np.zeros(0, dtype=np.int64)
+    batch = np.repeat(np.arange(len(bounds)), [end - start for start, end in bounds])
+
+    rows, cols, ids = store.column('grid_row')[index], store.column('grid_col')[index], store.column('token_id')[index]
+    #the dropped tokens, the 'mekene' tokens (zero vector) and the ids not computed yet (-1) are left out,
+    #so each cell is written once
+    keep = (rows >= 0) & (ids > OOV_ID)
+    out[batch[keep], rows[keep], cols[keep]] = np.take(vectors, ids[keep], axis=0)
+
+    return out
+
+
+
+def id_grids(store, receipt_ids, grid_size, out=None):
+    '''
+    This function fills the int32 grids of the token ids of a batch of receipts, for the models embedding the ids
+    themselves (200 times fewer bytes per sample than the dense grids of densify)
+    input:
+        store: the TokenStore holding the sparse grids
+        receipt_ids: the receipts of the batch
+        grid_size: the side of the grids
+        out: the (batch, n, n) int32 buffer to fill, allocated if None
+    return:
+        the buffer, 0 ('mekene') in the empty cells
+    '''
+    if out is None:
+        out = np.empty((len(receipt_ids), grid_size, grid_size), dtype=np.int32)
+    out[...] = OOV_ID
+
+    bounds = [store.bounds(receipt_id) for receipt_id in receipt_ids]
+    index = np.concatenate([np.arange(start, end) for start, end in bounds]) if bounds else np.zeros(0, dtype=np.int64)
+    batch = np.repeat(np.arange(len(bounds)), [end - start for start, end in bounds])
+
+    rows, cols, ids = store.column('grid_row')[index], store.column('grid_col')[index], store.column('token_id')[index]
+    keep = (rows >= 0) & (ids > OOV_ID) #the ids not computed yet (-1) are left to 0
+    out[batch[keep], rows[keep], cols[keep]] = ids[keep]
+
+    return out
+
+
+
+class SparseGridLoader(object):
+    '''
+    The batches (grids, masks) of the receipts of a store, the grids densified on the fly from the sparse grids,
+    or the grids of their token ids when no embeddings are given (for the networks built with embeddings).
+    It has the interface of a keras Sequence (len and indexing).
+    The batches are written into a ring of num_buffers preallocated buffers, so a batch is only overwritten
+    num_buffers batches later: keep it larger than the queue of fit (max_queue_size, 10 by default).
+    '''
+
+    def __init__(self, store, embeddings, grid_size, batch_size, mask_files, receipt_ids=None, shuffle=True,
+                 dtype=np.float32, num_buffers=12):
+        '''
+        input:
+            store: the TokenStore holding the sparse grids (see sparse_grids)
+            embeddings: the GloveStore (or (n, dim) array) whose ids are in the token_id column,
+                None to load the int32 grids of the ids
+            grid_size: the side of the grids
+            batch_size: the number of receipts of a batch
+            mask_files: dict, receipt id -> its mask at the size of the image (the mask_file column of the manifest),
+                letterboxed to the grid as the tokens (see masks.letterbox_mask)
+            receipt_ids: the receipts to load, all the receipts of the store if None
+            shuffle: shuffle the receipts at the end of each epoch
+            dtype: float32 or float16
+            num_buffers: the number of batches kept alive at once
+        '''
+        self.store = store
+        self.embeddings = embeddings
+        self.grid_size = grid_size
+        self.batch_size = batch_size
+        self.mask_files = mask_files
+        self.receipt_ids = list(store.receipt_ids if receipt_ids is None else receipt_ids)
+        self.shuffle = shuffle
+
+        missing = [receipt_id for receipt_id in self.receipt_ids if receipt_id not in mask_files]
+        if missing:
+            raise ValueError('No mask for the receipts {receipts}.'.format(receipts=missing[:10]))
+
+        if embeddings is None:
+            grids_shape, grids_dtype = (batch_size, grid_size, grid_size), np.int32
+        else:
+            grids_shape = (batch_size, grid_size, grid_size, getattr(embeddings, 'vectors', embeddings).shape[1])
+            grids_dtype = dtype
+        self.buffers = [(np.empty(grids_shape, dtype=grids_dtype),
+                         np.empty((batch_size, grid_size, grid_size, 1), dtype=dtype)) for _ in range(num_buffers)]
+        self._next_buffer = itertools.count() #thread safe, for the workers of fit
+        self.on_epoch_end()
+
+
+    def __len__(self):
+        return len(self.receipt_ids) // self.batch_size
+
+
+    def __getitem__(self, index):
+        batch = [self.receipt_ids[i] for i in self.indexes[index * self.batch_size:(index + 1) * self.batch_size]]
+        grids, masks = self.buffers[next(self._next_buffer) % len(self.buffers)]
+
+        if self.embeddings is None:
+            id_grids(self.store, batch, self.grid_size, out=grids)
+        else:
+            densify(self.store, batch, self.embeddings, self.grid_size, out=grids)
+        for i, receipt_id in enumerate(batch):
+            letterbox_mask(load_mask(self.mask_files[receipt_id]), self.grid_size, out=masks[i, :, :, 0])
+
+        return grids, masks
+
+
+    def on_epoch_end(self):
+        self.indexes = np.arange(len(self.receipt_ids))
+        if self.shuffle:
+            np.random.shuffle(self.indexes)
@@ -0,0 +1,290 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+from PIL import Image
+import multiprocessing
+import resource
+import time
+import cv2
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+#the reductions a jpeg can be decoded at, in the DCT domain
+REDUCTIONS = [8, 4, 2, 1]
+CV2_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR,
+                     2: cv2.IMREAD_REDUCED_COLOR_2,
+                     4: cv2.IMREAD_REDUCED_COLOR_4,
+                     8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+
+def target_dimensions(image_size, target_size):
+    '''
+    This function returns the (width, height) an image will be shrunk to
+    input:
+        image_size: the (width, height) of the image
+        target_size: the (width, height) it will be resized to, or an int: its long side (letterbox)
+    '''
+    w, h = image_size
+    if np.isscalar(target_size):
+        scale = target_size / max(w, h)
+        return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+    return tuple(target_size)
+
+
+
+def reduction_factor(image_size, target_size):
+    '''
+    This function returns the largest power of two reduction (8, 4, 2 or 1) keeping the image at least as large as the target
+    '''
+    if target_size is None:
+        return 1
+    w, h = image_size
+    tw, th = target_dimensions(image_size, target_size)
+    for factor in REDUCTIONS:
+        #a jpeg decoded at 1/factor is ceil(w/factor) wide
+        if -(-w // factor) >= tw and -(-h // factor) >= th:
+            return factor
+    return 1
+
+
+
+def load_image(image_path, target_size=None, backend='pil'):
+    '''
+    This function reads an image as a 3 channels uint8 RGB array.
+    When the image will be shrunk to target_size, a jpeg is decoded at the smallest power of two scale
+    still larger than the target (1/2, 1/4 or 1/8 in the DCT domain), which is several times faster and lighter
+    than decoding the multi-megapixel photos at full resolution. Other formats are fully decoded.
+    input:
+        image_path: the image path on disk
+        target_size: the (width, height) the image will be resized to, or an int: its long side, None for the full image
+        backend: 'pil' (Image.draft) or 'cv2' (IMREAD_REDUCED_COLOR_*, it releases the GIL while decoding)
+    return:
+        the (h, w, 3) uint8 array, and the (width, height) of the full image
+    '''
+    with Image.open(image_path) as img:
+        image_size = img.size
+        factor = reduction_factor(image_size, target_size) if img.format in ['JPEG', 'MPO'] else 1
+
+        if backend == 'pil':
+            if factor > 1:
+                #draft picks the largest reduction keeping the image at least as large as the requested size
+                img.draft('RGB', target_dimensions(image_size, target_size))
+            return np.asarray(img.convert('RGB')), image_size
+
+    if backend != 'cv2':
+        raise ValueError('Unknown backend {backend}, use \'pil\' or \'cv2\'.'.format(backend=backend))
+
+    image = cv2.imread(image_path, CV2_REDUCED_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None:
+        raise ValueError('Could not read the image \'{path:}\'.'.format(path=image_path))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), image_size
+
+
+
+def read_rgb(image_path, target_size=None):
+    '''
+    This function reads an image as a 3 channels uint8 RGB array, the gray and RGBA images being converted,
+    decoded at a reduced scale when target_size is given (see load_image).
+    cv2 releases the GIL while decoding, so it can be called from threads.
+    input:
+        image_path: the image path on disk
+        target_size: the (width, height) the image will be resized to, or an int: its long side, None for the full image
+    return:
+        the (h, w, 3) uint8 array
+    '''
+    return load_image(image_path, target_size, backend='cv2')[0]
+
+
+
+def letterbox(image, desired_dimension, interpolation=cv2.INTER_NEAREST, pad_value=0, center=False, out=None):
+    '''
+    This function resizes an image into a (n,n) square without changing its aspect ratio, the rest being padded.
+    The image is resized first, then copied into the square with one slice assignment:
+    the padding is never resized and the dtype (uint8) is kept.
+    input:
+        image: the (h, w) or (h, w, c) image
+        desired_dimension: if the target shape we want is (n,n), desired_dimension = n
+        interpolation: the cv2 interpolation
+        pad_value: the value of the padding
+        center: center the image in the square, otherwise it is in the upper left corner (as get_relative_centers expects)
+        out: an array of shape (n, n) or (n, n, c) to write into, allocated if None
+    return:
+        the square image, and the transform (scale, dx, dy): a point (x, y) of the image goes to (x*scale + dx, y*scale + dy)
+    '''
+    h, w = image.shape[:2]
+    scale = desired_dimension / max(h, w)
+    new_w = min(desired_dimension, max(1, int(round(w * scale))))
+    new_h = min(desired_dimension, max(1, int(round(h * scale))))
+    dx, dy = ((desired_dimension - new_w) // 2, (desired_dimension - new_h) // 2) if center else (0, 0)
+
+    if out is None:
+        out = np.empty((desired_dimension, desired_dimension) + image.shape[2:], dtype=image.dtype)
+    out[...] = pad_value
+
+    resized = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    window = out[dy:dy + new_h, dx:dx + new_w]
+    window[...] = resized.reshape(window.shape) #cv2 drops the channel axis of (h, w, 1) images
+
+    return out, (scale, dx, dy)
+
+
+
+def padded_shape(image_size, desired_dimension, multiple=8):
+    '''
+    This function returns the (height, width) of an image resized by its long side and padded to a multiple
+    input:
+        image_size: the (width, height) of the image
+        desired_dimension: the long side after resizing
+        multiple: the multiple the sides are padded to (the output stride the network needs)
+    '''
+    w, h = target_dimensions(image_size, desired_dimension)
+    return -(-h // multiple) * multiple, -(-w // multiple) * multiple
+
+
+
+def fit_long_side(image, desired_dimension, multiple=8, interpolation=cv2.INTER_NEAREST, pad_value=0, out=None,
+                  image_size=None):
+    '''
+    This function resizes an image by its long side without changing its aspect ratio, and pads it to the bottom and
+    to the right up to the next multiple only, instead of a square: a tall receipt keeps a narrow input.
+    input:
+        image: the (h, w) or (h, w, c) image
+        desired_dimension: the long side after resizing
+        multiple: the multiple the sides are padded to
+        interpolation: the cv2 interpolation
+        pad_value: the value of the padding
+        out: an array at least as large as the padded image to write into (the batch buffer, padded to the largest
+             image of the batch), allocated with the padded shape if None
+        image_size: the (width, height) of the full image, when image was decoded at a reduced scale (see load_image):
+             the resized size is computed from it, so an image and its mask resized from different sizes stay aligned
+    return:
+        the padded image, and the transform (scale, 0, 0) of the full image, as for letterbox
+    '''
+    w, h = (image.shape[1], image.shape[0]) if image_size is None else image_size
+    scale = desired_dimension / max(h, w)
+    new_w, new_h = target_dimensions((w, h), desired_dimension)
+
+    if out is None:
+        out = np.empty(padded_shape((w, h), desired_dimension, multiple) + image.shape[2:], dtype=image.dtype)
+    if out.shape[0] < new_h or out.shape[1] < new_w:
+        raise ValueError('The output {shape} is smaller than the resized image {size}.'.format(shape=out.shape[:2],
+                                                                                              size=(new_h, new_w)))
+    out[...] = pad_value
+
+    resized = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+    window = out[:new_h, :new_w]
+    window[...] = resized.reshape(window.shape)
+
+    return out, (scale, 0, 0)
+
+
+
+def transform_boxes(boxes, transform):
+    '''
+    This function maps Boxes of the original image onto the letterboxed image
+    '''
+    scale, dx, dy = transform
+    scaled = boxes.scale(scale)
+    scaled.x1 += dx
+    scaled.x2 += dx
+    scaled.y1 += dy
+    scaled.y2 += dy
+    return scaled
+
+
+
+def resize_many(list_of_paths, desired_dimension, output_dir=None, num_workers=8, **kwargs):
+    '''
+    This function letterboxes many images with a pool of threads (reading, resizing and writing release the GIL)
+    input:
+        list_of_paths: the paths of the images
+        desired_dimension: if the target shape we want is (n,n), desired_dimension = n
+        output_dir: the directory where the squares are written (png, same names), None to return them
+        num_workers: the number of threads
+        kwargs: the other arguments of letterbox
+    return:
+        the list of (square image or written path, transform), in the order of list_of_paths
+    '''
+    def resize_one(image_path):
+        image, (w, h) = load_image(image_path, desired_dimension, backend='cv2')
+        square, (_, dx, dy) = letterbox(image, desired_dimension, **kwargs)
+        #the transform of the full image, whatever the scale it was decoded at
+        transform = (desired_dimension / max(w, h), dx, dy)
+        if output_dir is None:
+            return square, transform
+
+        path = os.path.join(output_dir, os.path.splitext(os.path.basename(image_path))[0] + '.png')
+        cv2.imwrite(path, cv2.cvtColor(square, cv2.COLOR_RGB2BGR))
+        return path, transform
+
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    with ThreadPoolExecutor(num_workers) as executor:
+        return list(executor.map(resize_one, list_of_paths))
+
+
+
+def _memory_status(field):
+    #a memory field of /proc/self/status (VmRSS, VmHWM) in kB, None if it is not available
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+
+def _decode_worker(list_of_paths, target_size, backend):
+    #decode the images in a fresh process, to measure the growth of its peak memory.
+    #ru_maxrss is kept across exec, so on linux the peak (VmHWM) is reset through clear_refs
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        baseline = _memory_status('VmRSS')
+    except OSError:
+        baseline = None
+    if baseline is None:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.time()
+    for image_path in list_of_paths:
+        load_image(image_path, target_size, backend)
+    seconds = time.time() - start
+
+    peak = _memory_status('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return seconds / max(len(list_of_paths), 1), (peak - baseline) / 1024.
+
+
+
+def benchmark_decode(list_of_paths, target_size, backend='pil'):
+    '''
+    This function compares the full decode with the reduced decode of load_image
+    input:
+        list_of_paths: the paths of the images
+        target_size: the (width, height) or long side the images are resized to
+        backend: 'pil' or 'cv2'
+    return:
+        dict, for 'full' and 'reduced': the mean decode time in seconds and the growth of the peak RSS in MB
+    '''
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for mode, size in [('full', None), ('reduced', target_size)]:
+        with context.Pool(1) as pool:
+            seconds, peak_rss = pool.apply(_decode_worker, (list(list_of_paths), size, backend))
+        results[mode] = {'decode_seconds': seconds, 'peak_rss_mb': peak_rss}
+        print('{mode}: {seconds:.1f} ms per image, peak RSS +{rss:.0f} MB'.format(mode=mode, seconds=1000 * seconds,
+                                                                                rss=peak_rss))
+
+    return results
@@ -0,0 +1,265 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+import cv2
+import time
+import os
+
+from data.processing.geometry import Boxes
+
+
+
+def rasterize_boxes(boxes, width, height, out_size=None, overlap='union'):
+    '''
+    This function paints all the boxes of a receipt at once, in O(H*W + N).
+    A +1/-1 is written at the four corners of each box in a 2-D difference array,
+    and two cumulative sums give the number of boxes covering each pixel.
+
+    input:
+        boxes: the Boxes to paint, in the coordinates of the image
+        width, height: the size of the image
+        out_size: (width, height) of the mask, the boxes are scaled to it, the image size if None
+        overlap: 'union' paints every pixel covered by a box,
+                 'erase' leaves the pixels covered by several boxes to 0 (the former behaviour of get_masks)
+    return:
+        the (height, width) uint8 mask of 0s and 1s
+    '''
+    assert overlap in ['union', 'erase']
+
+    if out_size is not None:
+        out_width, out_height = out_size
+        scaled = boxes.scale(out_width / width, out_height / height)
+        #floor and ceil, so that a small token does not vanish at the training resolution
+        boxes = Boxes(np.floor(scaled.x1), np.floor(scaled.y1), np.ceil(scaled.x2), np.ceil(scaled.y2), dtype=np.int32)
+        width, height = out_width, out_height
+
+    boxes = boxes.clip(width, height)
+    keep = (boxes.x2 > boxes.x1) & (boxes.y2 > boxes.y1)
+    x1, y1, x2, y2 = [c[keep].astype(np.intp) for c in (boxes.x1, boxes.y1, boxes.x2, boxes.y2)]
+
+    #the counts fit in 16 bits unless more than 32767 boxes overlap
+    dtype = np.int16 if len(x1) < 2 ** 15 else np.int32
+    diff = np.zeros((height + 1, width + 1), dtype=dtype)
+    np.add.at(diff, (y1, x1), 1)
+    np.add.at(diff, (y1, x2), -1)
+    np.add.at(diff, (y2, x1), -1)
+    np.add.at(diff, (y2, x2), 1)
+
+    counts = np.cumsum(np.cumsum(diff, axis=0, dtype=dtype), axis=1, dtype=dtype)[:height, :width]
+
+    if overlap == 'union':
+        return (counts > 0).astype(np.uint8)
+    return (counts == 1).astype(np.uint8)
+
+
+
+def encode_mask(mask):
+    '''
+    This function run-length encodes a single channel uint8 class map, row after row.
+    Only the runs of non zero pixels are kept, which makes the mostly empty receipts a few hundred bytes.
+
+    input:
+        mask: the (height, width) uint8 class map
+    return:
+        dict of arrays: shape, starts (flat index of each run), lengths and values (class of each run)
+    '''
+    flat = np.ascontiguousarray(mask, dtype=np.uint8).reshape(-1)
+
+    #the flat indexes where the class changes
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [flat.size]])
+    values = flat[starts] if flat.size else np.zeros(0, dtype=np.uint8)
+
+    keep = values != 0
+    return {'shape': np.asarray(mask.shape[:2], dtype=np.int64),
+            'starts': starts[keep].astype(np.uint32),
+            'lengths': (ends - starts)[keep].astype(np.uint32),
+            'values': values[keep]}
+
+
+
+def decode_mask(rle, out=None):
+    '''
+    This function decodes a run-length encoded mask, directly into out when it is given,
+    so no intermediate mask is allocated.
+
+    input:
+        rle: the dict returned by encode_mask (or the npz file holding it)
+        out: a contiguous array of shape (height, width) or (height, width, 1) of any numeric dtype, None to allocate one
+    return:
+        the decoded mask (out when given)
+    '''
+    height, width = [int(c) for c in rle['shape']]
+    if out is None:
+        out = np.empty((height, width), dtype=np.uint8)
+    assert out.size == height * width and out.flags['C_CONTIGUOUS']
+
+    starts = rle['starts'].astype(np.intp)
+    ends = starts + rle['lengths'].astype(np.intp)
+    values = rle['values'].astype(out.dtype)
+
+    flat = out.reshape(-1)
+    flat[:] = 0
+    if len(starts) * 64 < flat.size:
+        #few runs (the usual mostly empty receipt): fill each run
+        for start, end, value in zip(starts.tolist(), ends.tolist(), values.tolist()):
+            flat[start:end] = value
+    else:
+        #many runs: write +value/-value at the start/end of each run and fill them with a cumulative sum,
+        #the unsigned dtypes wrap around and the cumulative sum still gives back the values
+        inside = ends < flat.size
+        flat[starts] = values
+        flat[ends[inside]] -= values[inside]
+        np.cumsum(flat, out=flat)
+
+    return out
+
+
+
+def save_mask(path, mask):
+    '''
+    This function saves a class map losslessly:
+    run-length encoded if path ends with .npz, as a single channel png if path ends with .png
+    '''
+    if path.endswith('.npz'):
+        np.savez(path, **encode_mask(mask))
+    elif path.endswith('.png'):
+        Image.fromarray(np.asarray(mask, dtype=np.uint8)).save(path)
+    else:
+        raise ValueError('The mask format of \'{path:}\' is not supported, use .npz or .png.'.format(path=path))
+
+
+
+def load_mask(path, out=None):
+    '''
+    This function loads a class map saved by save_mask (or a former RGB jpeg mask, thresholded on its first channel)
+    input:
+        path: the path of the mask
+        out: the array (or view of a batch buffer) to decode into, of shape (height, width) or (height, width, c),
+             the mask goes to its first channel and is resized to it (nearest neighbour) when the shapes differ
+    return:
+        the mask (out when given)
+    '''
+    if path.endswith('.npz'):
+        with np.load(path) as rle:
+            rle = dict(rle)
+        shape = tuple(int(c) for c in rle['shape'])
+        if out is not None and out.shape[:2] == shape and out.flags['C_CONTIGUOUS'] and out.size == rle['shape'].prod():
+            return decode_mask(rle, out)
+        mask = decode_mask(rle)
+    else:
+        with Image.open(path) as img:
+            mask = np.asarray(img)
+        if mask.ndim == 3: #the former jpeg masks, 0s and 1s on each channel plus compression noise
+            mask = (mask[:, :, 0] >= 1).astype(np.uint8)
+
+    if out is None:
+        return mask
+
+    if out.shape[:2] != mask.shape:
+        mask = cv2.resize(mask, (out.shape[1], out.shape[0]), interpolation=cv2.INTER_NEAREST)
+    if out.ndim == 3:
+        out[:, :, 0] = mask
+    else:
+        out[:] = mask
+    return out
+
+
+
+def letterbox_mask(mask, desired_dimension, out=None):
+    '''
+    This function brings a class map to the frame of the grids (or of the letterboxed images): resized by its long side
+    to desired_dimension, anchored top-left and padded with 0s to the bottom and to the right,
+    as the centers of the tokens (see process_receipt_tokens and grids.token_cells).
+    Each cell takes the largest class of the pixels it covers, so a cell holding the center of a token of a zone is
+    never missed when the mask is shrunk, as a nearest neighbour resize would.
+    input:
+        mask: the (height, width) class map at the size of the image
+        desired_dimension: the long side after resizing, the side of the grid
+        out: the (desired_dimension, desired_dimension) array (or view of a batch buffer) to write into, allocated if None
+    return:
+        the letterboxed mask (out when given)
+    '''
+    height, width = mask.shape[:2]
+    scale = max(height, width) / desired_dimension #the pixels per cell
+    if out is None:
+        out = np.empty((desired_dimension, desired_dimension), dtype=mask.dtype)
+
+    def pool(x, length, axis):
+        #the cell i covers the pixels floor(i * scale) to ceil((i + 1) * scale)
+        n = max(1, int(round(length / scale)))
+        edges = np.arange(n + 1) * scale
+        starts = np.minimum(np.floor(edges[:-1]).astype(np.intp), length - 1)
+        ends = np.clip(np.ceil(edges[1:]).astype(np.intp), starts + 1, length)
+        #reduceat stops each cell at the start of the next one, the pixel shared by both is added back
+        pooled = np.maximum.reduceat(np.take(x, np.arange(ends[-1]), axis=axis), starts, axis=axis)
+        return np.maximum(pooled, np.take(x, ends - 1, axis=axis))
+
+    pooled = pool(pool(np.asarray(mask), height, 0), width, 1)
+    out[...] = 0
+    out[:pooled.shape[0], :pooled.shape[1]] = pooled
+    return out
+
+
+
+def convert_jpeg_masks(jpeg_paths, output_dir, format='npz'):
+    '''
+    This function converts the former RGB jpeg masks written by get_masks to the lossless formats.
+    Masks regenerated with get_mask from the annotations are exact, this conversion thresholds the jpeg noise away.
+    input:
+        jpeg_paths: list, the paths of the jpeg masks
+        output_dir: the directory of the converted masks
+        format: 'npz' (run-length encoded) or 'png' (single channel)
+    return:
+        the list of the paths of the converted masks
+    '''
+    paths = []
+    for jpeg_path in tqdm(jpeg_paths):
+        name = os.path.splitext(os.path.basename(jpeg_path))[0]
+        path = os.path.join(output_dir, f'{name}.{format}')
+        save_mask(path, load_mask(jpeg_path))
+        paths.append(path)
+
+    return paths
+
+
+
+def benchmark_mask_formats(masks, output_dir, repeat=5):
+    '''
+    This function measures the disk size and decode time of the mask formats (jpeg as written before, png, npz).
+    input:
+        masks: list of uint8 class maps
+        output_dir: a scratch directory
+        repeat: the number of decodings timed per mask
+    return:
+        dict, for each format: the total bytes and the mean decode time in seconds
+    '''
+    results = {}
+    for format in ['jpg', 'png', 'npz']:
+        nbytes, seconds = 0, 0.
+        for k, mask in enumerate(masks):
+            path = os.path.join(output_dir, f'mask{k}.{format}')
+            if format == 'jpg':
+                Image.fromarray(mask).convert('RGB').save(path)
+            else:
+                save_mask(path, mask)
+            nbytes += os.path.getsize(path)
+
+            out = np.empty(mask.shape, dtype=np.float32)
+            start = time.time()
+            for _ in range(repeat):
+                load_mask(path, out)
+            seconds += (time.time() - start) / repeat
+
+        results[format] = {'bytes': nbytes, 'decode_seconds': seconds / max(len(masks), 1)}
+
+    return results
@@ -0,0 +1,448 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import multiprocessing
+import argparse
+import hashlib
+import sqlite3
+import json
+import time
+import os
+
+import pandas as pd
+from tqdm import tqdm
+
+from data.processing import data_manipulation as dm
+from data.processing.masks import save_mask
+from data.processing.token_store import TokenStore, ZONE_COLUMNS
+from data.processing.embeddings import GloveStore
+from data.processing.vocabulary import Vocabulary
+
+
+
+DATA_DIR = '/home/meteor21/CUTIE_mekene/data'
+
+MANIFEST_COLUMNS = ['receipt_id', 'csv_file', 'zone_file', 'centers_file', 'glove_file', 'grid_file', 'mask_file']
+
+#the heavy inputs of the current worker, loaded once by the pool initializer
+_SHARED = {}
+
+
+
+def make_manifest(receipt_ids, data_dir=DATA_DIR):
+    '''
+    This function returns the manifest of the receipts: the input files of every stage for each receipt
+    input:
+        receipt_ids: list, the ids of the receipts ('1107_receipt')
+        data_dir: the data directory holding the stage directories
+    return:
+        the manifest dataframe, one row per receipt
+    '''
+    numbers = [r.rsplit('_receipt', 1)[0] for r in receipt_ids]
+    return pd.DataFrame({'receipt_id': receipt_ids,
+                         'csv_file': [f'{data_dir}/csv_files/{r}.csv' for r in receipt_ids],
+                         'zone_file': [f'{data_dir}/200receipts_csv_onebyone/{r}.csv' for r in receipt_ids],
+                         'centers_file': [f'{data_dir}/csv_files_with_centers/{r}_centers.csv' for r in receipt_ids],
+                         'glove_file': [f'{data_dir}/csv_files_replace_after_Glove/{r}_centers.csv' for r in receipt_ids],
+                         'grid_file': [f'{data_dir}/final_grids/{r}.npy' for r in receipt_ids],
+                         'mask_file': [f'{data_dir}/200receipts_masks/{z}-receipt.npz' for z in numbers]})
+
+
+
+def load_manifest(path, data_dir=DATA_DIR):
+    '''
+    This function reads a manifest: a csv file with at least a 'receipt_id' column,
+    or a text file with one receipt id per line
+    input:
+        path: the manifest file
+        data_dir: the data directory of the files of the receipts, when the manifest only gives their ids
+    '''
+    if path.endswith('.csv'):
+        manifest = pd.read_csv(path)
+        if not set(MANIFEST_COLUMNS) <= set(manifest.columns):
+            manifest = make_manifest(manifest['receipt_id'].tolist(), data_dir)
+        return manifest
+
+    with open(path, 'r') as f:
+        return make_manifest([line.strip() for line in f if line.strip()], data_dir)
+
+
+
+def load_glove(glove_path):
+    #the store written by embeddings.convert_glove (memory mapped, shared by the workers) or the glove txt file
+    return GloveStore(glove_path) if os.path.isdir(glove_path) else dm.myGloveDict(glove_path)
+
+
+def load_vocabulary(glove_path):
+    return Vocabulary.from_glove(glove_path)
+
+
+def load_corrections(corrections_file):
+    with open(corrections_file, 'r') as f:
+        return json.load(f)
+
+
+def load_zones(zones_path):
+    return TokenStore(zones_path, columns=ZONE_COLUMNS)
+
+
+
+#the stages: a module level function of (row, shared inputs, stage parameters) so that the workers can pickle it,
+#each stage writes to the files of the row
+def relative_centers_stage(row, shared, desired_shape=480):
+    dm.get_relative_centers(row['csv_file'], desired_shape, output_file=row['centers_file'])
+
+
+def replace_after_glove_stage(row, shared):
+    dm.replace_after_Glove(row['centers_file'], shared['glove_keys'], output_file=row['glove_file'])
+
+
+def tokens_stage(row, shared, desired_shape=480):
+    corrections = shared.get('corrections', dm.LEVENSHTEIN_CORRECTIONS)
+    dm.process_receipt_tokens(row['csv_file'], desired_shape, shared['word_ids'], corrections,
+                              output_file=row['glove_file'])
+
+
+def final_grids_stage(row, shared, grid_size=120, desired_image_size=480):
+    dm.final_grids(row['glove_file'], grid_size, desired_image_size, shared['myglovedico'], output_file=row['grid_file'])
+
+
+def masks_stage(row, shared, out_size=None, overlap='union'):
+    z = row['receipt_id'].rsplit('_receipt', 1)[0]
+    mask = dm.get_mask(z, shared.get('store'), shared.get('zones'), out_size, overlap,
+                       csv_file=row['csv_file'], zone_file=row['zone_file'])
+    save_mask(row['mask_file'], mask)
+
+
+
+#name -> (stage function, the shared inputs it needs: name -> (loader, the parameter holding the loader argument))
+STAGES = {'relative_centers': (relative_centers_stage, {}),
+          'replace_after_Glove': (replace_after_glove_stage, {'glove_keys': (load_vocabulary, 'glove_path')}),
+          'tokens': (tokens_stage, {'word_ids': (load_vocabulary, 'glove_path'),
+                                    'corrections': (load_corrections, 'corrections_path')}),
+          'final_grids': (final_grids_stage, {'myglovedico': (load_glove, 'glove_path')}),
+          'masks': (masks_stage, {'store': (TokenStore, 'store_path'),
+                                  'zones': (load_zones, 'zones_path')})}
+
+#the manifest columns read and written by each stage, and the stages it depends on
+STAGE_INPUTS = {'relative_centers': ['csv_file'],
+                'replace_after_Glove': ['centers_file'],
+                'tokens': ['csv_file'],
+                'final_grids': ['glove_file'],
+                'masks': ['csv_file', 'zone_file']}
+STAGE_OUTPUTS = {'relative_centers': 'centers_file',
+                 'replace_after_Glove': 'glove_file',
+                 'tokens': 'glove_file',
+                 'final_grids': 'grid_file',
+                 'masks': 'mask_file'}
+DEPENDENCIES = {'relative_centers': [],
+                'replace_after_Glove': ['relative_centers'],
+                'tokens': [],
+                'final_grids': ['tokens'],
+                'masks': []}
+
+
+
+def _init_worker(stage_name, sources):
+    #load the heavy inputs once per worker, not once per task
+    _, loaders = STAGES[stage_name]
+    _SHARED.clear()
+    for name, (loader, param) in loaders.items():
+        if sources.get(param) is not None:
+            _SHARED[name] = loader(sources[param])
+
+
+def _run_task(task):
+    stage_name, row, params = task
+    func, _ = STAGES[stage_name]
+    return row['receipt_id'], func(row, _SHARED, **params)
+
+
+
+def run_stage(stage_name, manifest, num_workers=None, chunksize=None, ordered=True, sources=None, callback=None,
+              **params):
+    '''
+    This function runs a stage over every receipt of the manifest on a process pool
+    input:
+        stage_name: a key of STAGES
+        manifest: the manifest dataframe (see make_manifest)
+        num_workers: the number of processes, the number of cores if None
+        chunksize: the number of receipts sent to a worker at once, about 4 chunks per worker if None
+        ordered: collect the results in the order of the manifest, or as soon as they are ready
+        sources: dict, the paths of the shared inputs (glove_path, store_path, zones_path), loaded once per worker
+        callback: called with (receipt_id, result) as soon as each receipt is done
+        params: the parameters of the stage (desired_shape, grid_size, ...)
+    return:
+        the list of (receipt_id, result) and the throughput in receipts/sec
+    '''
+    if stage_name not in STAGES:
+        raise ValueError('The stage {stage} is not in the supported stage list {stages}!!!'.format(stage=stage_name,
+                                                                                                   stages=list(STAGES)))
+    num_workers = multiprocessing.cpu_count() if num_workers is None else num_workers
+    chunksize = max(1, len(manifest) // (4 * num_workers)) if chunksize is None else chunksize
+    tasks = [(stage_name, row, params) for row in manifest.to_dict('records')]
+    for directory in set(os.path.dirname(path) for path in manifest[STAGE_OUTPUTS[stage_name]]):
+        os.makedirs(directory, exist_ok=True)
+
+    start = time.time()
+    with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(stage_name, sources or {})) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        results = []
+        for receipt_id, result in tqdm(imap(_run_task, tasks, chunksize=chunksize), total=len(tasks), desc=stage_name):
+            if callback is not None:
+                callback(receipt_id, result)
+            results.append((receipt_id, result))
+    elapsed = time.time() - start
+
+    throughput = len(tasks) / elapsed if elapsed > 0 else 0.
+    print('{stage}: {num} receipts in {elapsed:.1f}s, {speed:.1f} receipts/sec with {workers} workers.'.format(
+        stage=stage_name, num=len(tasks), elapsed=elapsed, speed=throughput, workers=num_workers))
+
+    return results, throughput
+
+
+
+class PipelineState(object):
+    '''
+    The record of what the pipeline has computed, in a sqlite file.
+    For each stage and receipt, it keeps the key (a hash of the content of the inputs and of the stage parameters)
+    the output was computed from. A receipt whose key changed, or whose output is missing, is stale.
+    Each receipt is recorded as soon as it is done, so a crashed run loses at most the receipts in flight.
+    '''
+
+    def __init__(self, state_path):
+        self.connection = sqlite3.connect(state_path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, '
+                                'mtime_ns INTEGER, digest TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS records (stage TEXT, receipt_id TEXT, key TEXT, '
+                                'PRIMARY KEY (stage, receipt_id))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                'config TEXT, stages_done TEXT, finished INTEGER)')
+        self.connection.commit()
+
+    def file_digest(self, path):
+        '''
+        The sha1 of the content of a file (None if it does not exist), only read again when its size or mtime changed
+        '''
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        row = self.connection.execute('SELECT digest FROM files WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                      (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def source_digest(self, path):
+        #the identity of a shared input (a file, or the chunks of a store directory)
+        if path is not None and os.path.isdir(path):
+            return hashlib.sha1(''.join(self.file_digest(os.path.join(path, name)) or ''
+                                        for name in sorted(os.listdir(path))).encode()).hexdigest()
+        return self.file_digest(path) if path is not None else None
+
+    def get(self, stage_name, receipt_id):
+        row = self.connection.execute('SELECT key FROM records WHERE stage = ? AND receipt_id = ?',
+                                      (stage_name, receipt_id)).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, stage_name, receipt_id, key):
+        self.connection.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?)', (stage_name, receipt_id, key))
+        self.connection.commit()
+
+    def start_run(self, config):
+        cursor = self.connection.execute('INSERT INTO runs (config, stages_done, finished) VALUES (?, ?, 0)',
+                                         (json.dumps(config), json.dumps([])))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def last_unfinished_run(self):
+        row = self.connection.execute('SELECT run_id, config, stages_done FROM runs WHERE finished = 0 '
+                                      'ORDER BY run_id DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def stage_done(self, run_id, stages_done):
+        self.connection.execute('UPDATE runs SET stages_done = ? WHERE run_id = ?', (json.dumps(stages_done), run_id))
+        self.connection.commit()
+
+    def finish_run(self, run_id):
+        self.connection.execute('UPDATE runs SET finished = 1 WHERE run_id = ?', (run_id,))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+
+def plan_stages(targets):
+    '''
+    This function returns the stages to run for the targets, each after the stages it depends on
+    '''
+    order = []
+
+    def visit(stage_name):
+        for dependency in DEPENDENCIES[stage_name]:
+            visit(dependency)
+        if stage_name not in order:
+            order.append(stage_name)
+
+    for target in targets:
+        visit(target)
+    return order
+
+
+
+def _receipt_digest(store, receipt_id):
+    #the content of the rows of a receipt in a token store
+    if store is None or receipt_id not in store:
+        return None
+    tokens = store.receipt(receipt_id)
+    sha = hashlib.sha1()
+    for name in sorted(tokens):
+        sha.update(name.encode())
+        sha.update(tokens[name].astype(str).tobytes() if tokens[name].dtype == object else tokens[name].tobytes())
+    return sha.hexdigest()
+
+
+
+def stale_receipts(state, stage_name, manifest, sources, params, stores=None):
+    '''
+    This function returns the rows of the manifest whose output is missing or was computed from other inputs
+    input:
+        state: the PipelineState
+        stage_name: a key of STAGES
+        manifest: the manifest dataframe
+        sources: dict, the paths of the shared inputs
+        params: the parameters of the stage
+        stores: dict, the loaded token stores the stage reads per receipt ('store', 'zones')
+    return:
+        the stale rows of the manifest, and the key of each of them
+    '''
+    _, loaders = STAGES[stage_name]
+    #the stage parameters and the shared inputs (glove file, ...) are part of every key
+    common = json.dumps({'stage': stage_name,
+                         'params': params,
+                         'sources': {param: state.source_digest(sources.get(param))
+                                     for _, param in loaders.values() if param not in ['store_path', 'zones_path']}},
+                        sort_keys=True, default=str)
+
+    stale, keys = [], {}
+    for row in manifest.to_dict('records'):
+        parts = [common] + [state.file_digest(row[column]) or '' for column in STAGE_INPUTS[stage_name]]
+        parts += [_receipt_digest(store, row['receipt_id']) or '' for _, store in sorted((stores or {}).items())]
+        key = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+        if state.get(stage_name, row['receipt_id']) != key or not os.path.exists(row[STAGE_OUTPUTS[stage_name]]):
+            stale.append(row)
+            keys[row['receipt_id']] = key
+
+    return pd.DataFrame(stale, columns=manifest.columns), keys
+
+
+
+def run_incremental(targets, manifest, state_path, num_workers=None, chunksize=None, resume=False,
+                    sources=None, stage_params=None):
+    '''
+    This function runs the stages needed by the targets, only on the stale receipts of each stage.
+    input:
+        targets: list, the stages wanted ('final_grids', 'masks', ...), their dependencies are run first
+        manifest: the manifest dataframe
+        state_path: the sqlite file recording what has been computed
+        num_workers, chunksize: see run_stage
+        resume: continue the last run that did not finish (same targets, sources and parameters),
+            skipping the stages it completed
+        sources: dict, the paths of the shared inputs
+        stage_params: dict, the parameters of each stage
+    return:
+        dict, the number of recomputed receipts of each stage
+    '''
+    state = PipelineState(state_path)
+    try:
+        config = {'targets': list(targets), 'sources': sources or {}, 'stage_params': stage_params or {}}
+        stages_done = []
+
+        unfinished = state.last_unfinished_run() if resume else None
+        if unfinished is not None:
+            run_id, config, stages_done = unfinished
+            print('Resuming run {run} after the stages {stages}.'.format(run=run_id, stages=stages_done))
+        else:
+            run_id = state.start_run(config)
+
+        sources, stage_params = config['sources'], config['stage_params']
+        computed = {}
+        for stage_name in plan_stages(config['targets']):
+            if stage_name in stages_done:
+                continue
+
+            params = stage_params.get(stage_name, {})
+            stores = {}
+            if stage_name == 'masks':
+                stores = {'store': TokenStore(sources.get('store_path')) if sources.get('store_path') else None,
+                          'zones': load_zones(sources['zones_path']) if sources.get('zones_path') else None}
+
+            stale, keys = stale_receipts(state, stage_name, manifest, sources, params, stores)
+            print('{stage}: {stale}/{total} receipts to compute.'.format(stage=stage_name, stale=len(stale),
+                                                                          total=len(manifest)))
+            if len(stale):
+                run_stage(stage_name, stale, num_workers=num_workers, chunksize=chunksize, ordered=False,
+                          sources=sources,
+                          callback=lambda receipt_id, result, stage_name=stage_name: state.set(stage_name, receipt_id,
+                                                                                                 keys[receipt_id]),
+                          **params)
+            computed[stage_name] = len(stale)
+
+            stages_done.append(stage_name)
+            state.stage_done(run_id, stages_done)
+
+        state.finish_run(run_id)
+    finally:
+        #an interrupted run keeps the receipts it recorded, and does not leave the state locked
+        state.close()
+    return computed
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a preprocessing stage over the receipts of a manifest.')
+    parser.add_argument('stages', nargs='+', choices=list(STAGES))
+    parser.add_argument('--manifest', required=True, help='csv file with a receipt_id column, or one id per line')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='the directory of the files of the receipts')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=None)
+    parser.add_argument('--unordered', action='store_true')
+    parser.add_argument('--glove-path', default=None)
+    parser.add_argument('--store-path', default=None)
+    parser.add_argument('--zones-path', default=None)
+    parser.add_argument('--corrections-path', default=None, help='json file of the OOV corrections (see spelling.py)')
+    parser.add_argument('--desired-shape', type=int, default=480)
+    parser.add_argument('--grid-size', type=int, default=120)
+    parser.add_argument('--state', default=None, help='sqlite file of the incremental runs, every receipt is run if None')
+    parser.add_argument('--resume', action='store_true', help='continue the last run that did not finish')
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest, args.data_dir)
+    sources = {'glove_path': args.glove_path, 'store_path': args.store_path, 'zones_path': args.zones_path,
+               'corrections_path': args.corrections_path}
+    stage_params = {'relative_centers': {'desired_shape': args.desired_shape},
+                    'tokens': {'desired_shape': args.desired_shape},
+                    'final_grids': {'grid_size': args.grid_size, 'desired_image_size': args.desired_shape}}
+
+    if args.state is not None:
+        run_incremental(args.stages, manifest, args.state, num_workers=args.workers, chunksize=args.chunksize,
+                        resume=args.resume, sources=sources, stage_params=stage_params)
+    else:
+        for stage_name in args.stages:
+            run_stage(stage_name, manifest, num_workers=args.workers, chunksize=args.chunksize,
+                      ordered=not args.unordered, sources=sources, **stage_params.get(stage_name, {}))
@@ -0,0 +1,156 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+
+from data.processing.geometry import Boxes, iou_matrix
+
+
+
+class GridIndex(object):
+    '''
+    A uniform grid bucket index over the bboxes of a receipt.
+    The image is cut into square cells, and each box is registered in every cell it covers,
+    so that a query only looks at the boxes of the cells it touches instead of all the boxes.
+    The buckets are stored in CSR form: the box ids sorted by cell, and the offset of each cell.
+    '''
+
+    def __init__(self, boxes, cell_size=None):
+        '''
+        input:
+            boxes: the Boxes to index
+            cell_size: the side of a cell in pixels, twice the median box height if None
+        '''
+        self.boxes = boxes
+
+        if cell_size is None:
+            heights = boxes.height() if len(boxes) else np.ones(1)
+            cell_size = 2 * max(1., float(np.median(heights)))
+        self.cell_size = float(cell_size)
+
+        cx1, cy1, cx2, cy2 = self._cells(boxes)
+        self.num_cols = int(cx2.max()) + 1 if len(boxes) else 1
+        self.num_rows = int(cy2.max()) + 1 if len(boxes) else 1
+
+        #expand each box into the cells it covers
+        widths = cx2 - cx1 + 1
+        counts = widths * (cy2 - cy1 + 1)
+        box_ids = np.repeat(np.arange(len(boxes)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cols = np.repeat(cx1, counts) + local % np.repeat(widths, counts)
+        rows = np.repeat(cy1, counts) + local // np.repeat(widths, counts)
+        cells = rows * self.num_cols + cols
+
+        order = np.argsort(cells, kind='stable')
+        self.box_ids = box_ids[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.num_rows * self.num_cols))])
+
+
+    def _cells(self, boxes):
+        #the (inclusive) range of cells covered by each box
+        cx1 = np.floor_divide(np.maximum(boxes.x1, 0), self.cell_size).astype(np.int64)
+        cy1 = np.floor_divide(np.maximum(boxes.y1, 0), self.cell_size).astype(np.int64)
+        cx2 = np.maximum(cx1, np.floor_divide(np.maximum(boxes.x2, 0), self.cell_size).astype(np.int64))
+        cy2 = np.maximum(cy1, np.floor_divide(np.maximum(boxes.y2, 0), self.cell_size).astype(np.int64))
+        return cx1, cy1, cx2, cy2
+
+
+    def _bucket(self, col1, row1, col2, row2):
+        #the ids of the boxes registered in a rectangle of cells, each id once
+        col1, row1 = max(col1, 0), max(row1, 0)
+        col2, row2 = min(col2, self.num_cols - 1), min(row2, self.num_rows - 1)
+        if col1 > col2 or row1 > row2:
+            return np.zeros(0, dtype=np.int64)
+
+        slices = [self.box_ids[self.offsets[row * self.num_cols + col1]:self.offsets[row * self.num_cols + col2 + 1]]
+                  for row in range(row1, row2 + 1)]
+        return np.unique(np.concatenate(slices))
+
+
+    def candidates(self, box):
+        '''
+        The ids of the boxes registered in the cells touched by a box [x1, y1, x2, y2]
+        '''
+        cx1, cy1, cx2, cy2 = [int(c[0]) for c in self._cells(Boxes.from_array(box))]
+        return self._bucket(cx1, cy1, cx2, cy2)
+
+
+    def overlapping(self, box):
+        '''
+        The ids of the boxes that overlap a box [x1, y1, x2, y2] with a positive area
+        '''
+        x1, y1, x2, y2 = box
+        ids = self.candidates(box)
+        b = self.boxes[ids]
+        keep = (np.minimum(b.x2, x2) > np.maximum(b.x1, x1)) & (np.minimum(b.y2, y2) > np.maximum(b.y1, y1))
+        return ids[keep]
+
+
+    def match(self, queries, min_iou=1e-5):
+        '''
+        The boxes whose IoU with any of the queries is larger than min_iou,
+        the IoU being only computed for the boxes that overlap a query
+        input:
+            queries: the Boxes to match, for example the zones of interest
+            min_iou: the IoU threshold
+        return:
+            the boolean array telling, for each indexed box, if it matches a query
+        '''
+        matched = np.zeros(len(self.boxes), dtype=bool)
+        for j, query in enumerate(queries.to_array()):
+            ids = self.overlapping(query)
+            if len(ids):
+                matched[ids[iou_matrix(self.boxes[ids], queries[j:j + 1])[:, 0] > min_iou]] = True
+        return matched
+
+
+    def distances(self, ids, x, y):
+        '''
+        The distance of a point to each box, 0 inside the box
+        '''
+        b = self.boxes[ids]
+        dx = np.maximum(np.maximum(b.x1 - x, x - b.x2), 0).astype(np.float64)
+        dy = np.maximum(np.maximum(b.y1 - y, y - b.y2), 0).astype(np.float64)
+        return np.hypot(dx, dy)
+
+
+    def nearest(self, x, y, k=1, exclude=()):
+        '''
+        The k nearest boxes of a point, searched ring of cells after ring of cells
+        input:
+            x, y: the point
+            k: the number of boxes
+            exclude: ids of boxes to leave out, for example the box of the point itself
+        return:
+            the ids of the boxes and their distances, sorted by distance
+        '''
+        col = int(min(max(x // self.cell_size, 0), self.num_cols - 1))
+        row = int(min(max(y // self.cell_size, 0), self.num_rows - 1))
+        exclude = np.asarray(list(exclude), dtype=np.int64)
+        max_ring = max(col, row, self.num_cols - 1 - col, self.num_rows - 1 - row)
+
+        for ring in range(max_ring + 1):
+            ids = self._bucket(col - ring, row - ring, col + ring, row + ring)
+            ids = ids[~np.isin(ids, exclude)]
+            distances = self.distances(ids, x, y)
+            #every box not seen yet is at least ring * cell_size away from the point
+            if len(ids) >= k and np.sort(distances)[k - 1] <= ring * self.cell_size:
+                break
+
+        order = np.argsort(distances, kind='stable')[:k]
+        return ids[order], distances[order]
+
+
+    def within(self, x, y, radius):
+        '''
+        The ids of the boxes at most radius away from a point, sorted by distance
+        '''
+        ids = self.candidates([x - radius, y - radius, x + radius, y + radius])
+        distances = self.distances(ids, x, y)
+        keep = distances <= radius
+        return ids[keep][np.argsort(distances[keep], kind='stable')]
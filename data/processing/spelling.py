@@ -0,0 +1,250 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+import json
+
+
+
+def char_masks(pattern):
+    '''
+    This function returns, for each character of the pattern, the bitmask of its positions (bit i for pattern[i])
+    '''
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+
+
+def myers_distance(pattern, text, peq=None, max_distance=None):
+    '''
+    This function calculates the Levenshtein distance between two tokens with the bit-parallel algorithm of Myers (Hyyrö's
+    formulation): a column of the DP matrix is held in two bit vectors (the +1 and -1 vertical deltas) and updated with
+    a few integer operations per character of text, instead of len(pattern) cell updates.
+    It gives the same result as levenshteinDistanceDP.
+    input:
+        pattern: string
+        text: string
+        peq: char_masks(pattern), to reuse when the pattern is compared to many texts
+        max_distance: stop as soon as the distance is known to be larger, None to always compute it
+    return:
+        distance: the Levenshtein distance between both tokens (a value larger than max_distance when it is larger)
+    '''
+    m = len(pattern)
+    if m == 0:
+        return len(text)
+    if peq is None:
+        peq = char_masks(pattern)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    remaining = len(text)
+
+    for c in text:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        #the first row of the matrix is 0, 1, 2, ...: a +1 is shifted in
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+
+        #each of the remaining characters lowers the distance by 1 at most
+        remaining -= 1
+        if max_distance is not None and score - remaining > max_distance:
+            return score - remaining
+
+    return score
+
+
+
+def default_max_distance(word):
+    '''
+    The largest correction allowed for a token: none for the tokens of 1 or 2 characters, 1 edit for 3 characters, 2 above
+    '''
+    return 0 if len(word) <= 2 else 1 if len(word) == 3 else 2
+
+
+
+def _deletes(word, max_distance):
+    #the strings obtained by deleting 0, 1, ..., max_distance characters of word, each one at its lowest level
+    levels = [{word}]
+    deletes = {word}
+    for _ in range(max_distance):
+        level = {w[:i] + w[i + 1:] for w in levels[-1] for i in range(len(w))} - deletes
+        deletes |= level
+        levels.append(level)
+    return levels
+
+
+
+class SymSpell(object):
+    '''
+    A nearest vocabulary word corrector (symmetric delete spelling correction).
+    Every string obtained by deleting up to max_distance characters from the prefix of a word is indexed by its number
+    of deletes, so the candidates of a token within a distance d are found with the deletes (at most d) of its own prefix
+    among the deletes (at most d) of the words, without any distance computation.
+    The candidates are verified with myers_distance from the most frequent one, and the first one close enough is the
+    correction, so most tokens only verify a few candidates.
+    '''
+
+    def __init__(self, words, frequencies=None, max_distance=2, prefix_length=7):
+        '''
+        input:
+            words: the vocabulary (the glove words, in the order of the file)
+            frequencies: the frequency of each word, to break the ties between equally distant words.
+                None uses the order of words, the first word being the most frequent (glove is sorted by frequency)
+            max_distance: the largest distance the index can correct
+            prefix_length: the number of characters of each word that are indexed
+        '''
+        self.words = list(words)
+        if frequencies is None:
+            frequencies = -np.arange(len(self.words))
+        self.frequencies = np.asarray(frequencies)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+        #the rank of each word, from the most frequent, the first word winning the ties
+        self.ranks = np.empty(len(self.words), dtype=np.int64)
+        self.ranks[np.lexsort((np.arange(len(self.words)), -self.frequencies))] = np.arange(len(self.words))
+        self.lengths = np.array([len(word) for word in self.words], dtype=np.int64)
+        self.ids = {}
+        for i, word in enumerate(self.words):
+            self.ids.setdefault(word, i)
+
+        self.indexes = [{} for _ in range(max_distance + 1)] #for each number of deletes: delete -> ids of the words
+        for i, word in enumerate(self.words):
+            for index, deletes in zip(self.indexes, _deletes(word[:prefix_length], max_distance)):
+                for delete in deletes:
+                    bucket = index.get(delete)
+                    if bucket is None:
+                        index[delete] = i
+                    elif isinstance(bucket, list):
+                        bucket.append(i)
+                    else: #most deletes come from a single word, the list is only created for the second one
+                        index[delete] = [bucket, i]
+
+
+    @classmethod
+    def from_glove(cls, glove_file, **kwargs):
+        '''
+        The corrector of the words of a glove txt file
+        '''
+        with open(glove_file, 'r') as f:
+            words = [line.split(' ', 1)[0] for line in f]
+        return cls(words, **kwargs)
+
+
+    def candidates(self, word, max_distance):
+        '''
+        The ids of the words sharing a delete with word, at most max_distance deletes away from both
+        '''
+        ids = set()
+        indexes = self.indexes[:max_distance + 1]
+        for deletes in _deletes(word[:self.prefix_length], max_distance):
+            for delete in deletes:
+                for index in indexes:
+                    bucket = index.get(delete)
+                    if bucket is None:
+                        continue
+                    if isinstance(bucket, list):
+                        ids.update(bucket)
+                    else:
+                        ids.add(bucket)
+        return ids
+
+
+    def lookup(self, word, max_distance=None):
+        '''
+        The closest vocabulary word of a token
+        input:
+            word: the normalized token
+            max_distance: the largest distance accepted for this token, default_max_distance(word) if None
+                (it is capped by the max_distance of the index)
+        return:
+            the closest word and its distance, the most frequent one among equally distant words,
+            (None, None) if there is no word close enough
+        '''
+        if max_distance is None:
+            max_distance = default_max_distance(word)
+        max_distance = min(max_distance, self.max_distance)
+
+        if word in self.ids:
+            return word, 0
+
+        peq = char_masks(word)
+        #search with 1 delete, then 2, ...: every word closer than the distance searched was already searched for,
+        #so the most frequent candidate within the distance is the correction, and the many candidates of the deeper
+        #searches are only verified when the shallower ones fail
+        for distance_limit in range(1, max_distance + 1):
+            ids = np.fromiter(self.candidates(word, distance_limit), dtype=np.int64)
+            ids = ids[np.abs(self.lengths[ids] - len(word)) <= distance_limit]
+            for i in ids[np.argsort(self.ranks[ids])].tolist():
+                distance = myers_distance(word, self.words[i], peq, distance_limit)
+                if distance <= distance_limit:
+                    return self.words[i], distance
+
+        return None, None
+
+
+
+    def correct(self, words, max_distance=None, skip_digits=True):
+        '''
+        The correction of many tokens, each distinct token being looked up once
+        input:
+            words: the normalized out of vocabulary tokens
+            max_distance: an int, or a function of the token giving its largest distance (default_max_distance if None)
+            skip_digits: leave the tokens containing digits (amounts, dates, ...) uncorrected
+        return:
+            dict, token -> its correction, for the tokens that have one
+        '''
+        corrections = {}
+        for word in set(words):
+            if skip_digits and any(c.isdigit() for c in word):
+                continue
+            distance = max_distance(word) if callable(max_distance) else max_distance
+            correction, _ = self.lookup(word, distance)
+            if correction is not None and correction != word:
+                corrections[word] = correction
+
+        return corrections
+
+
+
+def oov_corrections(norm_texts, word_ids, speller, max_distance=None, corrections_file=None):
+    '''
+    This function corrects every out of vocabulary token of the corpus with its closest glove word
+    input:
+        norm_texts: the normalized descriptions of the corpus (the norm_text column of the store, or the No_char columns)
+        word_ids: dict, word -> id (see glove_word_ids)
+        speller: the SymSpell of the glove words
+        max_distance: see SymSpell.correct
+        corrections_file: a json file to save the corrections to, for the corrections argument of process_receipt_tokens
+    return:
+        dict, token -> correction
+    '''
+    oov = {word for word in norm_texts if word and word not in word_ids}
+    corrections = speller.correct(oov, max_distance)
+    print('Corrected {n} of the {m} out of vocabulary tokens.'.format(n=len(corrections), m=len(oov)))
+
+    if corrections_file is not None:
+        with open(corrections_file, 'w') as f:
+            json.dump(corrections, f, indent=1, sort_keys=True)
+
+    return corrections
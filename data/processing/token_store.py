@@ -0,0 +1,314 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+import pandas as pd
+import glob2
+import os
+
+
+
+#the columns of the token store and their dtype, one row per token
+TOKEN_COLUMNS = {'text': object,         #the description given by google vision
+                 'norm_text': object,    #lowercase, without special characters
+                 'token': object,        #the glove word of the token, 'mekene' if not in glove
+                 'token_id': np.int32,   #the id of the token in the vocabulary
+                 'x1': np.int32,         #the bbox of the token on the original image
+                 'y1': np.int32,
+                 'x2': np.int32,
+                 'y2': np.int32,
+                 'xc': np.int32,         #the center of the bbox on the resized image
+                 'yc': np.int32,
+                 'image_width': np.int32,
+                 'image_height': np.int32,
+                 'grid_row': np.int32,   #the cell of the token on the grid (see grids.py), -1 if it was dropped
+                 'grid_col': np.int32}
+
+#the columns of the zones of interest manually labelled with vgg annotator, one row per zone
+ZONE_COLUMNS = {'x1': np.int32,
+                'y1': np.int32,
+                'x2': np.int32,
+                'y2': np.int32}
+
+#the value of a column that has not been computed yet
+MISSING = {object: '', np.int32: -1}
+
+#the columns of the csv files written by get_csv_files and the following stages
+CSV_COLUMNS = {'labels': 'text', 'X1': 'x1', 'Y1': 'y1', 'X2': 'x2', 'Y2': 'y2',
+               'image_width': 'image_width', 'image_height': 'image_height',
+               'Xc': 'xc', 'Yc': 'yc', 'No_char': 'norm_text', 'Token_id': 'token_id', 'Tokens': 'token'}
+
+
+
+class TokenStore(object):
+    '''
+    A columnar store of the tokens of every receipt.
+    Each column is one contiguous array over all the receipts, and 'offsets' gives the rows of each receipt,
+    so that a receipt is sliced in O(1) without touching the filesystem.
+    On disk, the store is a directory of chunk_XXXXX.npz files, flush() appends the new receipts as a new chunk.
+    '''
+
+    def __init__(self, path=None, columns=TOKEN_COLUMNS):
+        '''
+        input:
+            path: the directory of the store, its chunks are loaded if it exists
+            columns: dict, the name and dtype of each column
+        '''
+        self.path = path
+        self.columns = dict(columns)
+
+        self.receipt_ids = []                 #the id of each receipt ('1107_receipt'), in order
+        self.index = {}                       #receipt id -> position in receipt_ids
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.data = {name: np.empty(0, dtype=dtype) for name, dtype in self.columns.items()}
+
+        #offsets and data are views of these buffers, grown geometrically so that interleaved appends and reads
+        #copy each token O(1) times on average instead of on every read
+        self._offsets_buffer = self.offsets
+        self._buffers = dict(self.data)
+
+        self._pending = []                    #the (receipt ids, lengths, columns) blocks appended since the last consolidation
+        self._num_flushed = 0                 #the number of receipts already written to disk
+
+        if path is not None and os.path.isdir(path):
+            for chunk in sorted(glob2.glob(os.path.join(path, 'chunk_*.npz'))):
+                self._load_chunk(chunk)
+            self._consolidate()
+            self._num_flushed = len(self.receipt_ids)
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def __contains__(self, receipt_id):
+        return receipt_id in self.index
+
+
+    def append(self, receipt_id, **columns):
+        '''
+        Append the tokens of a receipt, the columns that are not given are filled with their missing value
+        input:
+            receipt_id: the id of the receipt ('1107_receipt')
+            columns: the name of each column and its values for every token of the receipt
+        '''
+        n = len(next(iter(columns.values()))) if columns else 0
+        self.extend([receipt_id], [n], **columns)
+
+
+    def extend(self, receipt_ids, lengths, **columns):
+        '''
+        Append several receipts at once
+        input:
+            receipt_ids: the ids of the receipts
+            lengths: the number of tokens of each receipt
+            columns: the name of each column and its values for every token, the receipts following each other
+        '''
+        receipt_ids = list(receipt_ids)
+        lengths = [int(length) for length in lengths]
+        n = sum(lengths)
+
+        duplicated = [receipt_id for receipt_id in receipt_ids if receipt_id in self.index]
+        if duplicated or len(set(receipt_ids)) != len(receipt_ids):
+            raise ValueError('The receipts {receipts} are already in the store.'.format(receipts=duplicated))
+
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise ValueError('Unknown columns {columns}.'.format(columns=sorted(unknown)))
+
+        values = {}
+        for name, dtype in self.columns.items():
+            if name in columns:
+                values[name] = np.asarray(columns[name], dtype=dtype).reshape(-1)
+                if len(values[name]) != n:
+                    raise ValueError('The column {name} has {got} values instead of {n}.'.format(name=name,
+                                                                                                 got=len(values[name]),
+                                                                                                 n=n))
+            else:
+                values[name] = np.full(n, MISSING[dtype], dtype=dtype)
+
+        for receipt_id in receipt_ids:
+            self.index[receipt_id] = len(self.index)
+        self._pending.append((receipt_ids, lengths, values))
+
+
+    def receipt(self, receipt_id):
+        '''
+        The tokens of a receipt
+        input:
+            receipt_id: the id of the receipt
+        return:
+            dict, the name of each column and a view of its values for the receipt
+        '''
+        self._consolidate()
+        start, end = self.bounds(receipt_id)
+        return {name: values[start:end] for name, values in self.data.items()}
+
+
+    def bounds(self, receipt_id):
+        '''
+        The first and last+1 rows of a receipt
+        '''
+        self._consolidate()
+        i = self.index[receipt_id]
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+
+    def update(self, receipt_id, **columns):
+        '''
+        Overwrite some columns of a receipt in place
+        input:
+            receipt_id: the id of the receipt
+            columns: the name of each column and its new values for every token of the receipt
+        '''
+        start, end = self.bounds(receipt_id)
+        for name, values in columns.items():
+            self.data[name][start:end] = np.asarray(values, dtype=self.columns[name]).reshape(-1)
+
+
+    def column(self, name):
+        '''
+        A column over all the receipts
+        '''
+        self._consolidate()
+        return self.data[name]
+
+
+    def receipt_column(self):
+        '''
+        The position of the receipt of each row, in receipt_ids
+        '''
+        self._consolidate()
+        return np.repeat(np.arange(len(self.receipt_ids), dtype=np.int32), np.diff(self.offsets))
+
+
+    def to_frame(self, receipt_id):
+        '''
+        The tokens of a receipt as a dataframe with the columns of the csv files, in the same order:
+        imageName, labels, X1, Y1, X2, Y2, image_width, image_height, bbox, Xc, Yc, New_Image_width_and_height, No_char,
+        Token_id, Tokens
+        '''
+        tokens = self.receipt(receipt_id)
+        frame = pd.DataFrame({csv_name: tokens[name] for csv_name, name in CSV_COLUMNS.items()})
+        frame.insert(0, 'imageName', receipt_id)
+        frame.insert(8, 'bbox', np.stack([tokens['x1'], tokens['y1'], tokens['x2'], tokens['y2']], axis=1).tolist())
+        frame.insert(11, 'New_Image_width_and_height', np.maximum(tokens['image_width'], tokens['image_height']))
+        return frame
+
+
+    def flush(self, path=None):
+        '''
+        Write the receipts appended since the last flush as a new chunk.
+        The updates of receipts that are already on disk are only written by save().
+        '''
+        path = self.path if path is None else path
+        self._consolidate()
+        os.makedirs(path, exist_ok=True)
+
+        if self._num_flushed == len(self.receipt_ids):
+            return
+
+        num_chunks = len(glob2.glob(os.path.join(path, 'chunk_*.npz')))
+        self._write_chunk(os.path.join(path, 'chunk_{:05d}.npz'.format(num_chunks)), self._num_flushed)
+        self._num_flushed = len(self.receipt_ids)
+
+
+    def save(self, path=None):
+        '''
+        Write the whole store as a single chunk, replacing the previous ones
+        '''
+        path = self.path if path is None else path
+        self._consolidate()
+        os.makedirs(path, exist_ok=True)
+
+        old_chunks = glob2.glob(os.path.join(path, 'chunk_*.npz'))
+        self._write_chunk(os.path.join(path, 'tmp_chunk.npz'), 0)
+        for chunk in old_chunks:
+            os.remove(chunk)
+        os.replace(os.path.join(path, 'tmp_chunk.npz'), os.path.join(path, 'chunk_00000.npz'))
+        self._num_flushed = len(self.receipt_ids)
+
+
+    def _write_chunk(self, chunk_file, first_receipt):
+        start = int(self.offsets[first_receipt])
+        arrays = {'receipt_ids': np.asarray(self.receipt_ids[first_receipt:], dtype=str),
+                  'offsets': self.offsets[first_receipt:] - start}
+        for name, dtype in self.columns.items():
+            values = self.data[name][start:]
+            arrays[name] = values.astype(str) if dtype is object else values
+
+        with open(chunk_file, 'wb') as f:
+            np.savez(f, **arrays)
+
+
+    def _load_chunk(self, chunk_file):
+        with np.load(chunk_file) as chunk:
+            receipt_ids = chunk['receipt_ids'].tolist()
+            lengths = np.diff(chunk['offsets']).tolist()
+            n = sum(lengths)
+
+            values = {}
+            for name, dtype in self.columns.items():
+                if name in chunk.files:
+                    values[name] = chunk[name].astype(dtype)
+                else:
+                    values[name] = np.full(n, MISSING[dtype], dtype=dtype)
+
+        for receipt_id in receipt_ids:
+            self.index[receipt_id] = len(self.index)
+        self._pending.append((receipt_ids, lengths, values))
+
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+
+        lengths = [length for _, block_lengths, _ in self._pending for length in block_lengths]
+        num_receipts, size = len(self.offsets), int(self.offsets[-1])
+        self._offsets_buffer = _reserve(self._offsets_buffer, num_receipts, num_receipts + len(lengths))
+        self.offsets = self._offsets_buffer[:num_receipts + len(lengths)]
+        np.cumsum(lengths, dtype=np.int64, out=self.offsets[num_receipts:])
+        self.offsets[num_receipts:] += size
+
+        end = int(self.offsets[-1])
+        for name in self.columns:
+            self._buffers[name] = _reserve(self._buffers[name], size, end)
+            np.concatenate([values[name] for _, _, values in self._pending], out=self._buffers[name][size:end])
+            self.data[name] = self._buffers[name][:end]
+        for receipt_ids, _, _ in self._pending:
+            self.receipt_ids.extend(receipt_ids)
+        self._pending = []
+
+
+
+def _reserve(buffer, size, required):
+    #the buffer, or a copy of its first size values in a buffer at least twice as large when it is too small
+    if required <= len(buffer):
+        return buffer
+    grown = np.empty(max(required, 2 * len(buffer)), dtype=buffer.dtype)
+    grown[:size] = buffer[:size]
+    return grown
+
+
+def csv_dir_to_store(csv_dir, store):
+    '''
+    This function appends the csv files written by the previous versions of the pipeline to a token store
+    input:
+        csv_dir: the directory of the csv files (csv_files, csv_files_with_centers or csv_files_replace_after_Glove)
+        store: the TokenStore
+    return:
+        the store
+    '''
+    for csv_file in sorted(glob2.glob(os.path.join(csv_dir, '*.csv'))):
+        receipt = pd.read_csv(csv_file, keep_default_na=False)
+        if len(receipt) == 0:
+            continue
+        columns = {name: receipt[csv_name].values for csv_name, name in CSV_COLUMNS.items() if csv_name in receipt}
+        store.append(str(receipt['imageName'].iloc[0]), **columns)
+
+    return store
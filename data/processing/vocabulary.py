@@ -0,0 +1,151 @@
+'''
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+'''
+
+
+
+import numpy as np
+import pandas as pd
+from collections import Counter
+import os
+
+
+
+#the dummy string of the tokens that are not in glove, its vector is 0 and its id is always 0
+OOV_WORD = 'mekene'
+OOV_ID = 0
+
+
+
+class Vocabulary(object):
+    '''
+    The words of the embeddings and their id, looked up in O(1) through a hash table.
+    Id 0 is always the dummy string 'mekene' of the out of vocabulary tokens.
+    '''
+
+    def __init__(self, words):
+        '''
+        input:
+            words: the words in the order of their id, 'mekene' is added as id 0 if it is not the first word
+        '''
+        words = list(words)
+        if not words or words[OOV_ID] != OOV_WORD:
+            words = [OOV_WORD] + words
+        self.words = words
+
+        #word -> id, the first occurrence being kept if a word is repeated
+        self.word_ids = {}
+        for i, word in enumerate(self.words):
+            self.word_ids.setdefault(word, i)
+
+
+    @classmethod
+    def from_glove(cls, glove_path):
+        '''
+        The vocabulary of the glove txt file (only the first field of each line is read),
+        or of a directory written by embeddings.convert_glove or build_dataset_embeddings
+        '''
+        if os.path.isdir(glove_path):
+            with open(os.path.join(glove_path, 'words.txt'), 'r') as f:
+                return cls(f.read().split('\n')[:-1])
+
+        with open(glove_path, 'r') as f:
+            return cls(line.split(' ', 1)[0] for line in f)
+
+
+    def __len__(self):
+        return len(self.words)
+
+
+    def __contains__(self, word):
+        return word in self.word_ids
+
+
+    def __getitem__(self, word):
+        return self.word_ids.get(word, OOV_ID)
+
+
+    def get(self, word, default=OOV_ID):
+        return self.word_ids.get(word, default)
+
+
+    def word(self, i):
+        return self.words[i]
+
+
+    def ids(self, words):
+        '''
+        The int32 ids of a column of tokens, 0 for the words out of the vocabulary.
+        Each distinct token is looked up once, and the ids are scattered back with numpy.
+        input:
+            words: the array (or list) of the tokens
+        return:
+            the int32 array of their ids
+        '''
+        words = np.asarray(words, dtype=object)
+        if len(words) == 0:
+            return np.zeros(0, dtype=np.int32)
+
+        distinct, inverse = np.unique(words.astype(str), return_inverse=True)
+        distinct_ids = np.fromiter((self.word_ids.get(word, OOV_ID) for word in distinct.tolist()), dtype=np.int32,
+                                   count=len(distinct))
+        return distinct_ids[inverse.reshape(-1)]
+
+
+    def coverage(self, receipts, top_k=20):
+        '''
+        The coverage of the vocabulary over a corpus, computed in one pass over the receipts
+        input:
+            receipts: iterable of (receipt id, tokens of the receipt), see store_receipts and csv_receipts
+            top_k: the number of most frequent out of vocabulary words reported
+        return:
+            dict: the in vocabulary and out of vocabulary token counts, the number of distinct words of each,
+            the top_k out of vocabulary words with their count, and the coverage of each receipt
+        '''
+        in_vocab, total = 0, 0
+        in_vocab_words, oov_words = set(), Counter()
+        per_receipt = {}
+
+        for receipt_id, words in receipts:
+            words = np.asarray(words, dtype=object)
+            known = self.ids(words) != OOV_ID
+
+            in_vocab += int(known.sum())
+            total += len(words)
+            in_vocab_words.update(words[known].tolist())
+            oov_words.update(words[~known].tolist())
+            per_receipt[receipt_id] = float(known.mean()) if len(words) else 1.
+
+        receipt_coverage = np.array(list(per_receipt.values())) if per_receipt else np.ones(1)
+        return {'num_tokens': total,
+                'num_tokens_in_vocab': in_vocab,
+                'num_tokens_oov': total - in_vocab,
+                'token_coverage': in_vocab / total if total else 0.,
+                'num_distinct_in_vocab': len(in_vocab_words),
+                'num_distinct_oov': len(oov_words),
+                'top_oov': oov_words.most_common(top_k),
+                'receipt_coverage': per_receipt,
+                'min_receipt_coverage': float(receipt_coverage.min()),
+                'median_receipt_coverage': float(np.median(receipt_coverage))}
+
+
+
+def store_receipts(store, column='norm_text'):
+    '''
+    The (receipt id, tokens) of every receipt of a TokenStore
+    '''
+    values = store.column(column)
+    for i, receipt_id in enumerate(store.receipt_ids):
+        yield receipt_id, values[store.offsets[i]:store.offsets[i + 1]]
+
+
+
+def csv_receipts(csv_files_list, column='No_char'):
+    '''
+    The (receipt id, tokens) of every csv file, only the column of the tokens being read
+    '''
+    for csv_file in csv_files_list:
+        tokens = pd.read_csv(csv_file, usecols=[column], keep_default_na=False)[column].astype(str).values
+        yield os.path.splitext(os.path.basename(csv_file))[0], tokens
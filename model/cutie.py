@@ -0,0 +1,213 @@
+"""
+The implementation of CUTIE based on Tensorflow.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+from utils import layers as custom_layers
+from model.network import Network
+import tensorflow as tf
+
+layers = tf.keras.layers
+models = tf.keras.models
+backend = tf.keras.backend
+
+
+class CUTIE(Network):
+    # the 3x3 conv blocks at the resolution of the grid, that can run as sparse convolutions
+    SPARSE_BLOCKS = {'CUTIE-A': ['conv1', 'conv2', 'fusion'],
+                     'CUTIE-B': ['conv1', 'conv2', 'conv3', 'conv4', 'atrous2', 'atrous4', 'atrous8']}
+
+    def __init__(self, num_classes, version='CUTIE-B', base_model=None, grid_channels=200, filters=128,
+                 image_branch=False, sparse_blocks=None, **kwargs):
+        """
+        The initialization of CUTIE.
+        The networks run on the grids of the tokens (a quarter of the image size) instead of the images,
+        without backbone, and predict at the resolution of the grid.
+        :param num_classes: the number of predicted classes.
+        :param version: 'CUTIE-A' (multi-resolution encoder-decoder) or 'CUTIE-B' (atrous convolutions and ASPP)
+        :param base_model: None, there is no backbone
+        :param grid_channels: the dimension of the embedding vectors of the float grids
+            (the grids of token ids are embedded by the network, see the embeddings of Network)
+        :param filters: the number of filters of the convolutions
+        :param image_branch: fuse a low resolution image branch with the grid
+        :param sparse_blocks: the blocks of SPARSE_BLOCKS run as submanifold sparse convolutions
+            (computed at the cells of the tokens only, see custom_layers.SparseConv2D), True for all of them.
+            None by default: they are only faster below the crossover density of custom_layers.benchmark_sparse_conv,
+            to measure on the target device before enabling them (~0.4 on a CPU, far above the ~2% of a receipt)
+        :param kwargs: other parameters
+        """
+        assert version in ['CUTIE-A', 'CUTIE-B']
+        assert base_model is None
+        super(CUTIE, self).__init__(num_classes, version, base_model, None, **kwargs)
+
+        self.grid_channels = grid_channels
+        self.filters = filters
+        self.image_branch = image_branch
+
+        if sparse_blocks is True:
+            sparse_blocks = self.SPARSE_BLOCKS[version]
+        self.sparse_blocks = set(sparse_blocks or [])
+        unknown = self.sparse_blocks - set(self.SPARSE_BLOCKS[version])
+        if unknown:
+            raise ValueError('The blocks {blocks} of {version} can not be sparse, '
+                             'the sparse blocks are {supported}.'.format(blocks=sorted(unknown), version=version,
+                                                                         supported=self.SPARSE_BLOCKS[version]))
+
+    def __call__(self, inputs=None, input_size=None, image_inputs=None, image_size=None, **kwargs):
+        """
+        :param inputs: the grids, int32 (h, w) ids or float (h, w, grid_channels) vectors
+        :param input_size: (h, w) of the grids when inputs is None
+        :param image_inputs: the (image_h, image_w, 3) images of the image branch
+        :param image_size: (image_h, image_w) of the images when image_inputs is None,
+            image_h / h = image_w / w must be a power of 2
+        :return: the model, of inputs [grids, images] when the image branch is fused
+        """
+        assert inputs is not None or input_size is not None
+
+        if inputs is None:
+            assert isinstance(input_size, tuple)
+            inputs = self.get_inputs(input_size, channels=self.grid_channels)
+        if self.image_branch and image_inputs is None:
+            assert isinstance(image_size, tuple)
+            image_inputs = layers.Input(shape=image_size + (3,))
+
+        if self.version == 'CUTIE-A':
+            return self._cutie_a(inputs, image_inputs)
+        return self._cutie_b(inputs, image_inputs)
+
+    def _dilated_conv_block(self, inputs, filters, kernel_size=3, rate=1, strides=1, active=None):
+        x = layers.BatchNormalization()(inputs)
+        x = layers.ReLU()(x)
+        if active is not None:
+            return custom_layers.SparseConv2D(filters, kernel_size, dilation_rate=rate)([x, active])
+        x = layers.Conv2D(filters, kernel_size,
+                          strides=strides,
+                          padding='same',
+                          dilation_rate=rate,
+                          kernel_initializer='he_normal')(x)
+        return x
+
+    def _block(self, name, inputs, filters, active, rate=1):
+        # a 3x3 block at the resolution of the grid, sparse if it is in sparse_blocks
+        return self._dilated_conv_block(inputs, filters, 3, rate=rate,
+                                        active=active if name in self.sparse_blocks else None)
+
+    def _active_cells(self, inputs):
+        # the (batch, h, w) cells of the tokens
+        if not self.sparse_blocks:
+            return None
+        if tf.as_dtype(inputs.dtype).is_integer:
+            return layers.Lambda(lambda ids: backend.not_equal(ids, 0))(inputs)
+        return layers.Lambda(lambda grids: backend.any(backend.not_equal(grids, 0), axis=-1))(inputs)
+
+    def _image_features(self, image_inputs, grid_size):
+        _, image_h, image_w, _ = backend.int_shape(image_inputs)
+        h, w = grid_size
+
+        factor = image_h // h
+        if not (image_h == factor * h and image_w == factor * w and factor & (factor - 1) == 0):
+            raise ValueError('The image size must be the grid size {grid} times a power of 2, '
+                             'but received {size}.'.format(grid=grid_size, size=(image_h, image_w)))
+
+        # a light strided stem down to the grid resolution
+        x = layers.Conv2D(32, 3, strides=1, padding='same', kernel_initializer='he_normal')(image_inputs)
+        filters = 32
+        while factor > 1:
+            filters = min(filters * 2, self.filters)
+            x = self._dilated_conv_block(x, filters, 3, strides=2)
+            factor //= 2
+        return x
+
+    def _features(self, inputs, image_inputs):
+        h, w = backend.int_shape(inputs)[1:3]
+
+        x = layers.Conv2D(self.filters, 1, strides=1, kernel_initializer='he_normal')(self.embed(inputs))
+        if image_inputs is not None:
+            x = layers.Concatenate()([x, self._image_features(image_inputs, (h, w))])
+            x = self._dilated_conv_block(x, self.filters, 1)
+        return x
+
+    def _model(self, inputs, image_inputs, outputs):
+        if image_inputs is not None:
+            return models.Model([inputs, image_inputs], outputs, name=self.version)
+        return models.Model(inputs, outputs, name=self.version)
+
+    def _cutie_a(self, inputs, image_inputs):
+        num_classes = self.num_classes
+        filters = self.filters
+        h, w = backend.int_shape(inputs)[1:3]
+
+        if not (h % 4 == 0 and w % 4 == 0):
+            raise ValueError('The grid size must be divided by 4, but received {size}'.format(size=(h, w)))
+
+        x = self._features(inputs, image_inputs)
+        active = self._active_cells(inputs)
+
+        # full resolution
+        c1 = self._block('conv1', x, filters, active)
+        c1 = self._block('conv2', c1, filters, active)
+
+        # 1/2 resolution
+        c2 = self._dilated_conv_block(c1, filters, 3, strides=2)
+        c2 = self._dilated_conv_block(c2, filters, 3)
+
+        # 1/4 resolution
+        c3 = self._dilated_conv_block(c2, filters, 3, strides=2)
+        c3 = self._dilated_conv_block(c3, filters, 3, rate=2)
+        c3 = self._dilated_conv_block(c3, filters, 3, rate=4)
+
+        # fusion of the resolutions
+        x = layers.UpSampling2D(size=(2, 2))(c3)
+        x = layers.Concatenate()([x, c2])
+        x = self._dilated_conv_block(x, filters, 3)
+
+        x = layers.UpSampling2D(size=(2, 2))(x)
+        x = layers.Concatenate()([x, c1])
+        x = self._block('fusion', x, filters, active)
+
+        x = self._dilated_conv_block(x, num_classes, 1)
+
+        outputs = x
+        return self._model(inputs, image_inputs, outputs)
+
+    def _cutie_b(self, inputs, image_inputs):
+        num_classes = self.num_classes
+        filters = self.filters
+        h, w = backend.int_shape(inputs)[1:3]
+
+        x = self._features(inputs, image_inputs)
+        active = self._active_cells(inputs)
+
+        # convolutions
+        for i in range(1, 5):
+            x = self._block('conv{i}'.format(i=i), x, filters, active)
+        low = x
+
+        # atrous convolutions
+        for rate in [2, 4, 8]:
+            x = self._block('atrous{rate}'.format(rate=rate), x, filters, active, rate=rate)
+
+        # atrous spatial pyramid pooling
+        a1 = self._dilated_conv_block(x, filters, 1)
+        a4 = self._dilated_conv_block(x, filters, 3, rate=4)
+        a8 = self._dilated_conv_block(x, filters, 3, rate=8)
+        a16 = self._dilated_conv_block(x, filters, 3, rate=16)
+
+        ap = custom_layers.GlobalAveragePooling2D(keep_dims=True)(x)
+        ap = self._dilated_conv_block(ap, filters, 1)
+        ap = layers.UpSampling2D(size=(h, w))(ap)
+
+        x = layers.Concatenate()([a1, a4, a8, a16, ap])
+        x = self._dilated_conv_block(x, filters, 1)
+
+        # shortcut of the shallow features
+        x = layers.Concatenate()([x, low])
+        x = self._dilated_conv_block(x, filters, 3)
+
+        x = self._dilated_conv_block(x, num_classes, 1)
+
+        outputs = x
+        return self._model(inputs, image_inputs, outputs)
@@ -15,12 +15,14 @@ backend = tf.keras.backend
 
 
 class DenseASPP(Network):
-    def __init__(self, num_classes, version='DenseASPP', base_model='DenseNet121', **kwargs):
+    def __init__(self, num_classes, version='DenseASPP', base_model='DenseNet121', upsample=True, **kwargs):
         """
         The initialization of DenseASPP based.
         :param num_classes: the number of predicted classes.
         :param version: 'DenseASPP'
         :param base_model: the backbone model
+        :param upsample: upsample the outputs x8 to the input size, otherwise they are at 1/8 of it
+            (enough for the token predictions, see token_model)
         :param kwargs: other parameters
         """
         dilation = [2, 4]
@@ -40,13 +42,15 @@ class DenseASPP(Network):
                               'MobileNetV2',
                               'Xception-DeepLab']
         super(DenseASPP, self).__init__(num_classes, version, base_model, dilation, **kwargs)
+        self.upsample = upsample
+        self.output_stride = 1 if upsample else 8
 
     def __call__(self, inputs=None, input_size=None, **kwargs):
         assert inputs is not None or input_size is not None
 
         if inputs is None:
             assert isinstance(input_size, tuple)
-            inputs = layers.Input(shape=input_size + (3,))
+            inputs = self.get_inputs(input_size)
         return self._denseaspp(inputs)
 
     def _dilated_conv_block(self, inputs, filters, kernel_size=3, rate=1):
@@ -59,11 +63,11 @@ class DenseASPP(Network):
         return x
 
     def _denseaspp(self, inputs):
-        _, inputs_h, inputs_w, _ = backend.int_shape(inputs)
-        aspp_size = inputs_h // 8, inputs_w // 8
+        inputs_h, inputs_w = backend.int_shape(inputs)[1:3]
+        aspp_size = tuple(None if size is None else size // 8 for size in (inputs_h, inputs_w))
         num_classes = self.num_classes
 
-        c5 = self.encoder(inputs, output_stages='c5')
+        c5 = self.encoder(self.embed(inputs), output_stages='c5')
 
         # First block rate=3
         d3 = self._dilated_conv_block(c5, 256, 1)
@@ -91,7 +95,8 @@ class DenseASPP(Network):
 
         x = custom_layers.Concatenate(out_size=aspp_size)([c5, d3, d4, d5, d6, d7])
         x = layers.Conv2D(num_classes, 1, strides=1, kernel_initializer='he_normal')(x)
-        x = layers.UpSampling2D(size=(8, 8), interpolation='bilinear')(x)
+        if self.upsample:
+            x = layers.UpSampling2D(size=(8, 8), interpolation='bilinear')(x)
 
         outputs = x
         return models.Model(inputs, outputs, name=self.version)
@@ -7,12 +7,36 @@ The implementation of Network based on Tensorflow.
 
 """
 from backbones import *
+from utils import layers as custom_layers
+from data.processing.embeddings import GloveStore
+from data.processing.vocabulary import OOV_ID
+import numpy as np
+import tensorflow as tf
+
+layers = tf.keras.layers
+models = tf.keras.models
+backend = tf.keras.backend
 
 
 class Network(object):
-    def __init__(self, num_classes, version='PAN', base_model='ResNet50', dilation=None, **kwargs):
+    def __init__(self, num_classes, version='PAN', base_model='ResNet50', dilation=None,
+                 embeddings=None, trainable_embeddings=False, **kwargs):
+        """
+        The initialization of Network.
+        :param num_classes: the number of predicted classes.
+        :param version: the name of the model
+        :param base_model: the backbone model, None for the networks without backbone
+        :param dilation: the dilation of the backbone
+        :param embeddings: None for image (or float grid) inputs, otherwise the inputs are int32 grids of token ids,
+            expanded in the graph by an embedding layer initialized with these vectors:
+            a GloveStore, its directory or an (n, dim) array, row 0 ('mekene') being the zero vector
+        :param trainable_embeddings: fine tune the embedding vectors, they are frozen otherwise
+        :param kwargs: other parameters
+        """
         super(Network, self).__init__(**kwargs)
-        if base_model in ['VGG16', 'VGG19']:
+        if base_model is None:
+            self.encoder = None
+        elif base_model in ['VGG16', 'VGG19']:
             self.encoder = VGG(base_model, dilation=dilation)
         elif base_model in ['ResNet50', 'ResNet101', 'ResNet152']:
             self.encoder = ResNet(base_model, dilation=dilation)
@@ -29,10 +53,65 @@ class Network(object):
         self.num_classes = num_classes
         self.version = version
         self.base_model = base_model
+        self.output_stride = 1 # the inputs over the resolution of the outputs
+        self.embedding = None if embeddings is None else self._embedding_layer(embeddings, trainable_embeddings)
 
     def __call__(self, inputs, **kwargs):
         return inputs
 
+    def _embedding_layer(self, embeddings, trainable):
+        if isinstance(embeddings, str):
+            embeddings = GloveStore(embeddings)
+        vectors = np.asarray(getattr(embeddings, 'vectors', embeddings), dtype=np.float32)
+        if vectors.ndim != 2 or np.any(vectors[OOV_ID] != 0):
+            raise ValueError('The embeddings must be an (n, dim) matrix whose row {id} is the zero vector, '
+                             'but received {shape}.'.format(id=OOV_ID, shape=vectors.shape))
+
+        return custom_layers.TokenEmbedding(vectors.shape[0], vectors.shape[1],
+                                            pad_id=OOV_ID,
+                                            embeddings_initializer=tf.keras.initializers.Constant(vectors),
+                                            trainable=trainable,
+                                            name='token_embedding')
+
+    def get_inputs(self, input_size, channels=3):
+        """
+        The input layer of the model.
+        :param input_size: (height, width) of the images or of the grids.
+        :param channels: the number of channels of the float inputs.
+        :return: an int32 (height, width) input of token ids if the network has embeddings,
+            a float (height, width, channels) input otherwise.
+        """
+        if self.embedding is not None:
+            return layers.Input(shape=input_size, dtype='int32')
+        return layers.Input(shape=input_size + (channels,))
+
+    def embed(self, inputs):
+        """
+        The (batch, h, w, dim) float tensor of the inputs: the grids of token ids go through the embedding layer,
+        the other inputs are returned unchanged.
+        """
+        if self.embedding is None or not tf.as_dtype(inputs.dtype).is_integer:
+            return inputs
+        return self.embedding(inputs)
+
+    def token_model(self, model, max_tokens=None):
+        """
+        The model of the logits of the tokens: the outputs of model are gathered at the position of each token,
+        so the x8 upsample of the whole map can be left out (see upsample).
+        :param model: the model built by the network.
+        :param max_tokens: the number of tokens of the inputs, None for any number.
+        :return: the model of inputs [inputs of model, (max_tokens, 2) int32 positions] (see decoding.token_positions)
+            and of outputs the (max_tokens, num_classes) logits, 0 for the padding positions (-1).
+        """
+        inputs = list(model.inputs)
+        outputs = model.outputs[0]
+
+        # the stride is known from the network, the inputs may have no static size (rectangular inputs)
+        positions = layers.Input(shape=(max_tokens, 2), dtype='int32')
+        x = custom_layers.GatherTokens(stride=self.output_stride)([outputs, positions])
+
+        return models.Model(inputs + [positions], x, name=model.name + '-tokens')
+
     def get_version(self):
         return self.version
 
@@ -16,12 +16,14 @@ backend = tf.keras.backend
 
 
 class PSPNet(Network):
-    def __init__(self, num_classes, version='PSPNet', base_model='ResNet50', **kwargs):
+    def __init__(self, num_classes, version='PSPNet', base_model='ResNet50', upsample=True, **kwargs):
         """
         The initialization of PSPNet.
         :param num_classes: the number of predicted classes.
         :param version: 'PSPNet'
         :param base_model: the backbone model
+        :param upsample: upsample the outputs x8 to the input size, otherwise they are at 1/8 of it
+            (enough for the token predictions, see token_model)
         :param kwargs: other parameters
         """
         dilation = [2, 4]
@@ -41,24 +43,46 @@ class PSPNet(Network):
                               'MobileNetV2',
                               'Xception-DeepLab']
         super(PSPNet, self).__init__(num_classes, version, base_model, dilation, **kwargs)
+        self.upsample = upsample
+        self.output_stride = 1 if upsample else 8
 
     def __call__(self, inputs=None, input_size=None, **kwargs):
         assert inputs is not None or input_size is not None
 
         if inputs is None:
             assert isinstance(input_size, tuple)
-            inputs = layers.Input(shape=input_size + (3,))
+            inputs = self.get_inputs(input_size)
         return self._pspnet(inputs)
 
     def _pspnet(self, inputs):
         num_classes = self.num_classes
-        _, inputs_h, inputs_w, _ = backend.int_shape(inputs)
+        inputs_h, inputs_w = backend.int_shape(inputs)[1:3]
 
-        h, w = inputs_h // 8, inputs_w // 8
-        x = self.encoder(inputs)
+        if any(size is not None and size % 8 != 0 for size in (inputs_h, inputs_w)):
+            raise ValueError('The input size must be divided by 8, but received {size}'.format(size=(inputs_h, inputs_w)))
+        x = self.encoder(self.embed(inputs))
 
-        if not (h % 6 == 0 and w % 6 == 0):
-            raise ValueError('\'pyramid pooling\' size must be divided by 6, but received {size}'.format(size=(h, w)))
+        if inputs_h is not None and inputs_w is not None and (inputs_h // 8) % 6 == 0 and (inputs_w // 8) % 6 == 0:
+            x = self._pyramid_pooling(x, inputs_h // 8, inputs_w // 8)
+        else:
+            # the rectangular inputs, resized by their long side and padded to a multiple of 8 only
+            x = self._adaptive_pyramid_pooling(x)
+
+        x = layers.Conv2D(512, 3, strides=1, padding='same', kernel_initializer='he_normal')(x)
+        x = layers.BatchNormalization()(x)
+        x = layers.ReLU()(x)
+
+        x = layers.Conv2D(num_classes, 1, strides=1, kernel_initializer='he_normal')(x)
+        x = layers.BatchNormalization()(x)
+
+        if self.upsample:
+            x = layers.UpSampling2D(size=(8, 8), interpolation='bilinear')(x)
+
+        outputs = x
+
+        return models.Model(inputs, outputs, name=self.version)
+
+    def _pyramid_pooling(self, x, h, w):
         pool_size = [(h, w),
                      (h // 2, w // 2),
                      (h // 3, w // 3),
@@ -90,16 +114,17 @@ class PSPNet(Network):
         x6 = layers.UpSampling2D(size=pool_size[3])(x6)
 
         x = layers.Concatenate()([x, x1, x2, x3, x6])
-
-        x = layers.Conv2D(512, 3, strides=1, padding='same', kernel_initializer='he_normal')(x)
-        x = layers.BatchNormalization()(x)
-        x = layers.ReLU()(x)
-
-        x = layers.Conv2D(num_classes, 1, strides=1, kernel_initializer='he_normal')(x)
-        x = layers.BatchNormalization()(x)
-
-        x = layers.UpSampling2D(size=(8, 8), interpolation='bilinear')(x)
-
-        outputs = x
-
-        return models.Model(inputs, outputs, name=self.version)
+        return x
+
+    def _adaptive_pyramid_pooling(self, x):
+        # the same pyramid, the bins adapting their size to any (h, w)
+        pyramid = [x]
+        for bins in [1, 2, 3, 6]:
+            p = custom_layers.AdaptiveAveragePooling2D(bins)(x)
+            p = layers.Conv2D(512, 1, strides=1, kernel_initializer='he_normal')(p)
+            p = layers.BatchNormalization()(p)
+            p = layers.ReLU()(p)
+            p = custom_layers.ResizeLike()([p, x])
+            pyramid.append(p)
+
+        return layers.Concatenate()(pyramid)
@@ -0,0 +1,91 @@
+"""
+The tests of the vectorized stages of data_manipulation against the former per token code.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data.processing import data_manipulation as dm
+from data.processing.vocabulary import Vocabulary
+
+GLOVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'glove.txt')
+
+# punctuation, underscores, digits, non ascii letters and digits, full width letters, and OCR misreadings of 'total'
+TOKENS = ['TOTAL', 'Total:', 'tot_al', 'T.V.A', '12,50€', '12.50', 'N°', 'café', 'Straße', 'İstanbul', 'x²', '½',
+          '٣٤', 'ΣΟΦΙΑ', 'ｓｈｏｐ', '日本語', 'e-mail', '—-', 'Tctal', 'fotal!', 'shop', 'THE', 'Thank-you', '(and)']
+
+
+def test_normalize_texts():
+    expected = [''.join(e for e in token.lower() if e.isalnum()) for token in TOKENS]
+    assert dm.normalize_texts(TOKENS).tolist() == expected
+
+
+def _receipt_csv(path, n=48, width=640, height=1500):
+    rng = np.random.RandomState(0)
+    x1, y1 = rng.randint(0, width - 60, n), rng.randint(0, height - 20, n)
+    x2, y2 = x1 + rng.randint(5, 60, n), y1 + rng.randint(5, 20, n)
+    pd.DataFrame({'imageName': '1107_receipt', 'labels': [TOKENS[i % len(TOKENS)] for i in range(n)],
+                  'X1': x1, 'Y1': y1, 'X2': x2, 'Y2': y2, 'image_width': width, 'image_height': height,
+                  'bbox': np.stack([x1, y1, x2, y2], axis=1).tolist()}).to_csv(path, index=False)
+
+
+def test_process_receipt_tokens(tmp_path):
+    csv_file, centers_file, glove_file = [str(tmp_path / name) for name in ['receipt.csv', 'centers.csv', 'glove.csv']]
+    _receipt_csv(csv_file)
+    vocabulary = Vocabulary.from_glove(GLOVE_FILE)
+
+    # the former chain: get_relative_centers, replace_after_Levenshtein and replace_after_Glove, one token at a time
+    dm.get_relative_centers(csv_file, 480, output_file=centers_file)
+    centers = pd.read_csv(centers_file)
+    centers['No_char'] = centers['No_char'].replace(dm.LEVENSHTEIN_CORRECTIONS)
+    centers.to_csv(centers_file, index=False)
+    dm.replace_after_Glove(centers_file, vocabulary, output_file=glove_file)
+    expected = pd.read_csv(glove_file)
+
+    output_file = str(tmp_path / 'tokens.csv')
+    dm.process_receipt_tokens(csv_file, 480, vocabulary, output_file=output_file)
+    tokens = pd.read_csv(output_file)
+
+    assert tokens.columns.tolist() == ['imageName', 'labels', 'X1', 'Y1', 'X2', 'Y2', 'image_width', 'image_height',
+                                       'bbox', 'Xc', 'Yc', 'New_Image_width_and_height', 'No_char', 'Token_id',
+                                       'Tokens']
+    pd.testing.assert_frame_equal(tokens.drop(columns='Token_id'), expected)
+    assert (tokens['Tokens'] == 'total').sum() == 10 and (tokens['Tokens'] != 'mekene').sum() > 10
+    np.testing.assert_array_equal(tokens['Token_id'], vocabulary.ids(expected['Tokens'].values))
+
+
+def _vgg_csv(path):
+    # a vgg annotator export: a rect, a polygon, an image without region, and a second rect on the first receipt
+    regions = [('1107-receipt.jpg', {'name': 'rect', 'x': 10, 'y': 20, 'width': 300, 'height': 40}),
+               ('1108-receipt.jpg', {'name': 'polygon', 'all_points_x': [50, 120, 90, 40],
+                                     'all_points_y': [200, 210, 260, 250]}),
+               ('1109-receipt.jpg', {}),
+               ('1107-receipt.jpg', {'name': 'rect', 'x': 5.6, 'y': 400, 'width': 100, 'height': 30})]
+    pd.DataFrame({'filename': [filename for filename, _ in regions],
+                  'file_size': 1000, 'file_attributes': '{}',
+                  'region_count': [2, 1, 0, 2], 'region_id': [0, 0, 0, 1],
+                  'region_shape_attributes': [json.dumps(region) for _, region in regions],
+                  'region_attributes': '{}'}).to_csv(path, index=False)
+    return path
+
+
+def test_parse_vgg_regions(tmp_path):
+    names, boxes = dm.parse_vgg_regions(_vgg_csv(str(tmp_path / 'vgg.csv')))
+    assert names.tolist() == ['1107_receipt', '1108_receipt', '1107_receipt']
+    assert boxes.dtype == np.int32
+    assert boxes.tolist() == [[10, 20, 310, 60], [40, 200, 120, 260], [5, 400, 105, 430]]
+
+
+def test_vgg_zones(tmp_path):
+    zones = dm.vgg_zones(_vgg_csv(str(tmp_path / 'vgg.csv')), zones_path=str(tmp_path / 'zones'))
+    assert zones.receipt_ids == ['1107_receipt', '1108_receipt'] and '1109_receipt' not in zones
+    assert zones.receipt('1107_receipt')['y1'].tolist() == [20, 400]
+    assert zones.receipt('1108_receipt')['x2'].tolist() == [120]
+    assert os.path.exists(str(tmp_path / 'zones' / 'chunk_00000.npz'))
@@ -0,0 +1,74 @@
+"""
+The tests of the decoding of the predictions per token.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+
+from data.processing.decoding import softmax, token_scores, extract_fields
+
+
+def _tokens(n, seed, image_width=600, image_height=1200):
+    rng = np.random.RandomState(seed)
+    x1, y1 = rng.randint(0, image_width - 40, n), rng.randint(0, image_height - 20, n)
+    x2, y2 = x1 + rng.randint(1, 40, n), y1 + rng.randint(1, 20, n)
+    ratio = 480. / max(image_width, image_height)
+    return {'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+            'xc': ((x1 + x2) / 2 * ratio).astype(np.int32), 'yc': ((y1 + y2) / 2 * ratio).astype(np.int32),
+            'image_width': np.full(n, image_width), 'image_height': np.full(n, image_height),
+            'grid_row': rng.randint(-1, 60, n), 'grid_col': rng.randint(0, 60, n),
+            'text': ['token{i}'.format(i=i) for i in range(n)]}
+
+
+def test_box_scores():
+    # the summed area table gives the mean of the probabilities over the cells of each box
+    probs = softmax(np.random.RandomState(0).normal(size=(60, 60, 4)))
+    tokens = _tokens(50, 1)
+    scores = token_scores(probs, tokens, input_size=480, mode='box')
+
+    scale = 480. / 1200 * 60 / 480
+    for t in range(50):
+        r1, c1 = int(np.floor(tokens['y1'][t] * scale)), int(np.floor(tokens['x1'][t] * scale))
+        r2 = max(int(np.ceil(tokens['y2'][t] * scale)), r1 + 1)
+        c2 = max(int(np.ceil(tokens['x2'][t] * scale)), c1 + 1)
+        np.testing.assert_allclose(scores[t], probs[r1:r2, c1:c2].mean(axis=(0, 1)), rtol=1e-5)
+
+
+def test_box_scores_padded():
+    # a 600x1200 receipt resized to 240x480, in an input padded to the largest receipt of its batch
+    probs = softmax(np.random.RandomState(4).normal(size=(64, 34, 3)))
+    tokens = _tokens(40, 5)
+    scores = token_scores(probs, tokens, input_size=(512, 272), mode='box', desired_dimension=480)
+
+    scale = 480. / 1200 / 8
+    for t in range(40):
+        r1, c1 = int(np.floor(tokens['y1'][t] * scale)), int(np.floor(tokens['x1'][t] * scale))
+        r2 = max(int(np.ceil(tokens['y2'][t] * scale)), r1 + 1)
+        c2 = max(int(np.ceil(tokens['x2'][t] * scale)), c1 + 1)
+        np.testing.assert_allclose(scores[t], probs[r1:r2, c1:c2].mean(axis=(0, 1)), rtol=1e-5)
+    assert not np.allclose(scores, token_scores(probs, tokens, input_size=(512, 272), mode='box'))
+
+
+def test_center_and_grid_scores():
+    probs = softmax(np.random.RandomState(2).normal(size=(60, 60, 3)))
+    tokens = _tokens(30, 3)
+
+    scores = token_scores(probs, tokens, input_size=480, mode='center')
+    np.testing.assert_allclose(scores, probs[tokens['yc'] // 8, tokens['xc'] // 8])
+
+    scores = token_scores(probs, tokens, mode='grid')
+    placed = tokens['grid_row'] >= 0
+    np.testing.assert_allclose(scores[placed], probs[tokens['grid_row'][placed], tokens['grid_col'][placed]])
+    assert (scores[~placed] == 0).all()
+
+
+def test_extract_fields():
+    tokens = {'x1': np.array([50, 0, 0, 0]), 'y1': np.array([0, 0, 30, 60]),
+              'x2': np.array([90, 40, 40, 40]), 'y2': np.array([10, 10, 40, 70]),
+              'text': ['15.00', 'total', 'shop', 'tva']}
+    scores = np.array([[0.1, 0.9, 0.], [0.2, 0.8, 0.], [0.3, 0., 0.7], [0.6, 0.4, 0.]])
+    fields = extract_fields(scores, tokens, ['background', 'total', 'company'])
+    assert fields == {'total': 'total 15.00', 'company': 'shop'}
@@ -0,0 +1,68 @@
+"""
+The tests of the binary glove store and of the embedding table of the receipts.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import json
+import os
+
+import numpy as np
+
+from data.processing.embeddings import GloveStore, convert_glove, build_dataset_embeddings, COVERAGE_FILE
+from data.processing.token_store import TokenStore
+from data.processing.vocabulary import OOV_WORD, OOV_ID
+
+GLOVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'glove.txt')
+
+
+def _glove_txt():
+    with open(GLOVE_FILE) as f:
+        lines = [line.split() for line in f]
+    return [line[0] for line in lines], np.array([line[1:] for line in lines], dtype=np.float32)
+
+
+def test_convert_glove(tmp_path):
+    words, vectors = _glove_txt()
+    glove = GloveStore(convert_glove(GLOVE_FILE, str(tmp_path / 'glove')))
+
+    assert glove.words == [OOV_WORD] + words and glove.dim == 200
+    assert (glove.vectors[OOV_ID] == 0).all()
+    np.testing.assert_array_equal(glove.vectors[1:], vectors)
+    for i, word in enumerate(words, start=1):
+        assert word in glove and glove.word_ids[word] == i
+        np.testing.assert_array_equal(glove[word], vectors[i - 1])
+    np.testing.assert_array_equal(glove.ids(['total', 'unknown', 'the']), [2, OOV_ID, 1])
+
+    # float16 halves the matrix
+    half = GloveStore(convert_glove(GLOVE_FILE, str(tmp_path / 'glove16'), dtype=np.float16))
+    np.testing.assert_allclose(half.lookup([2, 3]), vectors[1:3], atol=1e-3)
+
+
+def test_stable_ids(tmp_path):
+    glove = GloveStore(convert_glove(GLOVE_FILE, str(tmp_path / 'glove')))
+    table_dir = str(tmp_path / 'table')
+
+    store = TokenStore()
+    store.append('1_receipt', norm_text=['total', 'tva', 'total', 'xyz', 'shop'])
+    table = build_dataset_embeddings(store, glove, table_dir)
+    # the most frequent new word first, 'mekene' at 0
+    assert table.words == [OOV_WORD, 'total', 'shop', 'tva']
+    np.testing.assert_array_equal(store.column('token_id'), [1, 3, 1, OOV_ID, 2])
+    assert store.column('token').tolist() == ['total', 'tva', 'total', OOV_WORD, 'shop']
+    np.testing.assert_array_equal(table['tva'], glove['tva'])
+
+    with open(os.path.join(table_dir, COVERAGE_FILE)) as f:
+        coverage = json.load(f)
+    assert coverage['num_tokens'] == 5 and coverage['num_tokens_in_vocab'] == 4
+    assert coverage['top_oov'] == [['xyz', 1]]
+
+    # a rebuild with more receipts keeps the ids of the table, the new words are appended
+    store.append('2_receipt', norm_text=['cash', 'cash', 'euro', 'tva'])
+    table = build_dataset_embeddings(store, glove, table_dir)
+    assert table.words == [OOV_WORD, 'total', 'shop', 'tva', 'cash', 'euro']
+    np.testing.assert_array_equal(store.receipt('1_receipt')['token_id'], [1, 3, 1, OOV_ID, 2])
+    np.testing.assert_array_equal(store.receipt('2_receipt')['token_id'], [4, 4, 5, 3])
+    np.testing.assert_array_equal(table.lookup([4, 5]), glove.lookup(glove.ids(['cash', 'euro'])))
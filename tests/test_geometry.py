@@ -0,0 +1,49 @@
+"""
+The tests of the box geometry.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+
+from data.processing.geometry import Boxes, intersection_matrix, iou_matrix
+
+
+def _iou(a, b):
+    # the IoU of two [x1, y1, x2, y2] boxes, one at a time
+    width = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    height = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    overlap = width * height
+    return overlap / (float((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - overlap) + 1e-5)
+
+
+def _random_boxes(n, seed):
+    rng = np.random.RandomState(seed)
+    x1, y1 = rng.randint(0, 100, n), rng.randint(0, 100, n)
+    return np.stack([x1, y1, x1 + rng.randint(1, 40, n), y1 + rng.randint(1, 40, n)], axis=1)
+
+
+def test_boxes():
+    boxes = Boxes.from_array([[0, 0, 10, 4], [2, 2, 4, 8]])
+    assert boxes.x1.dtype == np.int32 and len(boxes) == 2
+    np.testing.assert_array_equal(boxes.area(), [40, 12])
+    np.testing.assert_allclose(boxes.centers(), [[5, 2], [3, 5]])
+    np.testing.assert_array_equal(boxes.union().to_array(), [[0, 0, 10, 8]])
+    np.testing.assert_array_equal(boxes.clip(5, 5).to_array(), [[0, 0, 5, 4], [2, 2, 4, 5]])
+    assert len(Boxes.from_array([])) == 0
+
+
+def test_intersection_matrix():
+    a = Boxes.from_array([[0, 0, 10, 10]])
+    b = Boxes.from_array([[5, 5, 15, 15], [20, 20, 30, 30], [10, 0, 20, 10]])
+    np.testing.assert_array_equal(intersection_matrix(a, b), [[25, 0, 0]])
+
+
+def test_iou_matrix():
+    a, b = _random_boxes(30, 0), _random_boxes(20, 1)
+    expected = np.array([[_iou(box_a, box_b) for box_b in b] for box_a in a])
+    ious = iou_matrix(Boxes.from_array(a), Boxes.from_array(b))
+    assert ious.shape == (30, 20)
+    np.testing.assert_allclose(ious, expected, rtol=1e-6)
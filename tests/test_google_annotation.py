@@ -0,0 +1,118 @@
+"""
+The tests of the batched OCR ingestion, against a stand-in of the google vision client.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import random
+import threading
+import time
+
+import pytest
+
+vision = pytest.importorskip('google.cloud.vision')
+
+from google.api_core import exceptions as google_exceptions
+from utils.google_annotation import OCRIngestionEngine
+
+
+class FakeClient(object):
+    """
+    A stand-in of ImageAnnotatorClient: the text of each image is its content,
+    the images whose content starts with 'error' fail, and the first num_failures requests are unavailable.
+    """
+
+    def __init__(self, num_failures=0, delay=0.):
+        self.num_failures = num_failures
+        self.delay = delay
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def batch_annotate_images(self, requests, retry=None):
+        with self.lock:
+            self.batch_sizes.append(len(requests))
+            if self.num_failures > 0:
+                self.num_failures -= 1
+                raise google_exceptions.ServiceUnavailable('overloaded')
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay)) # the batches complete out of order
+
+        responses = []
+        for request in requests:
+            content = request.image.content.decode()
+            if content.startswith('error'):
+                responses.append(vision.AnnotateImageResponse(error={'code': 3, 'message': 'bad image'}))
+            else:
+                text = vision.EntityAnnotation(description=content,
+                                               bounding_poly={'vertices': [{'x': 0, 'y': 0}, {'x': 1, 'y': 0},
+                                                                           {'x': 1, 'y': 1}, {'x': 0, 'y': 1}]})
+                responses.append(vision.AnnotateImageResponse(text_annotations=[text]))
+        return vision.BatchAnnotateImagesResponse(responses=responses)
+
+
+def _images(tmp_path, contents):
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / '{i}.jpg'.format(i=i)
+        path.write_bytes(content.encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_order_under_concurrency(tmp_path):
+    paths = _images(tmp_path, ['image{i}'.format(i=i) for i in range(50)])
+    engine = OCRIngestionEngine(client=FakeClient(delay=0.02), batch_size=3, max_workers=4, verbose=0)
+    results = list(engine.annotate(paths))
+
+    assert [image_file for image_file, _ in results] == paths
+    assert [text[0].description for _, text in results] == ['image{i}'.format(i=i) for i in range(50)]
+    assert engine.num_images == 50 and engine.images_per_sec() > 0
+
+
+def test_batch_size(tmp_path):
+    client = FakeClient()
+    engine = OCRIngestionEngine(client=client, batch_size=16, max_workers=1, verbose=0)
+    list(engine.annotate(_images(tmp_path, ['image'] * 35)))
+    assert client.batch_sizes == [16, 16, 3]
+
+
+def test_retry_with_backoff(tmp_path, monkeypatch):
+    delays = []
+    monkeypatch.setattr(time, 'sleep', delays.append)
+    client = FakeClient(num_failures=3)
+    engine = OCRIngestionEngine(client=client, batch_size=4, max_workers=1, backoff=1., max_backoff=3., verbose=0)
+    results = list(engine.annotate(_images(tmp_path, ['image'] * 4)))
+
+    assert len(results) == 4 and len(client.batch_sizes) == 4
+    # the delays double up to max_backoff, with a jitter of 0.5 to 1
+    assert len(delays) == 3
+    for delay, limit in zip(delays, [1., 2., 3.]):
+        assert limit / 2 <= delay <= limit
+
+
+def test_retries_exhausted(tmp_path, monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda delay: None)
+    engine = OCRIngestionEngine(client=FakeClient(num_failures=10), max_retries=2, verbose=0)
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        list(engine.annotate(_images(tmp_path, ['image'])))
+
+
+def test_failed_image(tmp_path):
+    paths = _images(tmp_path, ['image0', 'error1', 'image2'])
+    engine = OCRIngestionEngine(client=FakeClient(), batch_size=2, verbose=0)
+    with pytest.warns(UserWarning):
+        results = list(engine.annotate(paths))
+
+    assert results[1] == (paths[1], None)
+    assert results[0][1][0].description == 'image0' and results[2][1][0].description == 'image2'
+
+
+def test_partial_consumption(tmp_path):
+    # the throughput is recorded when the generator is closed before the end
+    engine = OCRIngestionEngine(client=FakeClient(), batch_size=2, max_workers=2, verbose=0)
+    annotations = engine.annotate(_images(tmp_path, ['image'] * 20))
+    next(annotations)
+    annotations.close()
+    assert engine.num_images == 1 and engine.elapsed > 0
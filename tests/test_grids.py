@@ -0,0 +1,113 @@
+"""
+The tests of the sparse token grids.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+
+from data.processing.geometry import Boxes
+from data.processing.masks import rasterize_boxes, save_mask
+from data.processing.token_store import TokenStore
+from data.processing.grids import place_tokens, sparse_grids, densify, id_grids, SparseGridLoader
+
+
+def _store():
+    # 2 receipts on a 4x4 grid: a dropped token (-1), a 'mekene' token (0) and a token whose id is not computed (-1)
+    store = TokenStore()
+    store.append('1_receipt', grid_row=[0, 1, -1, 3], grid_col=[0, 2, -1, 3], token_id=[3, 1, 2, 0])
+    store.append('2_receipt', grid_row=[2, 2], grid_col=[1, 2], token_id=[4, -1])
+    return store
+
+
+def test_densify():
+    vectors = np.arange(5 * 3, dtype=np.float32).reshape(5, 3)
+    vectors[0] = 0
+    grids = densify(_store(), ['1_receipt', '2_receipt'], vectors, 4)
+
+    expected = np.zeros((2, 4, 4, 3), dtype=np.float32)
+    expected[0, 0, 0], expected[0, 1, 2], expected[1, 2, 1] = vectors[3], vectors[1], vectors[4]
+    np.testing.assert_array_equal(grids, expected)
+
+    # the buffer is reused, the cells of the previous batch are cleared
+    np.testing.assert_array_equal(densify(_store(), ['2_receipt'], vectors, 4, out=grids[:1]), expected[1:])
+
+
+def test_id_grids():
+    # the id grids embedded by the lookup of their ids give the dense grids
+    vectors = np.random.RandomState(0).normal(size=(5, 3)).astype(np.float32)
+    vectors[0] = 0
+    store = _store()
+    ids = id_grids(store, ['2_receipt', '1_receipt'], 4)
+    assert ids.dtype == np.int32
+    np.testing.assert_array_equal(vectors[ids], densify(store, ['2_receipt', '1_receipt'], vectors, 4))
+
+
+def test_place_tokens():
+    # the first token of a cell keeps it, the next ones take the first free cell of the spiral, in order
+    rows, cols = place_tokens([1, 1, 1, 0], [1, 1, 1, 3], [True, True, True, False], 3)
+    assert rows.tolist() == [1, 1, 2, 0] and cols.tolist() == [1, 2, 2, 2]
+
+    # 'mekene' tokens (id 0) stay on their own cell without taking it
+    rows, cols = place_tokens([0, 0, 0], [0, 0, 0], [0, 5, 6], 2)
+    assert rows.tolist() == [0, 0, 0] and cols.tolist() == [0, 0, 1]
+
+    # nor do the tokens whose id is not computed yet (-1), which densify leaves out
+    rows, cols = place_tokens([0, 0, 0], [0, 0, 0], [-1, 5, 6], 2)
+    assert rows.tolist() == [0, 0, 0] and cols.tolist() == [0, 0, 1]
+
+
+def test_place_tokens_full_grid():
+    # every token is placed on a distinct cell while the grid has free cells, the others are dropped
+    rng = np.random.RandomState(1)
+    token_rows, token_cols = rng.randint(0, 2, 30), rng.randint(0, 2, 30)
+    rows, cols = place_tokens(token_rows, token_cols, np.ones(30, dtype=bool), 5)
+    placed = rows >= 0
+    assert placed.sum() == 25 and not placed[25:].any()
+    assert len(set(zip(rows[placed].tolist(), cols[placed].tolist()))) == 25
+
+    # the same tokens give the same grid
+    again = place_tokens(token_rows, token_cols, np.ones(30, dtype=bool), 5)
+    np.testing.assert_array_equal(again[0], rows)
+    np.testing.assert_array_equal(again[1], cols)
+
+
+def test_place_tokens_neighbours():
+    # the former search of final_grids: the cell, then right, down, left and up only
+    rows, cols = place_tokens([1] * 6, [1] * 6, np.ones(6, dtype=bool), 3, search='neighbours')
+    assert rows.tolist() == [1, 1, 2, 1, 0, -1] and cols.tolist() == [1, 2, 1, 0, 1, -1]
+
+
+def test_loader_masks_rectangular(tmp_path):
+    # a 1000x2000 receipt: the mask is letterboxed as the tokens, it is 1 at the cell of every token of the zone
+    width, height, grid_size, desired = 1000, 2000, 64, 480
+    rng = np.random.RandomState(4)
+    x1, y1 = rng.randint(0, 950, 80), rng.randint(0, 1980, 80)
+    boxes = Boxes(x1, y1, x1 + rng.randint(10, 50, 80), y1 + rng.randint(5, 20, 80))
+    in_zone = (boxes.x1 >= 100) & (boxes.x2 <= 700) & (boxes.y1 >= 1200) & (boxes.y2 <= 1500)
+
+    ratio = desired / max(width, height)
+    centers = boxes.centers()
+    store = TokenStore()
+    store.append('1_receipt', x1=boxes.x1, y1=boxes.y1, x2=boxes.x2, y2=boxes.y2,
+                 xc=(centers[:, 0] * ratio).astype(np.int32), yc=(centers[:, 1] * ratio).astype(np.int32),
+                 image_width=np.full(80, width), image_height=np.full(80, height), token_id=np.arange(1, 81))
+    sparse_grids(store, grid_size, desired)
+
+    mask_file = str(tmp_path / '1-receipt.npz')
+    save_mask(mask_file, rasterize_boxes(boxes[in_zone], width, height))
+    loader = SparseGridLoader(store, None, grid_size, 1, {'1_receipt': mask_file}, shuffle=False)
+    grids, masks = loader[0]
+
+    assert in_zone.sum() > 0 and masks.shape == (1, grid_size, grid_size, 1)
+    tokens = store.receipt('1_receipt')
+    rows, cols = tokens['grid_row'], tokens['grid_col']
+    # the tokens moved to a free cell are not under their own center
+    kept = in_zone & (rows == (tokens['yc'] * grid_size / desired).astype(int)) & \
+           (cols == (tokens['xc'] * grid_size / desired).astype(int))
+    assert kept.sum() > 0
+    assert (masks[0, rows[kept], cols[kept], 0] == 1).all()
+    # the padding to the right of the receipt is empty
+    assert (masks[0, :, grid_size // 2 + 1:] == 0).all()
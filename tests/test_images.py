@@ -0,0 +1,111 @@
+"""
+The tests of the image resizing and reduced decoding.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from data.processing.images import letterbox, reduction_factor, target_dimensions, load_image, padded_shape, \
+    fit_long_side
+
+
+def _image(h, w, c=3):
+    return np.random.RandomState(0).randint(1, 256, (h, w, c)).astype(np.uint8)
+
+
+@pytest.mark.parametrize('shape', [(600, 300, 3), (300, 600, 3), (480, 480, 3), (100, 50, 1), (70, 90)])
+def test_letterbox(shape):
+    image = _image(*shape[:2], 3)[..., :shape[2]] if len(shape) == 3 else _image(*shape)[..., 0]
+    square, (scale, dx, dy) = letterbox(image, 480, pad_value=7)
+    h, w = shape[:2]
+    new_h, new_w = int(round(h * 480 / max(h, w))), int(round(w * 480 / max(h, w)))
+
+    assert square.shape == (480, 480) + shape[2:] and square.dtype == np.uint8
+    assert (scale, dx, dy) == (480 / max(h, w), 0, 0)
+    #anchored top left, the padding is only at the bottom and on the right
+    window = square[:new_h, :new_w]
+    expected = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_NEAREST).reshape(window.shape)
+    np.testing.assert_array_equal(window, expected)
+    assert (square[new_h:] == 7).all() and (square[:, new_w:] == 7).all()
+
+
+def test_letterbox_center_out():
+    out = np.full((480, 480, 3), 3, dtype=np.uint8)
+    square, (scale, dx, dy) = letterbox(_image(600, 300), 480, center=True, out=out)
+    assert square is out and (scale, dx, dy) == (0.8, 120, 0)
+    assert (square[:, :120] == 0).all() and (square[:, 360:] == 0).all() and (square[:, 120:360] > 0).all()
+
+
+@pytest.mark.parametrize('image_size', [(4000, 3000), (3000, 4000), (1000, 500), (481, 100), (480, 480), (200, 100)])
+@pytest.mark.parametrize('target_size', [480, (480, 272), 1000])
+def test_reduction_factor(image_size, target_size):
+    factor = reduction_factor(image_size, target_size)
+    tw, th = target_dimensions(image_size, target_size)
+    w, h = image_size
+    assert factor in [1, 2, 4, 8]
+    #never under sampled below the target, and the largest factor doing so
+    assert factor == 1 or (-(-w // factor) >= tw and -(-h // factor) >= th)
+    assert factor == 8 or -(-w // (2 * factor)) < tw or -(-h // (2 * factor)) < th
+    assert reduction_factor(image_size, None) == 1
+
+
+@pytest.mark.parametrize('backend', ['pil', 'cv2'])
+def test_load_image(tmp_path, backend):
+    image = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    image[:, :1000] = 255
+    Image.fromarray(image).save(str(tmp_path / 'receipt.jpg'))
+    Image.fromarray(image).save(str(tmp_path / 'receipt.png'))
+    assert reduction_factor((2000, 1000), 480) == 4
+
+    reduced, image_size = load_image(str(tmp_path / 'receipt.jpg'), 480, backend=backend)
+    assert image_size == (2000, 1000) and reduced.dtype == np.uint8 and reduced.shape == (250, 500, 3)
+    assert reduced[:, :240].min() > 200 and reduced[:, 260:].max() < 50
+
+    full, _ = load_image(str(tmp_path / 'receipt.jpg'), None, backend=backend)
+    assert full.shape == (1000, 2000, 3)
+    #other formats are fully decoded
+    assert load_image(str(tmp_path / 'receipt.png'), 480, backend=backend)[0].shape == (1000, 2000, 3)
+
+
+@pytest.mark.parametrize('image_size, expected', [((1000, 2000), (480, 240)), ((2000, 1000), (240, 480)),
+                                                  ((1000, 1900), (480, 256)), ((333, 1000), (480, 160)),
+                                                  ((480, 480), (480, 480))])
+def test_padded_shape(image_size, expected):
+    assert padded_shape(image_size, 480) == expected
+    assert all(side % 32 == 0 for side in padded_shape(image_size, 480, multiple=32))
+
+
+@pytest.mark.parametrize('shape', [(1900, 1000, 3), (1000, 1900, 3), (600, 600, 1), (1000, 333)])
+def test_fit_long_side(shape):
+    image = _image(*shape[:2], 3)[..., :shape[2]] if len(shape) == 3 else _image(*shape)[..., 0]
+    h, w = shape[:2]
+    new_w, new_h = target_dimensions((w, h), 480)
+    padded, (scale, dx, dy) = fit_long_side(image, 480, pad_value=7)
+
+    assert padded.shape == padded_shape((w, h), 480) + shape[2:] and padded.dtype == np.uint8
+    assert (scale, dx, dy) == (480 / max(h, w), 0, 0)
+    window = padded[:new_h, :new_w]
+    np.testing.assert_array_equal(window, cv2.resize(image, (new_w, new_h),
+                                                     interpolation=cv2.INTER_NEAREST).reshape(window.shape))
+    assert (padded[new_h:] == 7).all() and (padded[:, new_w:] == 7).all()
+
+
+def test_fit_long_side_reduced():
+    #an image decoded at 1/4 and its full size mask are resized to the same size
+    image, _ = fit_long_side(_image(250, 475), 480, image_size=(1900, 1000))
+    mask, _ = fit_long_side(np.ones((1000, 1900), dtype=np.uint8), 480)
+    assert image.shape[:2] == mask.shape == (256, 480)
+    assert (image[:253, :480] > 0).all() and (image[253:] == 0).all()
+    assert (mask[:253] == 1).all() and (mask[253:] == 0).all()
+
+    out = np.full((8, 480, 480, 3), 5, dtype=np.uint8)
+    padded, _ = fit_long_side(_image(250, 475), 480, image_size=(1900, 1000), out=out[0])
+    assert padded.base is out and (out[0, 253:] == 0).all() and (out[1] == 5).all()
+    with pytest.raises(ValueError):
+        fit_long_side(_image(1000, 1900), 480, out=out[0, :200])
@@ -0,0 +1,87 @@
+"""
+The tests of the custom layers, skipped when tensorflow is not installed.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from utils import layers as custom_layers
+
+
+@pytest.mark.parametrize('dilation_rate', [1, 2])
+def test_sparse_conv(dilation_rate):
+    # at the active cells, the sparse convolution is the dense convolution of the features of the active cells only
+    rng = np.random.RandomState(0)
+    active = rng.uniform(size=(2, 20, 24)) < 0.1
+    features = (rng.normal(size=(2, 20, 24, 8)) * active[..., None]).astype(np.float32)
+
+    sparse = custom_layers.SparseConv2D(16, 3, dilation_rate=dilation_rate)
+    outputs = sparse([tf.constant(features), tf.constant(active)]).numpy()
+    dense = tf.keras.layers.Conv2D(16, 3, padding='same', dilation_rate=dilation_rate)
+    dense(tf.constant(features))
+    dense.set_weights(sparse.get_weights())
+    expected = dense(tf.constant(features)).numpy()
+
+    assert outputs.shape == (2, 20, 24, 16)
+    np.testing.assert_allclose(outputs[active], expected[active], rtol=1e-4, atol=1e-4)
+    assert (outputs[~active] == 0).all()
+
+
+@pytest.mark.parametrize('size', [(12, 12), (30, 17), (5, 9)])
+def test_adaptive_average_pooling(size):
+    # the cell i spans the rows floor(i * h / bins) to ceil((i + 1) * h / bins), the same for the columns
+    h, w = size
+    bins = 6
+    inputs = np.random.RandomState(1).normal(size=(2, h, w, 3)).astype(np.float32)
+    outputs = custom_layers.AdaptiveAveragePooling2D(bins)(tf.constant(inputs)).numpy()
+
+    expected = np.empty((2, bins, bins, 3), dtype=np.float32)
+    for i in range(bins):
+        for j in range(bins):
+            r1, r2 = i * h // bins, -(-(i + 1) * h // bins)
+            c1, c2 = j * w // bins, -(-(j + 1) * w // bins)
+            expected[:, i, j] = inputs[:, r1:r2, c1:c2].mean(axis=(1, 2))
+    np.testing.assert_allclose(outputs, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_resize_like():
+    x = tf.zeros((1, 6, 5, 2))
+    reference = tf.zeros((1, 48, 40, 7))
+    assert custom_layers.ResizeLike()([x, reference]).shape == (1, 48, 40, 2)
+
+
+@pytest.mark.parametrize('trainable', [False, True])
+def test_token_embedding(trainable):
+    # the pad id 0 is the zero vector, even when the row 0 of the trained embeddings is not
+    vectors = np.random.RandomState(2).normal(size=(10, 5)).astype(np.float32)
+    embedding = custom_layers.TokenEmbedding(10, 5, pad_id=0, trainable=trainable,
+                                             embeddings_initializer=tf.keras.initializers.Constant(vectors))
+    ids = np.random.RandomState(3).randint(0, 10, (2, 6, 4)).astype(np.int32)
+    outputs = embedding(tf.constant(ids)).numpy()
+
+    assert outputs.shape == (2, 6, 4, 5)
+    np.testing.assert_allclose(outputs[ids != 0], vectors[ids[ids != 0]])
+    assert (outputs[ids == 0] == 0).all()
+    assert embedding.compute_mask(tf.constant(ids)) is None
+
+
+def test_gather_tokens():
+    # the positions are divided by the stride and clipped to the map, the padding positions (-1) give 0
+    features = np.random.RandomState(4).normal(size=(2, 6, 5, 3)).astype(np.float32)
+    positions = np.array([[[0, 0], [13, 9], [47, 39], [100, 100], [-1, -1]],
+                          [[8, 8], [47, 0], [0, 39], [-1, 3], [5, 7]]], dtype=np.int32)
+    outputs = custom_layers.GatherTokens(stride=8)([tf.constant(features), tf.constant(positions)]).numpy()
+
+    rows = np.minimum(np.maximum(positions[..., 0], 0) // 8, 5)
+    cols = np.minimum(np.maximum(positions[..., 1], 0) // 8, 4)
+    expected = features[np.arange(2)[:, None], rows, cols] * (positions >= 0).all(axis=-1)[..., None]
+    assert outputs.shape == (2, 5, 3)
+    np.testing.assert_allclose(outputs, expected)
+    assert (outputs[0, 4] == 0).all() and (outputs[1, 3] == 0).all()
+    np.testing.assert_allclose(outputs[0, 3], features[0, 5, 4])
@@ -0,0 +1,72 @@
+"""
+The tests of the mask rasterizer and of the mask formats.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+import pytest
+
+from data.processing.geometry import Boxes
+from data.processing.masks import rasterize_boxes, encode_mask, decode_mask, save_mask, load_mask
+
+
+def _painted(boxes, width, height):
+    # the number of boxes covering each pixel, painted box by box
+    counts = np.zeros((height, width), dtype=np.int32)
+    for x1, y1, x2, y2 in boxes:
+        counts[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)] += 1
+    return counts
+
+
+def _boxes(n, seed):
+    rng = np.random.RandomState(seed)
+    x1, y1 = rng.randint(-10, 90, n), rng.randint(-10, 140, n)
+    return np.stack([x1, y1, x1 + rng.randint(0, 30, n), y1 + rng.randint(0, 15, n)], axis=1)
+
+
+def test_rasterize_union():
+    boxes = _boxes(60, 0)
+    mask = rasterize_boxes(Boxes.from_array(boxes), 100, 150)
+    assert mask.shape == (150, 100) and mask.dtype == np.uint8
+    np.testing.assert_array_equal(mask, _painted(boxes, 100, 150) > 0)
+
+
+def test_rasterize_erase():
+    boxes = _boxes(60, 1)
+    mask = rasterize_boxes(Boxes.from_array(boxes), 100, 150, overlap='erase')
+    np.testing.assert_array_equal(mask, _painted(boxes, 100, 150) == 1)
+
+
+def test_rasterize_out_size():
+    # a token smaller than a pixel of the mask still covers a pixel
+    mask = rasterize_boxes(Boxes.from_array([[10, 10, 11, 11]]), 1000, 1000, out_size=(100, 100))
+    assert mask.sum() == 1 and mask[1, 1] == 1
+
+
+@pytest.mark.parametrize('density', [0.01, 0.5])
+def test_rle_round_trip(density):
+    rng = np.random.RandomState(2)
+    mask = (rng.uniform(size=(120, 90)) < density) * rng.randint(1, 5, (120, 90))
+    mask = mask.astype(np.uint8)
+    rle = encode_mask(mask)
+    np.testing.assert_array_equal(decode_mask(rle), mask)
+
+    out = np.full((120, 90, 1), 9, dtype=np.float32)
+    decode_mask(rle, out)
+    np.testing.assert_array_equal(out[:, :, 0], mask)
+
+
+@pytest.mark.parametrize('extension', ['npz', 'png'])
+def test_save_load(tmp_path, extension):
+    mask = rasterize_boxes(Boxes.from_array(_boxes(30, 3)), 100, 150) * 3
+    path = str(tmp_path / 'mask.{extension}'.format(extension=extension))
+    save_mask(path, mask)
+    np.testing.assert_array_equal(load_mask(path), mask)
+
+    # into a batch buffer of another size, resized with the nearest neighbour
+    out = np.zeros((300, 200, 1), dtype=np.float32)
+    load_mask(path, out)
+    np.testing.assert_array_equal(out[::2, ::2, 0], mask)
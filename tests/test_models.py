@@ -0,0 +1,85 @@
+"""
+The tests of the networks on the grids of token ids, skipped when tensorflow is not installed.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from model.network import Network
+
+
+def _vectors(n=13, dim=16):
+    vectors = np.random.RandomState(0).normal(size=(n, dim)).astype(np.float32)
+    vectors[0] = 0
+    return vectors
+
+
+def _grids(n=13, batch=2, size=(16, 12)):
+    return np.random.RandomState(1).randint(0, n, (batch,) + size).astype(np.int32)
+
+
+def test_network_embeddings():
+    network = Network(4, base_model=None, embeddings=_vectors())
+    inputs = network.get_inputs((16, 12))
+    assert tf.as_dtype(inputs.dtype) == tf.int32 and tuple(inputs.shape) == (None, 16, 12)
+
+    model = tf.keras.models.Model(inputs, network.embed(inputs))
+    grids = _grids()
+    outputs = model.predict(grids, verbose=0)
+    np.testing.assert_allclose(outputs, _vectors()[grids])
+    assert not network.embedding.trainable
+
+    # the float inputs are not embedded
+    assert Network(4, base_model=None).embedding is None
+    vectors = _vectors()
+    vectors[0] = 1
+    with pytest.raises(ValueError):
+        Network(4, base_model=None, embeddings=vectors)
+
+
+@pytest.mark.parametrize('version', ['CUTIE-A', 'CUTIE-B'])
+def test_cutie(version):
+    from model.cutie import CUTIE
+
+    model = CUTIE(4, version, embeddings=_vectors(), filters=8)(input_size=(16, 12))
+    assert tf.as_dtype(model.inputs[0].dtype) == tf.int32
+    outputs = model.predict(_grids(), verbose=0)
+    assert outputs.shape == (2, 16, 12, 4) and np.isfinite(outputs).all()
+
+    # the float grids of the previous pipeline
+    model = CUTIE(4, version, grid_channels=16, filters=8)(input_size=(16, 12))
+    assert model.predict(_vectors()[_grids()], verbose=0).shape == (2, 16, 12, 4)
+
+
+def test_cutie_image_branch():
+    from model.cutie import CUTIE
+
+    model = CUTIE(3, 'CUTIE-A', embeddings=_vectors(), filters=8, image_branch=True)(input_size=(16, 12),
+                                                                                     image_size=(64, 48))
+    images = np.random.RandomState(2).uniform(size=(2, 64, 48, 3)).astype(np.float32)
+    assert model.predict([_grids(), images], verbose=0).shape == (2, 16, 12, 3)
+    with pytest.raises(ValueError):
+        CUTIE(3, 'CUTIE-A', filters=8, image_branch=True)(input_size=(16, 12), image_size=(48, 48))
+    with pytest.raises(ValueError):
+        CUTIE(3, 'CUTIE-A', embeddings=_vectors(), filters=8)(input_size=(18, 12))
+
+
+@pytest.mark.parametrize('version', ['CUTIE-A', 'CUTIE-B'])
+def test_cutie_sparse_blocks(version):
+    from model.cutie import CUTIE
+    from utils import layers as custom_layers
+
+    model = CUTIE(4, version, embeddings=_vectors(), filters=8, sparse_blocks=True)(input_size=(16, 12))
+    sparse = [layer for layer in model.layers if isinstance(layer, custom_layers.SparseConv2D)]
+    assert len(sparse) == len(CUTIE.SPARSE_BLOCKS[version])
+    outputs = model.predict(_grids(), verbose=0)
+    assert outputs.shape == (2, 16, 12, 4) and np.isfinite(outputs).all()
+
+    with pytest.raises(ValueError):
+        CUTIE(4, version, sparse_blocks=['aspp'])
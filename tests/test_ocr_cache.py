@@ -0,0 +1,173 @@
+"""
+The tests of the persistent cache of the google vision annotations.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+pytest.importorskip('google.cloud.vision')
+
+from utils.google_annotation import Annotation
+from utils.ocr_cache import OCRCache
+
+
+class Text(object):
+    """
+    The fields of a google vision text annotation read by to_annotation.
+    """
+
+    class Vertex(object):
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    class Poly(object):
+        def __init__(self, vertices):
+            self.vertices = vertices
+
+    def __init__(self, description, box):
+        x1, y1, x2, y2 = box
+        self.description = description
+        self.bounding_poly = Text.Poly([Text.Vertex(x1, y1), Text.Vertex(x2, y1), Text.Vertex(x2, y2),
+                                        Text.Vertex(x1, y2)])
+
+
+class FakeEngine(object):
+    """
+    A stand-in of OCRIngestionEngine: the whole text and one word per image, None for the failing images.
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.annotated = []
+
+    def annotate(self, list_of_paths):
+        for image_file in list_of_paths:
+            self.annotated.append(image_file)
+            if os.path.basename(image_file) in self.failing:
+                yield image_file, None
+            else:
+                yield image_file, [Text('TOTAL 12.50', (10, 20, 90, 40)), Text('TOTAL', (10, 20, 50, 40))]
+
+
+def _image(path, color=0, size=(120, 80)):
+    Image.new('RGB', size, (color, color, color)).save(str(path))
+    return str(path)
+
+
+def _annotation(n, seed=0):
+    vertices = np.random.RandomState(seed).randint(0, 100, (n, 4, 2)).astype(np.int32)
+    return Annotation(['word{i}'.format(i=i) for i in range(n)], vertices, (120, 80))
+
+
+def test_get_and_hit(tmp_path):
+    engine = FakeEngine()
+    cache = OCRCache(str(tmp_path / 'cache.db'), engine=engine)
+    path = _image(tmp_path / '1107-receipt.png')
+
+    (_, annotation), = list(cache.get([path]))
+    assert annotation.descriptions == ['TOTAL 12.50', 'TOTAL'] and annotation.image_size == (120, 80)
+    np.testing.assert_array_equal(annotation.vertices[1], [[10, 20], [50, 20], [50, 40], [10, 40]])
+
+    # a new cache on the same file reads the annotation back without the engine
+    cache.close()
+    cache = OCRCache(str(tmp_path / 'cache.db'), engine=engine)
+    (_, cached), = list(cache.get([path]))
+    assert cached.descriptions == annotation.descriptions and cached.image_size == annotation.image_size
+    np.testing.assert_array_equal(cached.vertices, annotation.vertices)
+    assert engine.annotated == [path] and cache.stats()['hits'] == 1
+
+
+def test_hit_after_rename(tmp_path):
+    cache = OCRCache(str(tmp_path / 'cache.db'))
+    path = _image(tmp_path / 'a.png')
+    cache.put(path, _annotation(3))
+
+    renamed = str(tmp_path / 'b.png')
+    os.rename(path, renamed)
+    annotation = cache.lookup(renamed)
+    assert annotation is not None and annotation.descriptions == ['word0', 'word1', 'word2']
+    assert cache.hits == 1 and cache.misses == 0
+
+
+def test_invalidation_after_rewrite(tmp_path):
+    cache = OCRCache(str(tmp_path / 'cache.db'))
+    path = _image(tmp_path / 'a.png', color=0)
+    cache.put(path, _annotation(3))
+    assert cache.lookup(path) is not None
+
+    # the same size and a new mtime: the file is hashed again, and its new content is not cached
+    stat = os.stat(path)
+    _image(path, color=255)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.lookup(path) is None and cache.misses == 1
+
+
+def test_lru_eviction(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(time, 'time', lambda: float(next(clock)))
+
+    paths = [_image(tmp_path / '{i}.png'.format(i=i), color=i) for i in range(4)]
+    cache = OCRCache(str(tmp_path / 'cache.db'))
+    cache.put(paths[0], _annotation(20, 0))
+    nbytes = cache.stats()['bytes']
+    cache.max_bytes = int(2.5 * nbytes)
+
+    cache.put(paths[1], _annotation(20, 1))
+    assert cache.lookup(paths[0]) is not None # 0 is now more recent than 1
+    cache.put(paths[2], _annotation(20, 2))
+
+    assert cache.stats()['entries'] == 2
+    assert cache.lookup(paths[1]) is None
+    assert cache.lookup(paths[0]) is not None and cache.lookup(paths[2]) is not None
+
+
+def test_failure_not_cached(tmp_path):
+    engine = FakeEngine(failing=['b.png'])
+    cache = OCRCache(str(tmp_path / 'cache.db'), engine=engine)
+    paths = [_image(tmp_path / 'a.png', color=0), _image(tmp_path / 'b.png', color=1)]
+
+    results = list(cache.get(paths))
+    assert results[1] == (paths[1], None) and results[0][1] is not None
+    assert cache.stats()['failures'] == 1 and cache.stats()['entries'] == 1
+
+    # the failed image is annotated again by the next call, the other one is a hit
+    engine.failing = set()
+    results = list(cache.get(paths))
+    assert results[1][1] is not None
+    assert engine.annotated == paths + [paths[1]]
+
+
+def test_export_matches_extract_annotations(tmp_path):
+    extract_annotations = pytest.importorskip('data.processing.data_manipulation').extract_annotations
+
+    cache = OCRCache(str(tmp_path / 'cache.db'), engine=FakeEngine())
+    paths = [_image(tmp_path / '1107-receipt.png', color=0), _image(tmp_path / '1108-receipt.png', color=1)]
+    for directory in ['exported', 'json', 'csv']:
+        (tmp_path / directory).mkdir()
+
+    boxes = extract_annotations(paths, cache, json_dir=str(tmp_path / 'json'), csv_dir=str(tmp_path / 'csv'))
+    assert cache.export(str(tmp_path / 'exported')) == 2
+
+    for name in ['1107_receipt', '1108_receipt']:
+        with open(str(tmp_path / 'exported' / '{name}.json'.format(name=name))) as f:
+            exported = json.load(f)
+        with open(str(tmp_path / 'json' / '{name}.json'.format(name=name))) as f:
+            assert exported == json.load(f)
+        assert exported['obj1'] == [{'description': 'TOTAL', 'labels': [10, 20, 50, 20, 50, 40, 10, 40]}]
+
+        frame = pd.read_csv(str(tmp_path / 'csv' / '{name}.csv'.format(name=name)))
+        assert frame.columns.tolist() == ['imageName', 'labels', 'X1', 'Y1', 'X2', 'Y2', 'image_width',
+                                          'image_height', 'bbox']
+        assert frame.iloc[0, :8].tolist() == [name, 'TOTAL', 10, 20, 50, 40, 120, 80]
+        np.testing.assert_array_equal(boxes[name], [[10, 20, 50, 40]])
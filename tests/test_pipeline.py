@@ -0,0 +1,148 @@
+"""
+The tests of the preprocessing driver and of the incremental pipeline, on a synthetic dataset.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.processing import pipeline
+from data.processing import data_manipulation as dm
+from data.processing.masks import load_mask
+
+GLOVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'glove.txt')
+WORDS = ['Total', 'TVA', 'shop', 'CASH', 'card:', 'price', 'Receipt', '12.50', 'euro', 'merci']
+
+
+def _write_receipt(data_dir, receipt_id, seed):
+    # the csv file of get_csv_files and the csv file of the zones of interest of a receipt
+    rng = np.random.RandomState(seed)
+    n, width, height = 25, 600 + 100 * seed, 1200
+    x1, y1 = rng.randint(0, width - 80, n), rng.randint(0, height - 30, n)
+    x2, y2 = x1 + rng.randint(10, 80, n), y1 + rng.randint(5, 30, n)
+    frame = pd.DataFrame({'imageName': receipt_id, 'labels': [WORDS[i % len(WORDS)] for i in rng.permutation(n)],
+                          'X1': x1, 'Y1': y1, 'X2': x2, 'Y2': y2, 'image_width': width, 'image_height': height,
+                          'bbox': np.stack([x1, y1, x2, y2], axis=1).tolist()})
+    os.makedirs(os.path.join(data_dir, 'csv_files'), exist_ok=True)
+    frame.to_csv(os.path.join(data_dir, 'csv_files', receipt_id + '.csv'), index=False)
+
+    os.makedirs(os.path.join(data_dir, '200receipts_csv_onebyone'), exist_ok=True)
+    zones = pd.DataFrame({'X1': [0, 100], 'Y1': [0, 600], 'X2': [300, 500], 'Y2': [300, 900]})
+    zones.to_csv(os.path.join(data_dir, '200receipts_csv_onebyone', receipt_id + '.csv'), index=False)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    receipt_ids = ['1000_receipt', '1001_receipt']
+    for seed, receipt_id in enumerate(receipt_ids):
+        _write_receipt(data_dir, receipt_id, seed)
+    return data_dir, receipt_ids
+
+
+SOURCES = {'glove_path': GLOVE_FILE}
+STAGE_PARAMS = {'final_grids': {'grid_size': 32, 'desired_image_size': 480}}
+
+
+def test_manifest(tmp_path):
+    manifest = pipeline.make_manifest(['1107_receipt'], data_dir='/data')
+    assert manifest.columns.tolist() == pipeline.MANIFEST_COLUMNS
+    row = manifest.iloc[0]
+    assert row['csv_file'] == '/data/csv_files/1107_receipt.csv'
+    assert row['zone_file'] == '/data/200receipts_csv_onebyone/1107_receipt.csv'
+    assert row['grid_file'] == '/data/final_grids/1107_receipt.npy'
+    assert row['mask_file'] == '/data/200receipts_masks/1107-receipt.npz'
+
+    ids_file = str(tmp_path / 'receipts.txt')
+    with open(ids_file, 'w') as f:
+        f.write('1107_receipt\n1108_receipt\n')
+    manifest = pipeline.load_manifest(ids_file, data_dir='/data')
+    assert manifest['receipt_id'].tolist() == ['1107_receipt', '1108_receipt']
+    assert manifest['zone_file'].tolist()[1] == '/data/200receipts_csv_onebyone/1108_receipt.csv'
+
+
+def test_run_stage_matches_sequential(dataset):
+    data_dir, receipt_ids = dataset
+    manifest = pipeline.make_manifest(receipt_ids, data_dir)
+    for stage_name in ['tokens', 'final_grids', 'masks']:
+        results, _ = pipeline.run_stage(stage_name, manifest, num_workers=2, sources=SOURCES,
+                                        **STAGE_PARAMS.get(stage_name, {}))
+        assert [receipt_id for receipt_id, _ in results] == receipt_ids
+
+    # the same stages in this process
+    word_ids, glove = dm.glove_word_ids(GLOVE_FILE), dm.myGloveDict(GLOVE_FILE)
+    for row in manifest.to_dict('records'):
+        glove_file, grid_file = row['glove_file'] + '.sequential.csv', row['grid_file'] + '.sequential.npy'
+        dm.process_receipt_tokens(row['csv_file'], 480, word_ids, output_file=glove_file)
+        dm.final_grids(glove_file, 32, 480, glove, output_file=grid_file)
+        mask = dm.get_mask(row['receipt_id'].split('_')[0], csv_file=row['csv_file'], zone_file=row['zone_file'])
+
+        pd.testing.assert_frame_equal(pd.read_csv(row['glove_file']), pd.read_csv(glove_file))
+        np.testing.assert_array_equal(np.load(row['grid_file']), np.load(grid_file))
+        np.testing.assert_array_equal(load_mask(row['mask_file']), mask)
+        assert mask.any() and np.load(grid_file).any()
+
+
+def test_incremental(dataset, tmp_path):
+    data_dir, receipt_ids = dataset
+    state = str(tmp_path / 'state.db')
+    targets = ['final_grids', 'masks']
+
+    def run(receipt_ids, **kwargs):
+        return pipeline.run_incremental(targets, pipeline.make_manifest(receipt_ids, data_dir), state, num_workers=2,
+                                        sources=SOURCES, stage_params=kwargs.pop('stage_params', STAGE_PARAMS),
+                                        **kwargs)
+
+    assert run(receipt_ids) == {'tokens': 2, 'final_grids': 2, 'masks': 2}
+    assert run(receipt_ids) == {'tokens': 0, 'final_grids': 0, 'masks': 0}
+
+    # a new receipt
+    _write_receipt(data_dir, '1002_receipt', 2)
+    receipt_ids = receipt_ids + ['1002_receipt']
+    assert run(receipt_ids) == {'tokens': 1, 'final_grids': 1, 'masks': 1}
+
+    # an edited zone file, a deleted output
+    _write_receipt(data_dir, '1000_receipt', 0)
+    zones = pd.read_csv(os.path.join(data_dir, '200receipts_csv_onebyone', '1000_receipt.csv'))
+    zones.iloc[:1].to_csv(os.path.join(data_dir, '200receipts_csv_onebyone', '1000_receipt.csv'), index=False)
+    os.remove(pipeline.make_manifest(['1001_receipt'], data_dir)['grid_file'][0])
+    assert run(receipt_ids) == {'tokens': 0, 'final_grids': 1, 'masks': 1}
+
+    # new parameters of a stage
+    params = {'final_grids': {'grid_size': 16, 'desired_image_size': 480}}
+    assert run(receipt_ids, stage_params=params) == {'tokens': 0, 'final_grids': 3, 'masks': 0}
+    assert np.load(pipeline.make_manifest(['1000_receipt'], data_dir)['grid_file'][0]).shape == (16, 16, 200)
+
+
+def test_resume(dataset, tmp_path, monkeypatch):
+    data_dir, receipt_ids = dataset
+    state = str(tmp_path / 'state.db')
+    manifest = pipeline.make_manifest(receipt_ids, data_dir)
+    run_stage = pipeline.run_stage
+
+    def interrupted(stage_name, *args, **kwargs):
+        if stage_name == 'final_grids':
+            raise KeyboardInterrupt
+        return run_stage(stage_name, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'run_stage', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run_incremental(['final_grids'], manifest, state, num_workers=1, sources=SOURCES,
+                                 stage_params=STAGE_PARAMS)
+    monkeypatch.setattr(pipeline, 'run_stage', run_stage)
+
+    # the stages of the interrupted run that completed are skipped, with its sources and parameters
+    computed = pipeline.run_incremental(['final_grids'], manifest, state, num_workers=1, resume=True)
+    assert computed == {'final_grids': 2}
+    assert np.load(manifest['grid_file'][0]).shape == (32, 32, 200)
+
+    # the run finished, nothing is left to resume
+    computed = pipeline.run_incremental(['final_grids'], manifest, state, num_workers=1, resume=True,
+                                        sources=SOURCES, stage_params=STAGE_PARAMS)
+    assert computed == {'tokens': 0, 'final_grids': 0}
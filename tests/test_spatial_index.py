@@ -0,0 +1,58 @@
+"""
+The tests of the grid spatial index.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+
+from data.processing.geometry import Boxes, iou_matrix
+from data.processing.spatial_index import GridIndex
+
+
+def _receipt_boxes(n, seed):
+    # small tokens spread over a tall receipt
+    rng = np.random.RandomState(seed)
+    x1, y1 = rng.randint(0, 900, n), rng.randint(0, 3000, n)
+    return Boxes(x1, y1, x1 + rng.randint(5, 120, n), y1 + rng.randint(5, 30, n))
+
+
+def test_nearest():
+    boxes = _receipt_boxes(400, 0)
+    index = GridIndex(boxes)
+    rng = np.random.RandomState(1)
+    for x, y in zip(rng.uniform(-50, 1050, 50), rng.uniform(-50, 3050, 50)):
+        brute = index.distances(np.arange(len(boxes)), x, y)
+        ids, distances = index.nearest(x, y, k=3)
+        np.testing.assert_allclose(distances, np.sort(brute)[:3])
+        np.testing.assert_allclose(brute[ids], distances)
+
+
+def test_nearest_exclude():
+    boxes = Boxes.from_array([[0, 0, 10, 10], [12, 0, 20, 10], [100, 100, 110, 110]])
+    index = GridIndex(boxes, cell_size=8)
+    ids, distances = index.nearest(5, 5, k=1, exclude=[0])
+    assert ids.tolist() == [1] and distances.tolist() == [7.]
+
+
+def test_overlapping_and_match():
+    boxes = _receipt_boxes(400, 2)
+    index = GridIndex(boxes)
+    zones = Boxes.from_array([[100, 200, 500, 400], [0, 2500, 900, 2600]])
+
+    for zone in zones.to_array():
+        overlap = (np.minimum(boxes.x2, zone[2]) > np.maximum(boxes.x1, zone[0])) & \
+                  (np.minimum(boxes.y2, zone[3]) > np.maximum(boxes.y1, zone[1]))
+        assert sorted(index.overlapping(zone).tolist()) == np.flatnonzero(overlap).tolist()
+
+    np.testing.assert_array_equal(index.match(zones), (iou_matrix(boxes, zones) > 1e-5).any(axis=1))
+
+
+def test_within():
+    boxes = _receipt_boxes(200, 3)
+    index = GridIndex(boxes)
+    distances = index.distances(np.arange(len(boxes)), 450, 1500)
+    ids = index.within(450, 1500, 200)
+    assert sorted(ids.tolist()) == np.flatnonzero(distances <= 200).tolist()
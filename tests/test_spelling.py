@@ -0,0 +1,53 @@
+"""
+The tests of the out of vocabulary corrector.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import random
+
+from data.processing.data_manipulation import levenshteinDistanceDP
+from data.processing.spelling import myers_distance, SymSpell, default_max_distance
+
+
+def _random_words(n, seed, letters='abcde'):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(0, 12))) for _ in range(n)]
+
+
+def test_myers_distance():
+    words = _random_words(60, 0)
+    for pattern in words:
+        for text in words[:20]:
+            assert myers_distance(pattern, text) == levenshteinDistanceDP(pattern, text)
+
+
+def test_myers_max_distance():
+    # the distance is exact up to max_distance, and larger than it beyond
+    words = _random_words(60, 1)
+    for pattern in words:
+        for text in words[:20]:
+            distance = levenshteinDistanceDP(pattern, text)
+            bounded = myers_distance(pattern, text, max_distance=2)
+            assert bounded == distance if distance <= 2 else bounded > 2
+
+
+def test_symspell_lookup():
+    words = sorted(set(_random_words(3000, 2, letters='abcdefghij')) - {''}, key=len)
+    # the prefix covers the whole words, so the corrections are exact
+    speller = SymSpell(words, prefix_length=12)
+    for word in _random_words(200, 3, letters='abcdefghij'):
+        max_distance = min(default_max_distance(word), 2)
+        distances = [myers_distance(word, candidate) for candidate in words]
+        closest = min(distances)
+        expected = (words[distances.index(closest)], closest) if closest <= max_distance else (None, None)
+        assert speller.lookup(word) == expected
+
+
+def test_symspell_frequencies():
+    speller = SymSpell(['total', 'tonal', 'tidal'], frequencies=[1, 5, 1])
+    assert speller.lookup('toxal') == ('tonal', 1)
+    assert speller.lookup('total') == ('total', 0)
+    assert speller.correct(['toxal', 't0xal', 'zzzzzz']) == {'toxal': 'tonal'}
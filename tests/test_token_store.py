@@ -0,0 +1,86 @@
+"""
+The tests of the columnar token store.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import numpy as np
+import pytest
+
+from data.processing.token_store import TokenStore
+
+
+def _tokens(n, seed):
+    rng = np.random.RandomState(seed)
+    x1 = rng.randint(0, 500, n)
+    y1 = rng.randint(0, 800, n)
+    return {'text': ['token{i}'.format(i=i) for i in range(n)],
+            'x1': x1, 'y1': y1, 'x2': x1 + rng.randint(1, 60, n), 'y2': y1 + rng.randint(1, 20, n)}
+
+
+def test_append_and_slice():
+    store = TokenStore()
+    store.append('1_receipt', **_tokens(3, 0))
+    store.append('2_receipt', **_tokens(5, 1))
+
+    assert len(store) == 2 and '2_receipt' in store
+    assert store.bounds('2_receipt') == (3, 8)
+
+    tokens = store.receipt('2_receipt')
+    np.testing.assert_array_equal(tokens['x1'], _tokens(5, 1)['x1'])
+    assert tokens['text'].tolist() == _tokens(5, 1)['text']
+    # the columns that were not given are missing
+    assert (tokens['token_id'] == -1).all() and (tokens['norm_text'] == '').all()
+
+
+def test_duplicated_receipt():
+    store = TokenStore()
+    store.append('1_receipt', **_tokens(3, 0))
+    with pytest.raises(ValueError):
+        store.append('1_receipt', **_tokens(3, 0))
+
+
+def test_flush_save_reload(tmp_path):
+    path = str(tmp_path / 'store')
+    store = TokenStore(path)
+    store.append('1_receipt', **_tokens(3, 0))
+    store.flush()
+    store.append('2_receipt', **_tokens(4, 1))
+    store.append('3_receipt', **_tokens(0, 2))
+    store.flush()
+    assert len(list((tmp_path / 'store').glob('chunk_*.npz'))) == 2
+
+    reloaded = TokenStore(path)
+    assert reloaded.receipt_ids == ['1_receipt', '2_receipt', '3_receipt']
+    for receipt_id in store.receipt_ids:
+        for name, values in store.receipt(receipt_id).items():
+            np.testing.assert_array_equal(reloaded.receipt(receipt_id)[name], values)
+
+    # an update of a flushed receipt is only written by save, as a single chunk
+    reloaded.update('1_receipt', token_id=[7, 8, 9])
+    reloaded.save()
+    assert len(list((tmp_path / 'store').glob('chunk_*.npz'))) == 1
+    np.testing.assert_array_equal(TokenStore(path).receipt('1_receipt')['token_id'], [7, 8, 9])
+    assert len(TokenStore(path).receipt('3_receipt')['x1']) == 0
+
+
+def test_interleaved_append_and_read():
+    # the columns grow geometrically: reading after every append does not copy the whole store each time
+    store = TokenStore()
+    previous, num_copies = store.column('x1'), 0
+    for i in range(1000):
+        store.append('{i}_receipt'.format(i=i), **_tokens(i % 7, i))
+        store.update('{i}_receipt'.format(i=i), token_id=np.full(i % 7, i))
+        column = store.column('x1')
+        num_copies += len(previous) > 0 and not np.shares_memory(previous, column)
+        previous = column
+    assert num_copies <= 16
+
+    assert store.bounds('999_receipt') == (len(store.column('x1')) - 999 % 7, len(store.column('x1')))
+    for i in [0, 1, 500, 998, 999]:
+        tokens = store.receipt('{i}_receipt'.format(i=i))
+        np.testing.assert_array_equal(tokens['x1'], _tokens(i % 7, i)['x1'])
+        assert tokens['text'].tolist() == _tokens(i % 7, i)['text'] and (tokens['token_id'] == i).all()
+    np.testing.assert_array_equal(store.receipt_column(), np.repeat(np.arange(1000), np.arange(1000) % 7))
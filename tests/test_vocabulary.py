@@ -0,0 +1,55 @@
+"""
+The tests of the hash indexed vocabulary.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+import os
+
+import numpy as np
+
+from data.processing.token_store import TokenStore
+from data.processing.vocabulary import Vocabulary, OOV_WORD, OOV_ID, store_receipts
+
+GLOVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'glove.txt')
+
+
+def test_from_glove():
+    vocabulary = Vocabulary.from_glove(GLOVE_FILE)
+    with open(GLOVE_FILE) as f:
+        words = [line.split(' ', 1)[0] for line in f]
+    assert vocabulary.words == [OOV_WORD] + words
+    assert vocabulary['total'] == 2 and vocabulary['unknown'] == OOV_ID and 'total' in vocabulary
+
+
+def test_ids_match_dict_lookup():
+    vocabulary = Vocabulary.from_glove(GLOVE_FILE)
+    rng = np.random.RandomState(0)
+    tokens = rng.choice(vocabulary.words + ['xyz', '', 'Total', '12'], 500).tolist()
+    expected = [vocabulary.word_ids.get(token, OOV_ID) for token in tokens]
+
+    ids = vocabulary.ids(tokens)
+    assert ids.dtype == np.int32
+    np.testing.assert_array_equal(ids, expected)
+    assert vocabulary.ids([]).tolist() == []
+    # 'mekene' is always 0, repeated words keep their first id
+    assert Vocabulary(['b', 'a', 'b']).words == [OOV_WORD, 'b', 'a', 'b']
+    assert Vocabulary(['b', 'a', 'b']).ids(['b', 'a', OOV_WORD]).tolist() == [1, 2, OOV_ID]
+
+
+def test_coverage():
+    vocabulary = Vocabulary(['total', 'tva', 'shop'])
+    store = TokenStore()
+    store.append('1_receipt', norm_text=['total', 'tva', 'xyz', 'total'])
+    store.append('2_receipt', norm_text=['xyz', 'abc', 'xyz', 'shop'])
+    store.append('3_receipt', norm_text=[])
+
+    coverage = vocabulary.coverage(store_receipts(store), top_k=1)
+    assert coverage['num_tokens'] == 8 and coverage['num_tokens_in_vocab'] == 4 and coverage['num_tokens_oov'] == 4
+    assert coverage['token_coverage'] == 0.5
+    assert coverage['num_distinct_in_vocab'] == 3 and coverage['num_distinct_oov'] == 2
+    assert coverage['top_oov'] == [('xyz', 3)]
+    assert coverage['receipt_coverage'] == {'1_receipt': 0.75, '2_receipt': 0.25, '3_receipt': 1.}
+    assert coverage['min_receipt_coverage'] == 0.25 and coverage['median_receipt_coverage'] == 0.75
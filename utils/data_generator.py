@@ -9,6 +9,8 @@ The implementation of Data Generator based on Tensorflow.
 from tensorflow.python.keras.preprocessing.image import Iterator
 from keras_applications import imagenet_utils
 from utils.utils import *
+from data.processing.masks import load_mask
+from data.processing.images import load_image, read_rgb, fit_long_side, padded_shape
 import tensorflow as tf
 import numpy as np
 
@@ -42,7 +44,9 @@ class DataIterator(Iterator):
         batch_y = np.zeros(shape=(len(index_array),) + self.target_size + (self.num_classes,))
 
         for i, idx in enumerate(index_array):
-            image, label = load_image(self.images_list[idx]), load_image(self.labels_list[idx])
+            # the image is decoded at a reduced scale when it is only resized, the label is always decoded in full
+            target_size = None if self.image_data_generator.random_crop else self.target_size[::-1]
+            image, label = load_image(self.images_list[idx], target_size), load_image(self.labels_list[idx])
             # random crop
             if self.image_data_generator.random_crop:
                 image, label = random_crop(image, label, self.target_size)
@@ -175,7 +179,7 @@ class DataGeneratorDensAspp(keras.utils.Sequence):
         X = np.empty((batch_size, self.input_size, self.input_size, 3))
 
         for j, pure in enumerate (boom['lesimages']):
-          al = plt.imread(pure)
+          al = read_rgb(pure, (self.input_size, self.input_size))
 
         #resizing the images
 
@@ -189,11 +193,9 @@ class DataGeneratorDensAspp(keras.utils.Sequence):
         
         for zk, noms in enumerate (boom['lesmasks']):
 
-          
-          ole = plt.imread(noms)
-          
-
-          Y_1[zk] = ole[:,:,0:2]
+          #decode the mask straight into the batch buffer
+          load_mask(noms, Y_1[zk, :, :, 0])
+          Y_1[zk, :, :, 1] = Y_1[zk, :, :, 0]
 
 
         '''
@@ -218,13 +220,19 @@ class DataGeneratorPSPNet(keras.utils.Sequence):
 
         #'Initialization'
     
-    def __init__(self, batch_size, dataframe, input_size = 256, shuffle=True):
-
+    def __init__(self, batch_size, dataframe, input_size = 256, shuffle=True, rectangular=False, multiple=8):
+      '''
+      rectangular: resize the receipts by their long side (input_size) and pad them to the next multiple only,
+          each batch taking the shape of its largest receipt, instead of 480x480 squares
+      multiple: the multiple the sides are padded to (the output stride of the network)
+      '''
 
       self.batch_size = batch_size
       self.dataframe = dataframe
       self.shuffle = shuffle  #NOTE that the SHUFFLE is at the beginning of each epoch!!!
       self.input_size = input_size
+      self.rectangular = rectangular
+      self.multiple = multiple
       self.on_epoch_end()
 
 
@@ -268,6 +276,10 @@ class DataGeneratorPSPNet(keras.utils.Sequence):
 
         #print(boom['newmasks'])
 
+        if self.rectangular:
+          yield self.rectangular_batch(bom, batch_size)
+          continue
+
         #empty array of size (batch_size,input,input,3)
         X = np.empty((batch_size, self.input_size, self.input_size, 3))
         
@@ -276,7 +288,7 @@ class DataGeneratorPSPNet(keras.utils.Sequence):
         myimages = bom.iloc[:,0].tolist()
 
         for j, pure in enumerate(myimages):
-          al = plt.imread(pure)
+          al = read_rgb(pure, (480, 480))  #decoded at the smallest scale larger than 480x480
           ali = cv2.resize(al, (480, 480), interpolation=cv2.INTER_NEAREST)
 
         #resizing the images
@@ -295,18 +307,8 @@ class DataGeneratorPSPNet(keras.utils.Sequence):
 
         for zk, noms in enumerate(mymasks):
 
-          vide = np.zeros((480,480,1))
-          ole = plt.imread(noms)
-          aloh = cv2.resize(ole, (480, 480), interpolation=cv2.INTER_NEAREST)
-          #print(aloh.shape)
-          #print(type(aloh))
-          aloh_reshaped = aloh[:,:,0]
-          vide[:,:,0] = aloh_reshaped
-       
-          
-          #print(noms)
-
-          Y_1[zk] = vide
+          #decode (and resize if needed) the mask straight into the batch buffer
+          load_mask(noms, Y_1[zk])
 
 
         '''
@@ -328,3 +330,27 @@ class DataGeneratorPSPNet(keras.utils.Sequence):
 
  
  
+
+
+    def rectangular_batch(self, bom, batch_size):
+      'Generates the batch of a dataframe, the receipts keeping their aspect ratio'
+
+      #decoded at the smallest scale larger than the target long side, with the size of the full image
+      images = [load_image(pure, self.input_size, backend='cv2') for pure in bom.iloc[:,0].tolist()]
+
+      #the shape of the batch: the largest padded receipt, a tall receipt is about half as wide as the square
+      shapes = [padded_shape(image_size, self.input_size, self.multiple) for _, image_size in images]
+      height, width = max(shape[0] for shape in shapes), max(shape[1] for shape in shapes)
+
+      #the image and its mask are both resized to the size computed from the full image, so they stay aligned
+      X = np.empty((batch_size, height, width, 3))
+      for j, (image, image_size) in enumerate(images):
+        fit_long_side(image, self.input_size, self.multiple, out=X[j], image_size=image_size)
+
+      #the masks at the size of their image (see pipeline.masks_stage), resized and padded the same way
+      Y_1 = np.empty((batch_size, height, width, 1))
+      for zk, noms in enumerate(bom.iloc[:,1].tolist()):
+        fit_long_side(load_mask(noms), self.input_size, self.multiple, out=Y_1[zk, :, :, 0],
+                      image_size=images[zk][1])
+
+      return [X, Y_1]
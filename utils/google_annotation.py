@@ -15,12 +15,58 @@ import json
 import argparse
 from enum import Enum
 import io
+import itertools
 from tqdm import tqdm 
+import time
+import random
+import warnings
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
+import grpc
+from google.api_core import exceptions as google_exceptions
 from google.cloud import vision
+from google.cloud.vision_v1.services.image_annotator.transports import ImageAnnotatorGrpcTransport
 from PIL import Image, ImageDraw
 
 
+#errors worth retrying: the service is overloaded, throttling us or the request timed out
+RETRYABLE_ERRORS = (google_exceptions.ServiceUnavailable,
+                    google_exceptions.TooManyRequests,
+                    google_exceptions.ResourceExhausted,
+                    google_exceptions.DeadlineExceeded,
+                    google_exceptions.InternalServerError)
+
+#the compact form of an annotation, what the pipeline needs from a google vision response:
+#descriptions: list of n strings, vertices: int32 array of shape (n, 4, 2), image_size: (width, height)
+Annotation = collections.namedtuple('Annotation', ['descriptions', 'vertices', 'image_size'])
+
+_POOLED_CLIENT = None #one client (and gRPC channel) shared by the whole process
+
+
+def get_client(api_endpoint=None):
+    '''
+    This function returns an ImageAnnotatorClient.
+    Without api_endpoint, the same pooled client is returned on every call instead of opening a new channel per image.
+
+    input:
+        api_endpoint: 'host:port' of a local stand-in OCR server (plain gRPC, no credentials), None for google vision
+    return:
+        client: the ImageAnnotatorClient
+    '''
+
+    global _POOLED_CLIENT
+
+    if api_endpoint is not None: #local stand-in server, e.g. 'localhost:50051'
+        transport = ImageAnnotatorGrpcTransport(channel=grpc.insecure_channel(api_endpoint))
+        return vision.ImageAnnotatorClient(transport=transport)
+
+    if _POOLED_CLIENT is None:
+        _POOLED_CLIENT = vision.ImageAnnotatorClient() #GOOGLE_APPLICATION_CREDENTIALS
+
+    return _POOLED_CLIENT
+
+
 
 
 def get_document_bounds(image_file):#, feature):
@@ -50,9 +96,139 @@ def get_document_bounds(image_file):#, feature):
 
     
     
-    client = vision.ImageAnnotatorClient() #GOOGLE_APPLICATION_CREDENTIALS
+    client = get_client() #pooled client, GOOGLE_APPLICATION_CREDENTIALS
     response = client.text_detection(image=image) #loggings
     text = response.text_annotations #the text containing the annotation infos
     del response     # to clean-up the system memory
 
     return text
+
+
+
+def to_annotation(text, image_size):
+    '''
+    This function converts the text annotations returned by google vision into an Annotation.
+
+    input:
+        text: the annotation text as returned by get_document_bounds
+        image_size: (width, height) of the annotated image
+    return:
+        the Annotation
+    '''
+
+    descriptions = [t.description for t in text]
+    vertices = np.array([[(v.x, v.y) for v in t.bounding_poly.vertices] for t in text], dtype=np.int32)
+
+    return Annotation(descriptions, vertices.reshape(-1, 4, 2), tuple(image_size))
+
+
+
+class OCRIngestionEngine(object):
+    def __init__(self,
+                 client=None,
+                 api_endpoint=None,
+                 batch_size=16,
+                 max_workers=4,
+                 max_retries=5,
+                 backoff=1.,
+                 max_backoff=32.,
+                 verbose=1):
+        """
+        Batched and concurrent text detection over a list of images.
+        Images are grouped into batch-annotate requests, at most max_workers requests are in flight at once,
+        failed requests are retried with exponential backoff and the results are streamed back in input order.
+        :param client: an object exposing batch_annotate_images, the pooled client (or a local stand-in) if None
+        :param api_endpoint: 'host:port' of a local stand-in OCR server, only used when client is None
+        :param batch_size: the number of images per request (google vision accepts up to 16)
+        :param max_workers: the number of requests running at the same time
+        :param max_retries: the number of retries of a failing request before giving up
+        :param backoff: the first backoff delay in seconds, doubled after each retry
+        :param max_backoff: the largest backoff delay in seconds
+        :param verbose: print the throughput once the images have been annotated
+        """
+        assert batch_size >= 1 and max_workers >= 1
+
+        self.client = client if client is not None else get_client(api_endpoint)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.verbose = verbose
+
+        self.num_images = 0
+        self.elapsed = 0.
+
+    def _make_request(self, image_file):
+        with io.open(image_file, 'rb') as f: #read the image
+            content = f.read()
+
+        return vision.AnnotateImageRequest(image=vision.Image(content=content),
+                                           features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)])
+
+    def _annotate_batch(self, batch):
+        requests = [self._make_request(image_file) for image_file in batch]
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                #retry=None, the backoff below is the only retry policy
+                response = self.client.batch_annotate_images(requests=requests, retry=None)
+                break
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.)) #jitter, so that the workers do not retry together
+
+        texts = []
+        for image_file, image_response in zip(batch, response.responses):
+            if image_response.error.code != 0:
+                #None marks the failure, so that it is not mistaken for an image without text (and cached as such)
+                warnings.warn('The annotation of {file} failed: {message}'.format(file=image_file,
+                                                                                   message=image_response.error.message))
+                texts.append(None)
+            else:
+                texts.append(image_response.text_annotations) #the text containing the annotation infos
+
+        return texts
+
+    def annotate(self, list_of_paths):
+        """
+        Annotate the images.
+        :param list_of_paths: list, the image file paths
+        :return: a generator of (image_file, text) in the order of list_of_paths,
+            text being the same annotation as returned by get_document_bounds, None if the annotation of the image failed
+        """
+        batches = [list_of_paths[i:i + self.batch_size] for i in range(0, len(list_of_paths), self.batch_size)]
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = collections.deque()
+            batches = iter(batches)
+            try:
+                #keep a bounded window of submitted batches, so that memory does not grow with the number of images
+                for batch in itertools.islice(batches, 2 * self.max_workers):
+                    pending.append((batch, executor.submit(self._annotate_batch, batch)))
+
+                while pending:
+                    batch, future = pending.popleft()
+                    texts = future.result()
+
+                    for next_batch in itertools.islice(batches, 1):
+                        pending.append((next_batch, executor.submit(self._annotate_batch, next_batch)))
+
+                    for image_file, text in zip(batch, texts):
+                        self.num_images += 1
+                        yield image_file, text
+            finally:
+                #also when the generator is closed early or a request fails: the batches not started are dropped
+                #and the throughput is the one of the images yielded so far
+                for _, future in pending:
+                    future.cancel()
+                self.elapsed += time.time() - start
+                if self.verbose:
+                    print('Annotated {num} images at {speed:.2f} images/sec.'.format(num=self.num_images,
+                                                                                      speed=self.images_per_sec()))
+
+    def images_per_sec(self):
+        return self.num_images / self.elapsed if self.elapsed > 0 else 0.
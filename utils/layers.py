@@ -6,6 +6,8 @@ The implementation of some layers based on Tensorflow.
 @Project: https://github.com/luyanger1799/meteor-CUTIE
 
 """
+import numpy as np
+import time
 import tensorflow as tf
 
 layers = tf.keras.layers
@@ -69,6 +71,77 @@ class Concatenate(layers.Concatenate):
         return config
 
 
+class AdaptiveAveragePooling2D(layers.Layer):
+    def __init__(self, bins, **kwargs):
+        """
+        The average pooling of inputs of any (h, w) into bins x bins cells, the cell i spanning the rows
+        floor(i * h / bins) to ceil((i + 1) * h / bins) (the same for the columns), so the bins adapt to the size
+        instead of requiring h and w to be divided by bins. The means are read in a summed area table.
+        :param bins: the number of cells along each side.
+        :param kwargs: other parameters
+        """
+        super(AdaptiveAveragePooling2D, self).__init__(**kwargs)
+        self.bins = bins
+
+    def build(self, input_shape):
+        pass
+
+    def call(self, inputs, **kwargs):
+        shape = tf.shape(inputs)
+        h, w = shape[1], shape[2]
+
+        table = tf.cumsum(tf.cumsum(inputs, axis=1), axis=2)
+        table = tf.pad(table, [[0, 0], [1, 0], [1, 0], [0, 0]])
+
+        cells = tf.range(self.bins)
+        r1, r2 = cells * h // self.bins, ((cells + 1) * h + self.bins - 1) // self.bins
+        c1, c2 = cells * w // self.bins, ((cells + 1) * w + self.bins - 1) // self.bins
+
+        def corners(rows, cols):
+            return tf.gather(tf.gather(table, rows, axis=1), cols, axis=2)
+
+        sums = corners(r2, c2) - corners(r1, c2) - corners(r2, c1) + corners(r1, c1)
+        areas = backend.cast(backend.expand_dims(r2 - r1, 1) * backend.expand_dims(c2 - c1, 0), inputs.dtype)
+        return sums / areas[None, :, :, None]
+
+    def compute_output_shape(self, input_shape):
+        input_shape = tf.TensorShape(input_shape).as_list()
+        return tf.TensorShape([input_shape[0], self.bins, self.bins, input_shape[3]])
+
+    def get_config(self):
+        config = super(AdaptiveAveragePooling2D, self).get_config()
+        config['bins'] = self.bins
+        return config
+
+
+class ResizeLike(layers.Layer):
+    def __init__(self, interpolation='bilinear', **kwargs):
+        """
+        The bilinear resize of the inputs to the (h, w) of a reference: [inputs, reference] -> (batch, h, w, c).
+        :param interpolation: the method of tf.image.resize.
+        :param kwargs: other parameters
+        """
+        super(ResizeLike, self).__init__(**kwargs)
+        self.interpolation = interpolation
+
+    def build(self, input_shape):
+        pass
+
+    def call(self, inputs, **kwargs):
+        x, reference = inputs
+        outputs = tf.image.resize(x, tf.shape(reference)[1:3], method=self.interpolation)
+        return backend.cast(outputs, x.dtype)
+
+    def compute_output_shape(self, input_shape):
+        x_shape, reference_shape = [tf.TensorShape(shape).as_list() for shape in input_shape]
+        return tf.TensorShape([x_shape[0]] + reference_shape[1:3] + [x_shape[3]])
+
+    def get_config(self):
+        config = super(ResizeLike, self).get_config()
+        config['interpolation'] = self.interpolation
+        return config
+
+
 class PixelShuffle(layers.Layer):
     def __init__(self, block_size=2, **kwargs):
         super(PixelShuffle, self).__init__(**kwargs)
@@ -101,3 +174,201 @@ class PixelShuffle(layers.Layer):
         config = super(PixelShuffle, self).get_config()
         config['block_size'] = self.block_size
         return config
+
+
+class TokenEmbedding(layers.Embedding):
+    def __init__(self, input_dim, output_dim, pad_id=0, **kwargs):
+        """
+        The embedding of a grid of token ids: (batch, h, w) int32 -> (batch, h, w, dim).
+        The outputs of pad_id (the empty cells and the 'mekene' tokens) are always the zero vector,
+        even when the embeddings are trained.
+        :param input_dim: the size of the vocabulary.
+        :param output_dim: the dimension of the vectors.
+        :param pad_id: the id of the zero vector.
+        :param kwargs: the other parameters of layers.Embedding
+        """
+        super(TokenEmbedding, self).__init__(input_dim, output_dim, **kwargs)
+        self.pad_id = pad_id
+
+    def call(self, inputs):
+        outputs = super(TokenEmbedding, self).call(inputs)
+        mask = backend.cast(backend.not_equal(inputs, self.pad_id), outputs.dtype)
+        return outputs * backend.expand_dims(mask, axis=-1)
+
+    def compute_mask(self, inputs, mask=None):
+        return None
+
+    def get_config(self):
+        config = super(TokenEmbedding, self).get_config()
+        config['pad_id'] = self.pad_id
+        return config
+
+
+class GatherTokens(layers.Layer):
+    def __init__(self, stride=1, **kwargs):
+        """
+        The features of the tokens, gathered at their position instead of upsampling the whole map:
+        [(batch, h, w, c) features, (batch, n, 2) int32 positions] -> (batch, n, c).
+        :param stride: the inputs of the model over the resolution of the features,
+            the positions (row, col) being in the coordinates of the inputs.
+        :param kwargs: other parameters
+        """
+        super(GatherTokens, self).__init__(**kwargs)
+        self.stride = stride
+
+    def build(self, input_shape):
+        pass
+
+    def call(self, inputs, **kwargs):
+        features, positions = inputs
+        shape = tf.shape(features)
+
+        # the padding positions (-1) read the first cell and are set to 0
+        valid = backend.all(positions >= 0, axis=-1)
+        positions = positions // self.stride
+        positions = tf.clip_by_value(positions, 0, tf.stack([shape[1] - 1, shape[2] - 1]))
+
+        outputs = tf.gather_nd(features, positions, batch_dims=1)
+        return outputs * backend.expand_dims(backend.cast(valid, outputs.dtype), axis=-1)
+
+    def compute_output_shape(self, input_shape):
+        features_shape, positions_shape = [tf.TensorShape(shape).as_list() for shape in input_shape]
+        return tf.TensorShape([features_shape[0], positions_shape[1], features_shape[3]])
+
+    def get_config(self):
+        config = super(GatherTokens, self).get_config()
+        config['stride'] = self.stride
+        return config
+
+
+class SparseConv2D(layers.Layer):
+    def __init__(self, filters, kernel_size=3, dilation_rate=1, use_bias=True, kernel_initializer='he_normal', **kwargs):
+        """
+        A submanifold sparse convolution: the outputs are only computed at the active cells (the cells of the tokens),
+        from the active cells of their neighbourhood, and the other cells are 0.
+        The active cells are gathered into a list, each kernel offset gathers its neighbours in the list,
+        and a single matmul gives the outputs, scattered back into the grid.
+        It costs O(active cells) instead of O(h * w), so it is faster than layers.Conv2D on the mostly empty grids only
+        (see benchmark_sparse_conv for the crossover density).
+        [(batch, h, w, c) features, (batch, h, w) active cells] -> (batch, h, w, filters)
+        :param filters: the number of filters.
+        :param kernel_size: the size of the square kernel.
+        :param dilation_rate: the dilation of the kernel.
+        :param use_bias: add a bias to the outputs of the active cells.
+        :param kernel_initializer: the initializer of the kernel.
+        :param kwargs: other parameters
+        """
+        super(SparseConv2D, self).__init__(**kwargs)
+        self.filters = filters
+        self.kernel_size = kernel_size
+        self.dilation_rate = dilation_rate
+        self.use_bias = use_bias
+        self.kernel_initializer = tf.keras.initializers.get(kernel_initializer)
+
+        half = (kernel_size - 1) // 2
+        self.offsets = [(i * dilation_rate, j * dilation_rate)
+                        for i in range(-half, kernel_size - half) for j in range(-half, kernel_size - half)]
+
+    def build(self, input_shape):
+        channels = tf.TensorShape(input_shape[0]).as_list()[-1]
+        self.kernel = self.add_weight(name='kernel',
+                                      shape=(self.kernel_size, self.kernel_size, channels, self.filters),
+                                      initializer=self.kernel_initializer)
+        self.bias = self.add_weight(name='bias', shape=(self.filters,), initializer='zeros') if self.use_bias else None
+        super(SparseConv2D, self).build(input_shape)
+
+    def call(self, inputs, **kwargs):
+        features, active = inputs
+        shape = tf.shape(features)
+        batch, h, w = shape[0], shape[1], shape[2]
+
+        # the (n, 3) [batch, row, col] of the active cells and their features
+        coords = tf.cast(tf.where(backend.cast(active, 'bool')), tf.int32)
+        values = tf.gather_nd(features, coords)
+        num_active = tf.shape(coords)[0]
+
+        # the position of each active cell in the list, n (the extra zero row) for the inactive cells
+        index = tf.scatter_nd(coords, tf.range(num_active) - num_active, tf.stack([batch, h, w])) + num_active
+        values = tf.concat([values, tf.zeros_like(values[:1])], axis=0)
+
+        neighbours = []
+        for di, dj in self.offsets:
+            rows, cols = coords[:, 1] + di, coords[:, 2] + dj
+            inside = (rows >= 0) & (rows < h) & (cols >= 0) & (cols < w)
+            positions = tf.stack([coords[:, 0], tf.clip_by_value(rows, 0, h - 1), tf.clip_by_value(cols, 0, w - 1)], axis=1)
+            neighbour = tf.where(inside, tf.gather_nd(index, positions), num_active)
+            neighbours.append(tf.gather(values, neighbour))
+
+        # (n, k * k * c) x (k * k * c, filters), the offsets in the order of the kernel
+        outputs = tf.matmul(tf.concat(neighbours, axis=1), tf.reshape(self.kernel, [-1, self.filters]))
+        if self.use_bias:
+            outputs = outputs + self.bias
+
+        return tf.scatter_nd(coords, outputs, tf.stack([batch, h, w, self.filters]))
+
+    def compute_output_shape(self, input_shape):
+        features_shape = tf.TensorShape(input_shape[0]).as_list()
+        return tf.TensorShape(features_shape[:3] + [self.filters])
+
+    def get_config(self):
+        config = super(SparseConv2D, self).get_config()
+        config['filters'] = self.filters
+        config['kernel_size'] = self.kernel_size
+        config['dilation_rate'] = self.dilation_rate
+        config['use_bias'] = self.use_bias
+        config['kernel_initializer'] = tf.keras.initializers.serialize(self.kernel_initializer)
+        return config
+
+
+def benchmark_sparse_conv(grid_size=120, channels=128, filters=128, densities=(0.01, 0.02, 0.05, 0.1, 0.2, 0.4),
+                          batch_size=1, dilation_rate=1, repeat=20):
+    """
+    Measure the time of SparseConv2D and of the dense layers.Conv2D on random grids of increasing density,
+    to choose which convolutions of a network are sparse (a receipt of a few hundred tokens on a 120x120 grid is ~2%).
+    Measured on one CPU core (tensorflow-cpu 2.21, 128 channels, 120x120): the crossover is between 0.4 and 0.45
+    (0.4 to 0.5 for batches of 8 grids, the same with a dilation of 4), and at 2% the sparse convolution takes
+    6 ms instead of 42 ms.
+    :param grid_size: the side of the grids.
+    :param channels: the number of channels of the inputs.
+    :param filters: the number of filters.
+    :param densities: the fractions of active cells measured.
+    :param batch_size: the number of grids of a batch.
+    :param dilation_rate: the dilation of the 3x3 kernels.
+    :param repeat: the number of timed calls per density.
+    :return: the list of (density, sparse seconds, dense seconds) and the crossover density,
+        the first density measured where the dense convolution is faster (None if it never is).
+    """
+    sparse = SparseConv2D(filters, 3, dilation_rate=dilation_rate)
+    dense = layers.Conv2D(filters, 3, padding='same', dilation_rate=dilation_rate)
+    sparse_call = tf.function(lambda x, m: sparse([x, m]))
+    dense_call = tf.function(lambda x: dense(x))
+
+    results = []
+    crossover = None
+    for density in densities:
+        active = np.random.random_sample((batch_size, grid_size, grid_size)) < density
+        features = np.random.standard_normal((batch_size, grid_size, grid_size, channels)).astype(np.float32)
+        features *= active[..., None]
+        features, active = tf.constant(features), tf.constant(active)
+
+        # the first calls trace the functions
+        sparse_call(features, active)
+        dense_call(features)
+
+        start = time.time()
+        for _ in range(repeat):
+            sparse_call(features, active).numpy()
+        sparse_seconds = (time.time() - start) / repeat
+
+        start = time.time()
+        for _ in range(repeat):
+            dense_call(features).numpy()
+        dense_seconds = (time.time() - start) / repeat
+
+        results.append((density, sparse_seconds, dense_seconds))
+        if crossover is None and dense_seconds <= sparse_seconds:
+            crossover = density
+        print('density {density:.3f}: sparse {sparse:.2f} ms, dense {dense:.2f} ms'.format(
+            density=density, sparse=1000 * sparse_seconds, dense=1000 * dense_seconds))
+
+    return results, crossover
@@ -0,0 +1,200 @@
+"""
+The implementation of a persistent cache of the google vision annotations.
+
+@Author: Mékéné
+@Github: https://github.com/IsmaelMekene
+@Project: https://github.com/luyanger1799/meteor-CUTIE
+
+"""
+from utils.google_annotation import Annotation, OCRIngestionEngine, to_annotation
+from PIL import Image
+import numpy as np
+import argparse
+import hashlib
+import sqlite3
+import json
+import zlib
+import time
+import os
+
+
+class OCRCache(object):
+    def __init__(self, cache_path, max_bytes=None, engine=None):
+        """
+        A content-addressed cache of the annotations, stored in a single sqlite file.
+        Entries are keyed by the sha256 of the image bytes, and hold the image size, the zlib compressed
+        descriptions and the int32 vertices. A second table remembers the digest of every (path, size, mtime),
+        so that a hit on an unchanged file reads neither the image nor the network.
+        :param cache_path: the path of the sqlite file
+        :param max_bytes: the largest size of the stored annotations, the least recently used are evicted beyond it
+        :param engine: the OCRIngestionEngine annotating the misses, a default one is created on the first miss if None
+        """
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.engine = engine
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS annotations ('
+                                'digest TEXT PRIMARY KEY, image_width INTEGER, image_height INTEGER, '
+                                'descriptions BLOB, vertices BLOB, nbytes INTEGER, last_access REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS annotations_last_access ON annotations (last_access)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS paths ('
+                                'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)')
+        self.connection.commit()
+
+    def digest(self, image_file):
+        """
+        The sha256 of the image bytes, the file is only read when it changed since it was last hashed.
+        """
+        path = os.path.abspath(image_file)
+        stat = os.stat(path)
+        row = self.connection.execute('SELECT digest FROM paths WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                      (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.connection.execute('INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?)',
+                                (path, stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    def lookup(self, image_file):
+        """
+        The cached Annotation of the image, None on a miss.
+        """
+        digest = self.digest(image_file)
+        row = self.connection.execute('SELECT image_width, image_height, descriptions, vertices '
+                                      'FROM annotations WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute('UPDATE annotations SET last_access = ? WHERE digest = ?', (time.time(), digest))
+
+        width, height, descriptions, vertices = row
+        descriptions = json.loads(zlib.decompress(descriptions).decode('utf-8'))
+        vertices = np.frombuffer(zlib.decompress(vertices), dtype=np.int32).reshape(-1, 4, 2)
+        return Annotation(descriptions, vertices, (width, height))
+
+    def put(self, image_file, annotation):
+        """
+        Store the Annotation of the image.
+        """
+        descriptions = zlib.compress(json.dumps(annotation.descriptions).encode('utf-8'))
+        vertices = zlib.compress(np.ascontiguousarray(annotation.vertices, dtype=np.int32).tobytes())
+        width, height = annotation.image_size
+
+        self.connection.execute('INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (self.digest(image_file), width, height, descriptions, vertices,
+                                 len(descriptions) + len(vertices), time.time()))
+        self._evict()
+
+    def get(self, list_of_paths):
+        """
+        The annotations of the images, the misses are annotated with the engine in one batched pass.
+        :param list_of_paths: list, the image file paths
+        :return: a generator of (image_file, Annotation) in the order of list_of_paths, the Annotation being None
+            when google vision failed on the image (nothing is cached, so it is annotated again by the next call)
+        """
+        annotations = [self.lookup(image_file) for image_file in list_of_paths]
+        missing = [image_file for image_file, annotation in zip(list_of_paths, annotations) if annotation is None]
+
+        fetched = iter(())
+        if missing:
+            if self.engine is None:
+                self.engine = OCRIngestionEngine()
+            fetched = self.engine.annotate(missing)
+
+        for image_file, annotation in zip(list_of_paths, annotations):
+            if annotation is None:
+                _, text = next(fetched)
+                if text is None:
+                    self.failures += 1
+                    yield image_file, None
+                    continue
+                with Image.open(image_file) as image: #only the header is read
+                    annotation = to_annotation(text, image.size)
+                self.put(image_file, annotation)
+                self.connection.commit()
+            yield image_file, annotation
+
+        self.connection.commit() #persist the last access times of the hits
+
+    def warm(self, list_of_paths):
+        """
+        Annotate every image that is not cached yet.
+        """
+        for _ in self.get(list_of_paths):
+            pass
+
+    def export(self, output_dir):
+        """
+        Write every cached annotation whose path is known as a json file in output_dir,
+        in the same format as data_manipulation.get_json_files.
+        :return: the number of written files
+        """
+        rows = self.connection.execute('SELECT paths.path, annotations.descriptions, annotations.vertices '
+                                       'FROM paths JOIN annotations ON paths.digest = annotations.digest').fetchall()
+        for path, descriptions, vertices in rows:
+            descriptions = json.loads(zlib.decompress(descriptions).decode('utf-8'))
+            vertices = np.frombuffer(zlib.decompress(vertices), dtype=np.int32).reshape(-1, 8)
+
+            dico = {f'obj{i}': [{'description': description, 'labels': vertices[i].tolist()}]
+                    for i, description in enumerate(descriptions)}
+            filename = os.path.basename(path).split('.')[0].replace('-', '_') # get the name '1107_receipt'
+            with open(os.path.join(output_dir, f'{filename}.json'), 'w') as fp:
+                json.dump(dico, fp)
+
+        return len(rows)
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+
+        total = self.connection.execute('SELECT COALESCE(SUM(nbytes), 0) FROM annotations').fetchone()[0]
+        while total > self.max_bytes:
+            digest, nbytes = self.connection.execute('SELECT digest, nbytes FROM annotations '
+                                                     'ORDER BY last_access LIMIT 1').fetchone()
+            self.connection.execute('DELETE FROM annotations WHERE digest = ?', (digest,))
+            total -= nbytes
+
+    def stats(self):
+        entries, nbytes = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(nbytes), 0) '
+                                                  'FROM annotations').fetchone()
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'hit_rate': self.hits / lookups if lookups else 0.,
+                'entries': entries,
+                'bytes': nbytes}
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Warm or export the google vision annotation cache.')
+    parser.add_argument('command', choices=['warm', 'export', 'stats'])
+    parser.add_argument('--cache', required=True, help='the path of the sqlite cache file')
+    parser.add_argument('--max-bytes', type=int, default=None, help='the size limit of the cache')
+    parser.add_argument('--output', default=None, help='the output directory of export')
+    parser.add_argument('images', nargs='*', help='the images to annotate with warm')
+    args = parser.parse_args()
+
+    cache = OCRCache(args.cache, max_bytes=args.max_bytes)
+    if args.command == 'warm':
+        cache.warm(args.images)
+    elif args.command == 'export':
+        if args.output is None:
+            raise ValueError('export needs an --output directory.')
+        print('Exported {num} annotations.'.format(num=cache.export(args.output)))
+    print(cache.stats())
+    cache.close()
@@ -7,13 +7,25 @@ The implementation of some utils.
 
 """
 from keras_preprocessing import image as keras_image
+from data.processing.images import reduction_factor, target_dimensions
 from PIL import Image
 import numpy as np
 import cv2
 
 
-def load_image(name):
+def load_image(name, target_size=None):
+    """
+    Load an image (or a label) as an array.
+
+    :param name: the path of the image.
+    :param target_size: the (width, height) the image will be resized to, a jpeg is then decoded
+        at the smallest power of two scale still larger than it. None to decode the full image.
+    :return: the array.
+    """
     img = Image.open(name)
+    if target_size is not None and img.format in ['JPEG', 'MPO']:
+        if reduction_factor(img.size, target_size) > 1:
+            img.draft(img.mode, target_dimensions(img.size, target_size))
     return np.array(img)
 
 